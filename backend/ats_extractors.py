@@ -0,0 +1,356 @@
+"""
+Rule-based extractors for emails sent by known applicant tracking systems.
+Each extractor is keyed by the sender domains of its ATS. The domains are taken
+from the From, Sender, Reply-To, Return-Path and Message-ID headers, so mail that
+an ATS sends under the employer's own address is still recognised. Only
+application confirmations are extracted here: a match produces application
+details without an LLM call, while rejections, interview invitations and
+anything else the rules cannot parse fall through to the LLM (and from there
+to the company matcher) as before.
+"""
+import re
+import threading
+from collections import Counter
+from datetime import datetime
+from email.utils import getaddresses, parseaddr, parsedate_to_datetime
+from typing import Dict, List, Optional, Pattern, Sequence
+
+from html_text import html_to_text
+
+# Headers whose domains identify the sending system
+FINGERPRINT_HEADERS = ("From", "Sender", "Reply-To", "Return-Path", "Message-ID")
+
+_REJECTION_RE = re.compile(
+    r"\b(?:unfortunately|not (?:to )?(?:move|moving) forward|no longer (?:under )?consider"
+    r"|decided to (?:pursue|proceed with|move forward with) other candidates"
+    r"|position has (?:been|now been) filled|will not be (?:moving|proceeding) forward)",
+    re.IGNORECASE,
+)
+_INTERVIEW_RE = re.compile(
+    r"\b(?:invite you (?:to|for) an? (?:\w+ )?interview|schedule an? (?:\w+ )?interview"
+    r"|interview invitation|invitation to interview)",
+    re.IGNORECASE,
+)
+
+# Phrasing shared by most ATS confirmation emails; provider patterns are tried first
+COMMON_SUBJECT_PATTERNS = [
+    r"your application (?:for|to) (?:the )?(?P<position>[^!|\n]+?) (?:position |role )?(?:at|with) (?P<company>[^!|\n]+)",
+    r"(?:thank you|thanks) for (?:applying|your application|your interest) (?:to|at|with|in) (?P<company>[^!|:\n]+)",
+]
+COMMON_BODY_PATTERNS = [
+    r"(?:applying|application|interest) (?:for|in) (?:the |our )?(?P<position>[^\n.!]{3,80}?)"
+    r" (?:position |role |opening |job )?(?:at|with) (?P<company>[^\n.!,]{2,80})",
+    r"(?:applying|application|interest) (?:to|in|with) (?P<company>[^\n.!,]{2,80}?)(?=[.!,\n]| and | for )",
+    r"(?:position|role) of (?P<position>[^\n.!]{3,80})",
+]
+
+# Display names that belong to the ATS rather than the employer
+_SENDER_NOISE_RE = re.compile(
+    r"\s*(?:[-@|]\s*.*|via .*|hiring team|recruiting(?: team)?|talent acquisition(?: team)?"
+    r"|careers?|jobs|recruitment|human resources|hr)\s*$",
+    re.IGNORECASE,
+)
+# Mail and calendar services whose domain says nothing about the employer
+GENERIC_DOMAINS = {
+    "gmail.com", "googlemail.com", "google.com", "outlook.com", "hotmail.com", "live.com",
+    "office365.com", "microsoft.com", "yahoo.com", "icloud.com", "me.com", "aol.com", "proton.me",
+    "protonmail.com", "calendly.com", "zoom.us", "goodtime.io", "modernloop.io", "gem.com",
+    "ashbyhq.com",
+}
+PROVIDER_NAMES = {
+    "greenhouse", "lever", "workday", "indeed", "indeed apply", "icims", "smartrecruiters",
+    "linkedin", "no-reply", "noreply", "do not reply", "notifications",
+}
+
+
+def detect_status(subject: str, text: str) -> str:
+    """'rejected', 'interview' or 'pending', from the usual ATS phrasing"""
+    if _REJECTION_RE.search(text):
+        return "rejected"
+    if _INTERVIEW_RE.search(text) or _INTERVIEW_RE.search(subject):
+        return "interview"
+    return "pending"
+
+
+def _compile(patterns: Sequence[str]) -> List[Pattern]:
+    return [re.compile(pattern, re.IGNORECASE) for pattern in patterns]
+
+
+_COMMON_SUBJECT_RES = _compile(COMMON_SUBJECT_PATTERNS)
+_COMMON_BODY_RES = _compile(COMMON_BODY_PATTERNS)
+
+
+def _clean(value: Optional[str]) -> Optional[str]:
+    """Trim a captured name; None if it does not look like a proper name"""
+    if not value:
+        return None
+    value = re.sub(r"\s+", " ", value).strip(" \t-:;,.!\"'")
+    if len(value) < 2 or len(value) > 80 or not (value[0].isupper() or value[0].isdigit()):
+        return None
+    return value
+
+
+def match_fields(subject_res: Sequence[Pattern], body_res: Sequence[Pattern], subject: str, text: str) -> Dict[str, str]:
+    """First "company" / "position" captured by the subject patterns, then the body patterns"""
+    found: Dict[str, str] = {}
+    for patterns, value in ((subject_res, subject), (body_res, text)):
+        for pattern in patterns:
+            match = pattern.search(value)
+            if not match:
+                continue
+            for field, captured in match.groupdict().items():
+                captured = _clean(captured)
+                if captured and field not in found:
+                    found[field] = captured
+            if "company" in found and "position" in found:
+                return found
+    return found
+
+
+def common_fields(subject: str, text: str) -> Dict[str, str]:
+    """match_fields with only the phrasing shared by most confirmation emails"""
+    return match_fields(_COMMON_SUBJECT_RES, _COMMON_BODY_RES, subject, text)
+
+
+def sender_domains(msg) -> List[str]:
+    """Lower-cased domains found in the fingerprint headers of a message"""
+    domains = []
+    for header in FINGERPRINT_HEADERS:
+        for value in msg.get_all(header, []):
+            for _, address in getaddresses([str(value)]):
+                domain = address.rpartition("@")[2].strip("<> ").lower()
+                if domain and domain not in domains:
+                    domains.append(domain)
+    return domains
+
+
+class AtsExtractor:
+    """Extracts company, position and status from one ATS's emails with precompiled patterns"""
+
+    def __init__(self, name: str, label: str, domains: Sequence[str],
+                 subject_patterns: Sequence[str] = (), body_patterns: Sequence[str] = ()):
+        self.name = name
+        self.label = label
+        self.domains = tuple(domains)
+        self._subject_res = _compile(subject_patterns) + _COMMON_SUBJECT_RES
+        self._body_res = _compile(body_patterns) + _COMMON_BODY_RES
+
+    def extract(self, email_content: Dict[str, str], msg, text: str) -> Optional[Dict]:
+        found = match_fields(self._subject_res, self._body_res, email_content.get("subject", ""), text)
+        # Without confirmation phrasing this is a status update, a notice or marketing
+        if not found or detect_status(email_content.get("subject", ""), text) != "pending":
+            return None
+        company = found.get("company") or self._company_from_sender(msg)
+        if not company:
+            return None
+
+        return {
+            "company_name": company,
+            "position": found.get("position"),
+            "status": "pending",
+            "source": f"{self.name}_email",
+            "notes": f"Extracted from {self.label} email",
+        }
+
+    @staticmethod
+    def _company_from_sender(msg) -> Optional[str]:
+        display_name = parseaddr(msg.get("From", ""))[0]
+        company = _clean(_SENDER_NOISE_RE.sub("", display_name))
+        if not company or company.lower() in PROVIDER_NAMES:
+            return None
+        return company
+
+
+_LINKEDIN_SENT_RE = re.compile(r"your application was sent to\s+(?P<company>[^\n]+)", re.IGNORECASE)
+# "Acme · New York, NY (Hybrid)" under the job title
+_LINKEDIN_LOCATION_RE = re.compile(
+    r"^(?P<company>[^\n·]+?)\s*·\s*(?P<location>[^(\n]+?)\s*\((?P<work_type>[^)\n]+)\)", re.MULTILINE
+)
+_LINKEDIN_APPLIED_RE = re.compile(
+    r"applied on\s+(?P<date>[A-Za-z]+\s+\d{1,2},\s+\d{4}|\d{1,2}[/-]\d{1,2}[/-]\d{4})", re.IGNORECASE
+)
+_LINKEDIN_DATE_FORMATS = ("%B %d, %Y", "%b %d, %Y", "%m/%d/%Y", "%m-%d-%Y")
+# Lines after the confirmation that are not the job title
+_LINKEDIN_NOT_TITLE = ("applied on", "now, take", "view similar")
+
+
+class LinkedInExtractor:
+    """LinkedIn "Your application was sent to ..." confirmations"""
+    name = "linkedin"
+    label = "LinkedIn"
+    domains = ("linkedin.com",)
+
+    def extract(self, email_content: Dict[str, str], msg, text: str) -> Optional[Dict]:
+        sent = _LINKEDIN_SENT_RE.search(text)
+        if not sent:
+            return None
+        company_name = sent.group("company").strip()
+        subject = email_content.get("subject", "")
+
+        # The card after the confirmation: company, job title, "company · location (work type)"
+        card = text[sent.end():]
+        location_match = next(
+            (m for m in _LINKEDIN_LOCATION_RE.finditer(card) if m.group("company").strip().lower() == company_name.lower()),
+            None,
+        )
+        lines = card[:location_match.start()].split("\n") if location_match else card.split("\n")[:10]
+        position = next((line for line in (line.strip() for line in lines) if self._is_title(line, company_name)), None)
+
+        location = None
+        if location_match:
+            location = f"{location_match.group('location').strip()} ({location_match.group('work_type').strip()})"
+
+        is_easy_apply = "easy apply" in text.lower() or "easyapply" in text.lower()
+        if is_easy_apply:
+            applied_date = datetime.now().replace(second=0, microsecond=0)
+        else:
+            applied_date = self._applied_date(text, msg)
+
+        if not position:
+            # Sometimes the position is in the subject
+            parts = subject.split(" - ")
+            if "application" in subject.lower() and company_name.lower() in subject.lower() and len(parts) > 1:
+                position = parts[-1].strip()
+            else:
+                position = "Not Specified"
+
+        notes = "Application confirmation from LinkedIn"
+        if is_easy_apply:
+            notes += " (Easy Apply)"
+
+        return {
+            "company_name": company_name,
+            "position": position,
+            "location": location,
+            "applied_date": applied_date,
+            "status": "pending",
+            "source": "linkedin_email",
+            "notes": notes,
+        }
+
+    @staticmethod
+    def _is_title(line: str, company_name: str) -> bool:
+        lowered = line.lower()
+        return (len(line) > 3 and lowered != company_name.lower() and "·" not in line and "(" not in line
+                and not any(phrase in lowered for phrase in _LINKEDIN_NOT_TITLE))
+
+    @staticmethod
+    def _applied_date(text: str, msg) -> datetime:
+        """The "Applied on" date of the email, else the email's date, else today (at midnight)"""
+        applied = _LINKEDIN_APPLIED_RE.search(text)
+        if applied:
+            for date_format in _LINKEDIN_DATE_FORMATS:
+                try:
+                    return datetime.strptime(applied.group("date"), date_format)
+                except ValueError:
+                    continue
+        try:
+            email_date = parsedate_to_datetime(msg.get("Date"))
+            if email_date.tzinfo:
+                email_date = email_date.replace(tzinfo=None)
+            return email_date.replace(hour=0, minute=0, second=0, microsecond=0)
+        except (TypeError, ValueError):
+            return datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class ExtractorRegistry:
+    def __init__(self):
+        self._by_domain: Dict[str, object] = {}
+        self._lock = threading.Lock()
+        self._attempts: Counter = Counter()
+        self._hits: Counter = Counter()
+        self.checked = 0
+
+    def register(self, extractor) -> None:
+        for domain in extractor.domains:
+            self._by_domain[domain.lower()] = extractor
+
+    def find(self, msg):
+        """The extractor for the first fingerprint domain (or a parent domain) with one registered"""
+        for domain in sender_domains(msg):
+            extractor = self.find_domain(domain)
+            if extractor is not None:
+                return extractor
+        return None
+
+    def find_domain(self, domain: str):
+        """The extractor registered for `domain` or one of its parent domains"""
+        parts = domain.lower().split(".")
+        for i in range(len(parts) - 1):
+            extractor = self._by_domain.get(".".join(parts[i:]))
+            if extractor is not None:
+                return extractor
+        return None
+
+    def extract(self, email_content: Dict[str, str], msg) -> Optional[Dict]:
+        """Extract with the matching ATS extractor; None means the email needs the LLM"""
+        extractor = self.find(msg)
+        result = None
+        if extractor is not None:
+            try:
+                result = extractor.extract(email_content, msg, html_to_text(email_content.get("body", "")))
+            except Exception as e:
+                print(f"Error in {extractor.name} extractor: {e}")
+
+        with self._lock:
+            self.checked += 1
+            if extractor is not None:
+                self._attempts[extractor.name] += 1
+                if result:
+                    self._hits[extractor.name] += 1
+        return result
+
+    def is_service_domain(self, domain: str) -> bool:
+        """Whether mail from `domain` is sent by a mail, calendar or ATS service rather than an employer"""
+        domain = domain.lower()
+        if any(domain == generic or domain.endswith("." + generic) for generic in GENERIC_DOMAINS):
+            return True
+        return self.find_domain(domain) is not None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            extractors = {
+                name: {
+                    "attempts": attempts,
+                    "hits": self._hits[name],
+                    "hit_rate": round(self._hits[name] / attempts, 3),
+                }
+                for name, attempts in self._attempts.items()
+            }
+            hits = sum(self._hits.values())
+            return {
+                "checked": self.checked,
+                "llm_calls_avoided": hits,
+                "rule_hit_rate": round(hits / self.checked, 3) if self.checked else 0.0,
+                "extractors": extractors,
+            }
+
+
+extractor_registry = ExtractorRegistry()
+extractor_registry.register(LinkedInExtractor())
+extractor_registry.register(AtsExtractor(
+    "greenhouse", "Greenhouse", ["greenhouse.io", "greenhouse-mail.io"],
+    body_patterns=[r"(?:applying|application) (?:to|for) (?:the )?(?P<position>[^\n.!]{3,80}?) (?:role |position )?at (?P<company>[^\n.!,]{2,80})"],
+))
+extractor_registry.register(AtsExtractor(
+    "lever", "Lever", ["lever.co"],
+    body_patterns=[r"(?:applying|application) (?:to|for) (?P<company>[^\n.!,]{2,80}?) for (?:the )?(?P<position>[^\n.!]{3,80}?)(?: role| position)?[.!\n]"],
+))
+extractor_registry.register(AtsExtractor(
+    "workday", "Workday", ["myworkday.com", "workday.com"],
+    subject_patterns=[r"(?P<company>[^|\n]{2,80}?)\s*[-|:]\s*(?:application received|thank you for applying)"],
+    body_patterns=[r"applying (?:for|to) (?:the )?(?P<position>[^\n.!]{3,80}?)(?: position| role)?(?: \(\w*\d+\w*\))?(?: at| with| here)"],
+))
+extractor_registry.register(AtsExtractor(
+    "indeed", "Indeed", ["indeed.com", "indeedemail.com"],
+    subject_patterns=[r"indeed application:\s*(?P<position>[^|\n]+)"],
+    body_patterns=[r"(?:items were sent to|application (?:was|has been) (?:sent|submitted) to) (?P<company>[^\n.!,]{2,80})"],
+))
+extractor_registry.register(AtsExtractor(
+    "icims", "iCIMS", ["icims.com"],
+    body_patterns=[r"(?:position|requisition)(?: title)?:\s*(?P<position>[^\n]{3,80})"],
+))
+extractor_registry.register(AtsExtractor(
+    "smartrecruiters", "SmartRecruiters", ["smartrecruiters.com", "smartrecruiters.net"],
+    subject_patterns=[r"your application for (?P<position>[^|\n]+?) at (?P<company>[^|\n]+)"],
+))
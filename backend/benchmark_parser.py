@@ -0,0 +1,88 @@
+"""
+Benchmark of email parsing over a message corpus.
+
+    python benchmark_parser.py path/to/mail.mbox
+    python benchmark_parser.py path/to/eml-folder --repeat 3
+
+Compares the previous approach (message_from_bytes with the compat32 policy,
+walking every part and decoding both the HTML and the plain-text body) with
+mime_parser's full-message and headers-only modes.
+"""
+import argparse
+import email
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import mime_parser
+from import_mail import iter_messages
+
+
+def legacy_parse(raw: bytes) -> Dict[str, str]:
+    """What parse_email_content used to do"""
+    msg = email.message_from_bytes(raw)
+    subject = mime_parser.header(msg, "Subject")
+    html_body = ""
+    text_body = ""
+    for part in msg.walk():
+        if "attachment" in str(part.get("Content-Disposition")):
+            continue
+        content_type = part.get_content_type()
+        if content_type in ("text/html", "text/plain"):
+            try:
+                payload = part.get_payload(decode=True).decode()
+            except Exception:
+                continue
+            if content_type == "text/html":
+                html_body = payload
+            else:
+                text_body = payload
+    return {"subject": subject, "body": html_body or text_body}
+
+
+def fast_parse(raw: bytes) -> Dict[str, str]:
+    return mime_parser.message_content(mime_parser.parse_message(raw))
+
+
+def headers_only(raw: bytes) -> str:
+    msg = mime_parser.parse_headers(raw)
+    return mime_parser.header(msg, "Subject") + mime_parser.header(msg, "From")
+
+
+def _time(func: Callable, messages: List[bytes], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for raw in messages:
+            func(raw)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare email parsing strategies over a corpus")
+    parser.add_argument("path", type=Path, help="mbox file or directory containing .eml files")
+    parser.add_argument("--limit", type=int, default=5000, help="messages to load from the corpus")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per strategy (the best is reported)")
+    args = parser.parse_args()
+
+    messages = []
+    for raw in iter_messages(args.path):
+        messages.append(raw)
+        if len(messages) >= args.limit:
+            break
+    if not messages:
+        parser.error("no messages found")
+    total_mb = sum(len(raw) for raw in messages) / 1_000_000
+    print(f"{len(messages)} messages, {total_mb:.1f} MB\n")
+
+    baseline = _time(legacy_parse, messages, args.repeat)
+    for name, func in (("legacy (walk all parts)", legacy_parse),
+                       ("mime_parser full", fast_parse),
+                       ("mime_parser headers-only", headers_only)):
+        elapsed = baseline if func is legacy_parse else _time(func, messages, args.repeat)
+        print(f"{name:28} {elapsed:8.3f}s  {len(messages) / elapsed:9.0f} msg/s  {baseline / elapsed:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
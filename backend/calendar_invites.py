@@ -0,0 +1,107 @@
+"""
+Interview detection from calendar invitations.
+Interview scheduling mail nearly always carries an iCalendar part. Its start
+time is exact, so an invitation whose title or description names an interview
+(or that replies in the thread of a known application) sets status "interview"
+and interview_date directly instead of asking the LLM to guess them from the
+text. Other invitations, such as webinars and info sessions, go through the
+usual extractors. The company comes from the ATS extractors when they
+recognise the sender, otherwise from the organizer's or sender's domain or the
+event title. Only invitations where none of these work still go to the LLM,
+and they keep the exact date.
+"""
+import re
+from email.utils import parseaddr
+from typing import Dict, Optional
+
+from ats_extractors import extractor_registry
+import ics_parser
+
+# Second-level labels of country domains such as co.uk or com.au
+_SECOND_LEVEL = {"co", "com", "org", "net", "ac", "gov", "edu"}
+
+_SUMMARY_RES = [
+    # "Interview with Acme for Backend Engineer", "Onsite interview at Acme"
+    re.compile(r"interview (?:with|at) (?P<company>[^|:()\[\]]+?)(?: for (?P<position>[^|()\[\]]+))?\s*$", re.IGNORECASE),
+    # "Acme - Phone Interview", "Acme | Backend Engineer interview"
+    re.compile(r"^(?P<company>[^|:()\[\]\-–]+?)\s*[|:\-–]\s*(?:[^|:]*\s)?interview\b", re.IGNORECASE),
+]
+
+
+# Words in an invitation's title or description that make it an interview rather than e.g. a webinar
+_INTERVIEW_RE = re.compile(
+    r"\binterview|\bphone screen|\bscreening call|\bon-?site\b|\btechnical (?:call|screen|round)"
+    r"|\bhiring manager\b|\bfinal round\b|\brecruiter call\b",
+    re.IGNORECASE,
+)
+
+
+def invite_event(email_content: Dict[str, str]) -> Optional[Dict]:
+    """The scheduled event of an email's calendar part, or None (no invitation, or a cancellation/reply)"""
+    calendar = email_content.get("calendar")
+    if not calendar:
+        return None
+    event = ics_parser.parse_event(calendar)
+    return event if ics_parser.is_scheduled(event) else None
+
+
+def interview_event(email_content: Dict[str, str]) -> Optional[Dict]:
+    """invite_event, but only for invitations whose title or description names an interview"""
+    event = invite_event(email_content)
+    if event is None:
+        return None
+    text = " ".join(filter(None, (event.get("summary"), event.get("description"))))
+    return event if _INTERVIEW_RE.search(text) else None
+
+
+def interview_fields(event: Dict) -> Dict:
+    """Application fields an invitation sets"""
+    details = [event.get("summary"), event.get("location")]
+    start = event["start"]
+    return {
+        "status": "interview",
+        "interview_date": start,
+        "notes": f"Interview on {start:%Y-%m-%d %H:%M}" + "".join(f" - {d}" for d in details if d),
+    }
+
+
+def _company_from_domain(address: Optional[str]) -> Optional[str]:
+    domain = (address or "").rpartition("@")[2].strip("<> ").lower()
+    if not domain or "." not in domain:
+        return None
+    if extractor_registry.is_service_domain(domain):
+        # Sent through a mail, calendar or ATS service, not by the employer
+        return None
+    labels = domain.split(".")
+    if len(labels) >= 3 and labels[-2] in _SECOND_LEVEL:
+        labels = labels[:-1]
+    return labels[-2].replace("-", " ").title()
+
+
+def company_from_invite(event: Dict, msg) -> Optional[Dict]:
+    """{"company_name", "position"} from an invitation's title, organizer or sender, or None"""
+    summary_company = position = None
+    summary = (event.get("summary") or "").strip()
+    for pattern in _SUMMARY_RES:
+        match = pattern.search(summary)
+        if match and match.group("company").strip():
+            summary_company = match.group("company").strip()
+            position = (match.groupdict().get("position") or "").strip() or None
+            break
+
+    # The employer's own domain is the most reliable; ATS and calendar services are skipped
+    for address in (event.get("organizer_email"), parseaddr(msg.get("From", ""))[1]):
+        company = _company_from_domain(address)
+        if company:
+            return {"company_name": company, "position": position}
+    if summary_company:
+        return {"company_name": summary_company, "position": position}
+    return None
+
+
+def extract_from_invite(email_content: Dict[str, str], msg, event: Dict) -> Optional[Dict]:
+    """Application data from an invitation alone; None if the company cannot be told"""
+    found = company_from_invite(event, msg)
+    if not found:
+        return None
+    return {**found, **interview_fields(event), "source": "calendar_invite"}
@@ -0,0 +1,182 @@
+"""
+Matching of rejection emails to the application they refer to.
+
+Company names are reduced to a normalized key (case, accents, punctuation and
+legal suffixes such as "Inc." or "GmbH" removed) that is stored in
+Application.company_key and indexed. The trigrams of every key are kept in
+company_trigrams, so a shortened or misspelled name still finds its candidates
+through an index lookup instead of a LIKE scan over all applications.
+Candidates are scored on company, position and how close the application date
+is to the email's, and the best one above MIN_SCORE wins.
+"""
+import math
+import re
+import unicodedata
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import event, func, insert, inspect
+from sqlalchemy.orm import Session
+
+from models import Application, CompanyTrigram
+
+# Trailing words that only name the legal form of a company
+LEGAL_SUFFIXES = {
+    "inc", "incorporated", "llc", "llp", "lp", "ltd", "limited", "corp", "corporation",
+    "co", "company", "plc", "gmbh", "ag", "sa", "sas", "srl", "spa", "bv", "nv", "pty",
+    "pvt", "private", "oy", "ab", "kg",
+}
+
+# Company similarity a candidate needs before it is considered at all
+MIN_COMPANY_SIMILARITY = 0.45
+# Overall score the best candidate needs to be returned as the match
+MIN_SCORE = 0.5
+# Companies fetched from the trigram index when there is no exact key match
+MAX_CANDIDATE_KEYS = 20
+
+_NON_WORD_RE = re.compile(r"[^a-z0-9]+")
+
+
+def _words(value: str) -> List[str]:
+    value = unicodedata.normalize("NFKD", value or "").encode("ascii", "ignore").decode().lower().replace(".", "")
+    return _NON_WORD_RE.sub(" ", value.replace("&", " and ")).split()
+
+
+def normalize_company(name: Optional[str]) -> str:
+    """'The Acme Co., Inc.' -> 'acme'; names made only of suffixes are kept as they are"""
+    words = _words(name)
+    if len(words) > 1 and words[0] == "the":
+        words = words[1:]
+    while len(words) > 1 and words[-1] in LEGAL_SUFFIXES:
+        words.pop()
+    return " ".join(words)
+
+
+def trigrams(key: str) -> Set[str]:
+    """Character trigrams of every word, padded with a space so word starts and ends count"""
+    grams = set()
+    for word in key.split():
+        padded = f" {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def company_similarity(a: str, b: str) -> float:
+    """Trigram Jaccard similarity of two keys; one name being a prefix of the other's words counts as close"""
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+    a_words, b_words = a.split(), b.split()
+    shorter, longer = sorted((a_words, b_words), key=len)
+    if longer[:len(shorter)] == shorter:
+        # "acme" vs "acme robotics"
+        return 0.9
+    a_grams, b_grams = trigrams(a), trigrams(b)
+    return len(a_grams & b_grams) / len(a_grams | b_grams)
+
+
+def position_similarity(a: Optional[str], b: Optional[str]) -> float:
+    """Word overlap of two job titles; 0.5 when either is unknown"""
+    a_words, b_words = set(_words(a)), set(_words(b))
+    if not a_words or not b_words:
+        return 0.5
+    if a_words <= b_words or b_words <= a_words:
+        return 1.0
+    return len(a_words & b_words) / len(a_words | b_words)
+
+
+def date_proximity(applied_date: Optional[datetime], email_date: Optional[datetime]) -> float:
+    """1.0 for a rejection the day of the application, decaying over the following months"""
+    if applied_date is None or email_date is None:
+        return 0.5
+    days = (email_date - applied_date).total_seconds() / 86400
+    if days < -1:
+        # An application made after the email can't be the one it rejects
+        return 0.0
+    return math.exp(-max(days, 0) / 60)
+
+
+def score(application: Application, company_score: float, position: Optional[str],
+          email_date: Optional[datetime]) -> float:
+    total = (
+        0.6 * company_score
+        + 0.25 * position_similarity(position, application.position)
+        + 0.15 * date_proximity(application.applied_date, email_date)
+    )
+    if application.status == "rejected":
+        # Usually a second copy of a rejection that was already applied
+        total *= 0.8
+    return total
+
+
+def similar_keys(db: Session, key: str) -> Dict[str, float]:
+    """Known company keys that share trigrams with `key`, with their similarity"""
+    grams = trigrams(key)
+    if not grams:
+        return {}
+    shared = func.count(CompanyTrigram.trigram)
+    rows = (
+        db.query(CompanyTrigram.company_key)
+        .filter(CompanyTrigram.trigram.in_(grams))
+        .group_by(CompanyTrigram.company_key)
+        .order_by(shared.desc())
+        .limit(MAX_CANDIDATE_KEYS)
+    )
+    candidates = {}
+    for (candidate,) in rows:
+        similarity = company_similarity(key, candidate)
+        if similarity >= MIN_COMPANY_SIMILARITY:
+            candidates[candidate] = similarity
+    return candidates
+
+
+def find_match(db: Session, company_name: Optional[str], position: Optional[str] = None,
+               email_date: Optional[datetime] = None) -> Optional[Application]:
+    """The application an email about `company_name` / `position` most likely refers to"""
+    key = normalize_company(company_name)
+    if not key:
+        return None
+
+    # Exact key first (one indexed lookup); the trigram index only when that finds nothing
+    candidates = {key: 1.0}
+    applications = db.query(Application).filter(Application.company_key == key).all()
+    if not applications:
+        candidates = similar_keys(db, key)
+        if not candidates:
+            return None
+        applications = db.query(Application).filter(Application.company_key.in_(list(candidates))).all()
+
+    best, best_score = None, MIN_SCORE
+    for application in applications:
+        application_score = score(application, candidates[application.company_key], position, email_date)
+        if application_score > best_score or (best is None and application_score == best_score):
+            best, best_score = application, application_score
+    return best
+
+
+def index_keys(connection, keys: Iterable[str]) -> None:
+    """Add the trigrams of company keys to company_trigrams (keys already indexed are ignored)"""
+    rows = [{"trigram": gram, "company_key": key} for key in set(keys) if key for gram in trigrams(key)]
+    if rows:
+        connection.execute(insert(CompanyTrigram).prefix_with("OR IGNORE"), rows)
+
+
+# company_key follows company_name on every insert and update, whichever code path writes it
+
+@event.listens_for(Application, "before_insert")
+@event.listens_for(Application, "before_update")
+def _set_company_key(mapper, connection, target):
+    if target.company_key is None or inspect(target).attrs.company_name.history.has_changes():
+        target.company_key = normalize_company(target.company_name)
+
+
+@event.listens_for(Application, "after_insert")
+def _index_new_company_key(mapper, connection, target):
+    index_keys(connection, [target.company_key])
+
+
+@event.listens_for(Application, "after_update")
+def _index_changed_company_key(mapper, connection, target):
+    if inspect(target).attrs.company_key.history.has_changes():
+        index_keys(connection, [target.company_key])
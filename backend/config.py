@@ -9,10 +9,43 @@ class Settings(BaseSettings):
     email_app_password: Optional[str] = None  # For Gmail app password
     imap_server: Optional[str] = None
     imap_port: int = 993
+    imap_pool_size: int = 2  # Max concurrent IMAP sessions kept logged in
+    imap_keepalive_interval: int = 240  # Seconds between NOOPs on idle sessions
+    imap_max_idle: int = 3600  # Log out sessions unused for this long
+    imap_fetch_chunk_size: int = 25  # Messages requested per FETCH round trip
+    email_sync_folders: str = "INBOX"  # Comma-separated folders of this account that sync reads
+    email_extra_accounts: str = ""  # JSON list of further accounts to sync (see README)
+    email_job_keywords: str = ""  # Comma-separated; replaces the built-in job keyword list
+    email_two_phase_fetch: bool = True  # Filter on headers before downloading text parts
+    email_max_message_size: int = 1_000_000  # Max body bytes downloaded per message
+    email_listener_enabled: bool = False  # Watch mailboxes in the background and sync new mail as it arrives
+    email_idle_timeout: int = 600  # Seconds before IMAP IDLE is renewed (servers end it after ~30 minutes)
+    email_poll_interval: int = 30  # Seconds between checks on servers without IDLE
+    email_poll_max_interval: int = 600  # Polling backs off up to this while no mail arrives
+    message_cache_enabled: bool = True  # Keep downloaded emails locally so they are fetched once
+    message_cache_path: str = "./message_cache.db"
+    message_cache_max_bytes: int = 200_000_000  # Least recently used emails are evicted above this
+    llm_cache_enabled: bool = True  # Reuse LLM answers for identical prompts (emails, images, resumes)
+    llm_cache_path: str = "./llm_cache.db"
+    llm_cache_max_bytes: int = 50_000_000  # Least recently used answers are evicted above this
+    llm_cache_ttl: int = 30 * 24 * 3600  # Seconds an answer is reused; 0 keeps answers until evicted
     
     # Ollama settings
     ollama_base_url: str = "http://localhost:11434"
     ollama_model: str = "gemma3:4b"  # or mistral, codellama, etc.
+    ollama_timeout: float = 300  # Seconds an LLM call may take
+    ollama_connect_timeout: float = 5  # Seconds to connect to the Ollama host
+    ollama_max_connections: int = 8  # Connections to the Ollama host shared by all requests and workers
+    ollama_keepalive_expiry: float = 60  # Idle connections are closed after this many seconds
+    ollama_concurrency: int = 2  # LLM calls run at once per model; more wait, interactive requests first
+    ollama_concurrency_overrides: str = ""  # Per-model caps, e.g. "llava=1,llama3:70b=1"
+    email_llm_workers: int = 2  # Emails extracted in parallel; match what the Ollama host can serve
+    email_llm_batch_size: int = 4  # Short emails extracted per LLM call during syncs and imports; 1 turns batching off
+    email_llm_batch_max_chars: int = 1500  # Emails with more body text than this get an LLM call of their own
+    email_parser_workers: int = 2  # Threads parsing MIME during sync
+    email_commit_batch_size: int = 20  # Applications inserted per commit during sync
+    sender_cache_enabled: bool = True  # Take the company of known senders from learned mappings
+    sender_cache_min_confidence: float = 0.75  # Learned mappings below this are not used
     
     # Gemini settings
     gemini_api_key: Optional[str] = None
@@ -25,6 +25,38 @@ def init_db():
     """Initialize database tables"""
     # Import models to register them with Base
     from models import Application
+    import company_matcher  # Keeps Application.company_key and its trigram index up to date
     # Create all tables
     Base.metadata.create_all(bind=engine)
+    if engine.dialect.name == "sqlite":
+        connection = engine.raw_connection()
+        try:
+            marked = mark_sequence_email_ids(connection)
+        finally:
+            connection.close()
+        if marked:
+            print(f"Marked {marked} legacy sequence-number email ids.")
+
+# PRAGMA user_version from which Application.email_id holds IMAP UIDs
+UID_EMAIL_IDS_VERSION = 1
+
+def mark_sequence_email_ids(connection) -> int:
+    """
+    Prefix the IMAP sequence numbers older versions stored in email_id with 'seq:', so they
+    are not mistaken for the UIDs stored now. Runs once per database (whichever of init_db and
+    migrate_database gets there first): every plain number found before the version is set is a
+    sequence number, and none is touched afterwards. Takes a DB-API connection to the SQLite file.
+    """
+    cursor = connection.cursor()
+    cursor.execute("PRAGMA user_version")
+    if cursor.fetchone()[0] >= UID_EMAIL_IDS_VERSION:
+        return 0
+    cursor.execute(
+        "UPDATE applications SET email_id = 'seq:' || email_id"
+        " WHERE email_id IS NOT NULL AND email_id != '' AND email_id NOT GLOB '*[^0-9]*'"
+    )
+    marked = cursor.rowcount
+    cursor.execute(f"PRAGMA user_version = {UID_EMAIL_IDS_VERSION}")
+    connection.commit()
+    return marked
 
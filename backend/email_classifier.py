@@ -0,0 +1,81 @@
+"""
+Job-email classification.
+All keyword rules live here and are compiled into a single regular
+expression, so each field is scanned once instead of once per keyword.
+The rule that matched is reported back so the list can be tuned.
+
+The sync and the email list (GET /api/emails) keep their own keyword sets:
+the list also shows offers and replies ("offer", "accepted", "declined"),
+which the sync leaves to the user.
+"""
+import re
+import threading
+from collections import Counter
+from typing import Dict, List, Optional
+
+from config import settings
+
+# Keywords that mark an email as job-related for the sync (matched anywhere,
+# case-insensitively, like the plain substring checks they replace)
+DEFAULT_JOB_KEYWORDS = [
+    "application", "applied", "interview", "rejection", "job", "position",
+    "hiring", "candidate", "thank you for applying", "thank you for your application",
+    "next steps", "thank you for", "your application", "we received", "received your application",
+    "role", "opportunity", "linkedin", "application was sent", "your application was sent",
+]
+# Further keywords of the email list
+REVIEW_KEYWORDS = ["offer", "accepted", "declined"]
+
+
+class JobEmailClassifier:
+    def __init__(self, keywords: List[str]):
+        # Deduplicate and try longer phrases first so the most specific rule is reported
+        self.keywords = sorted({k.strip().lower() for k in keywords if k.strip()}, key=len, reverse=True)
+        self._pattern = re.compile(
+            "|".join(re.escape(k) for k in self.keywords),
+            re.IGNORECASE,
+        )
+        self._lock = threading.Lock()
+        self._rule_hits: Counter = Counter()
+        self.checked = 0
+        self.matched = 0
+
+    def match(self, subject: str = "", sender: str = "", text: str = "") -> Optional[Dict[str, str]]:
+        """
+        Return {"rule": keyword, "field": "subject" | "from" | "body"} for the first
+        field that matches, or None if the email does not look job-related.
+        `text` should be the visible text of the body (see html_text.html_to_text).
+        """
+        result = None
+        for field, value in (("subject", subject), ("from", sender), ("body", text)):
+            if not value:
+                continue
+            found = self._pattern.search(value)
+            if found:
+                result = {"rule": found.group(0).lower(), "field": field}
+                break
+
+        with self._lock:
+            self.checked += 1
+            if result:
+                self.matched += 1
+                self._rule_hits[f"{result['field']}:{result['rule']}"] += 1
+        return result
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "checked": self.checked,
+                "matched": self.matched,
+                "rule_hits": dict(self._rule_hits.most_common()),
+            }
+
+
+def _configured_keywords() -> List[str]:
+    if settings.email_job_keywords:
+        return settings.email_job_keywords.split(",")
+    return DEFAULT_JOB_KEYWORDS
+
+
+job_classifier = JobEmailClassifier(_configured_keywords())
+review_classifier = JobEmailClassifier(_configured_keywords() + REVIEW_KEYWORDS)
@@ -1,341 +1,129 @@
-import imaplib
-import email
-from email.header import decode_header
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from typing import Any, List, Dict, Iterable, Iterator, Optional, Sequence, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import asyncio
 import re
-import ollama
+import threading
+import httpx
 from sqlalchemy.orm import Session
 
-from models import Application
+from models import Application, SyncState
 from config import settings
+from imap_pool import imap_pool, open_imap_connection
+from imap_fetch import chunked, fetch_messages, fetch_headers, fetch_text_messages
+from message_cache import message_cache
+from llm_cache import acached_generate, cached_generate
+from llm_gateway import ollama_gateway
+from llm_scheduler import INTERACTIVE
+from sync_pipeline import SyncPipeline
+from mail_sources import configured_sources
+from email_classifier import JobEmailClassifier, job_classifier, review_classifier
+from html_text import html_to_text
+from ats_extractors import common_fields, detect_status, extractor_registry
+import calendar_invites
+import company_matcher
+import message_ledger
+import mime_parser
+import thread_index
+from sender_companies import sender_company_cache
+
+# Outcome of batched extraction (extract_many_with_llm)
+_batch_counts = {"batches": 0, "emails": 0, "fallbacks": 0}
+_batch_counts_lock = threading.Lock()
+
+def _count_batch(**counts: int) -> None:
+    with _batch_counts_lock:
+        for field, value in counts.items():
+            _batch_counts[field] += value
+
+def batch_stats() -> Dict:
+    """Counters of batched LLM extraction for /api/email-stats"""
+    with _batch_counts_lock:
+        counts = dict(_batch_counts)
+    return {
+        "batch_size": settings.email_llm_batch_size,
+        "max_chars": settings.email_llm_batch_max_chars,
+        **counts,
+        # Emails per batched call, before fallbacks
+        "emails_per_batch": round(counts["emails"] / counts["batches"], 2) if counts["batches"] else 0.0,
+        "fallback_rate": round(counts["fallbacks"] / counts["emails"], 3) if counts["emails"] else 0.0,
+    }
 
 class EmailProcessor:
-    def __init__(self):
-        self.ollama_client = ollama.Client(host=settings.ollama_base_url)
+    def __init__(self, llm_client=None, async_llm_client=None, llm_priority: int = INTERACTIVE):
+        # The application-wide clients unless others are passed in
+        self.ollama_client = llm_client or ollama_gateway.client
+        self._async_ollama_client = async_llm_client
         self.model = settings.ollama_model
+        # Scheduler priority of this processor's LLM calls (BULK for syncs and imports)
+        self.llm_priority = llm_priority
+    
+    @property
+    def async_ollama_client(self):
+        # Created on first use, so sync-only callers (sync jobs, import) never build one
+        return self._async_ollama_client or ollama_gateway.async_client
         
     def connect_email(self):
-        """Connect to email server"""
-        if settings.email_provider == "gmail":
-            imap_server = settings.imap_server or "imap.gmail.com"
-            imap_port = settings.imap_port or 993
-        elif settings.email_provider == "outlook":
-            imap_server = settings.imap_server or "outlook.office365.com"
-            imap_port = settings.imap_port or 993
-        else:
-            raise ValueError(f"Unsupported email provider: {settings.email_provider}")
-        
-        mail = imaplib.IMAP4_SSL(imap_server, imap_port)
-        
-        # Use app password for Gmail, regular password for Outlook
-        password = settings.email_app_password or settings.email_password
-        if not settings.email_address or not password:
-            raise ValueError(
-                "Email address and password must be set in .env file.\n"
-                "For Gmail: You need an App Password (not your regular password).\n"
-                "Generate one at: https://myaccount.google.com/apppasswords\n"
-                "Make sure 2FA is enabled first!"
-            )
-        
-        try:
-            # Remove spaces from app password if present
-            password = password.replace(" ", "")
-            mail.login(settings.email_address, password)
-        except imaplib.IMAP4.error as e:
-            error_msg = str(e)
-            if "AUTHENTICATIONFAILED" in error_msg or "Invalid credentials" in error_msg:
-                raise ValueError(
-                    "Email authentication failed. Please check:\n"
-                    "1. For Gmail: Use an App Password (not your regular password)\n"
-                    "2. Generate App Password at: https://myaccount.google.com/apppasswords\n"
-                    "3. Make sure 2FA is enabled on your Google account\n"
-                    "4. Remove spaces from the app password in .env file\n"
-                    "5. Restart the server after updating .env"
-                ) from e
-            raise
-        return mail
+        """Connect to email server (a fresh, unpooled session)"""
+        return open_imap_connection()
     
     def parse_email_content(self, msg) -> Dict[str, str]:
-        """Extract text content from email"""
-        body = ""
-        subject = ""
-        
-        # Decode subject
-        try:
-            subject_header = decode_header(msg.get("Subject", ""))
-            if subject_header:
-                decoded_parts = []
-                for part, encoding in subject_header:
-                    if isinstance(part, bytes):
-                        decoded_parts.append(part.decode(encoding or 'utf-8'))
-                    else:
-                        decoded_parts.append(part)
-                subject = "".join(decoded_parts)
-            else:
-                subject = msg.get("Subject", "")
-        except Exception as e:
-            subject = msg.get("Subject", "")
-            print(f"Error decoding subject: {e}")
-        
-        # Get email body
-        html_body = ""
-        text_body = ""
-        
-        if msg.is_multipart():
-            for part in msg.walk():
-                content_type = part.get_content_type()
-                content_disposition = str(part.get("Content-Disposition"))
-                
-                if "attachment" not in content_disposition:
-                    if content_type == "text/html":
-                        try:
-                            html_body = part.get_payload(decode=True).decode()
-                        except:
-                            pass
-                    elif content_type == "text/plain":
-                        try:
-                            text_body = part.get_payload(decode=True).decode()
-                        except:
-                            pass
-        else:
-            content_type = msg.get_content_type()
-            try:
-                payload = msg.get_payload(decode=True).decode()
-                if content_type == "text/html":
-                    html_body = payload
-                else:
-                    text_body = payload
-            except:
-                text_body = str(msg.get_payload())
-        
-        # Prefer HTML if available (as requested), otherwise text
-        body = html_body if html_body else text_body
-        
-        return {"subject": subject, "body": body}
+        """
+        Extract subject and text content from email. Only the preferred body part
+        (HTML if available, otherwise plain text) is decoded, with its declared charset.
+        """
+        return mime_parser.message_content(msg)
     
-    def extract_linkedin_application(self, email_content: Dict[str, str], msg) -> Optional[Dict]:
-        """Extract job application information from LinkedIn confirmation emails"""
-        try:
-            # Check if email is from LinkedIn
-            sender = msg.get("From", "").lower()
-            if "linkedin" not in sender and "noreply@linkedin.com" not in sender:
-                return None
-            
-            body = email_content.get('body', '')
-            subject = email_content.get('subject', '')
-            
-            # Check for LinkedIn application confirmation pattern
-            # Pattern: "Your application was sent to [Company Name]"
-            linkedin_pattern = re.search(
-                r'Your application was sent to\s+([^\n\r<]+)',
-                body,
-                re.IGNORECASE
-            )
-            
-            if not linkedin_pattern:
-                return None
-            
-            company_name = linkedin_pattern.group(1).strip()
-            
-            # Extract job title - in LinkedIn emails, the pattern is:
-            # "Your application was sent to [Company]"
-            # [Company] (repeated)
-            # [Job Title] <- This is what we want
-            # [Company] · [Location] ([Work Type])
-            
-            position = None
-            
-            # Method 1: Look for text between company name repetition and location line
-            # Find the location pattern first
-            location_match = re.search(
-                rf'{re.escape(company_name)}\s*·\s*([^\(]+)\s*\(([^\)]+)\)',
-                body,
-                re.IGNORECASE
-            )
-            
-            if location_match:
-                # Get text before the location line
-                location_start = location_match.start()
-                before_location = body[:location_start]
-                
-                # Find the last occurrence of company name before location
-                company_positions = [m.start() for m in re.finditer(re.escape(company_name), before_location, re.IGNORECASE)]
-                
-                if company_positions:
-                    # Get text after the last company name occurrence
-                    after_last_company = before_location[company_positions[-1] + len(company_name):]
-                    # Remove HTML tags and get clean lines
-                    clean_text = re.sub(r'<[^>]+>', '', after_last_company)
-                    lines = [line.strip() for line in clean_text.split('\n') if line.strip()]
-                    
-                    # The job title should be the first substantial line that's not empty and not the company name
-                    for line in lines[:3]:
-                        clean_line = line.strip()
-                        if (clean_line and 
-                            clean_line.lower() != company_name.lower() and 
-                            len(clean_line) > 3 and
-                            '·' not in clean_line and 
-                            '(' not in clean_line and
-                            'applied on' not in clean_line.lower()):
-                            position = clean_line
-                            break
-            
-            # Method 2: Look for common HTML patterns (strong, b tags, etc.)
-            if not position:
-                job_title_patterns = [
-                    r'<strong[^>]*>([^<]+)</strong>',
-                    r'<b[^>]*>([^<]+)</b>',
-                    r'<h[1-6][^>]*>([^<]+)</h[1-6]>',
-                ]
-                
-                for pattern in job_title_patterns:
-                    matches = re.finditer(pattern, body, re.IGNORECASE)
-                    for match in matches:
-                        potential_title = match.group(1).strip()
-                        # Filter out company name and other non-job-title text
-                        if (potential_title.lower() != company_name.lower() and 
-                            len(potential_title) > 3 and
-                            'applied on' not in potential_title.lower() and
-                            '·' not in potential_title and
-                            '(' not in potential_title):
-                            position = potential_title
-                            break
-                    if position:
-                        break
-            
-            # Method 3: Fallback - look for lines that look like job titles
-            if not position:
-                # Get text after "Your application was sent to [Company]"
-                after_confirmation = body[linkedin_pattern.end():]
-                clean_text = re.sub(r'<[^>]+>', '', after_confirmation)
-                lines = [line.strip() for line in clean_text.split('\n') if line.strip()]
-                
-                for line in lines[:10]:  # Check first 10 lines
-                    clean_line = line.strip()
-                    if (clean_line and 
-                        clean_line.lower() != company_name.lower() and 
-                        len(clean_line) > 3 and
-                        '·' not in clean_line and 
-                        '(' not in clean_line and
-                        'applied on' not in clean_line.lower() and
-                        'now, take' not in clean_line.lower() and
-                        'view similar' not in clean_line.lower()):
-                        position = clean_line
-                        break
-            
-            # Extract location - pattern: "Company Name · Location (On-site/Hybrid/Remote)"
-            location_pattern = re.search(
-                rf'{re.escape(company_name)}\s*·\s*([^\(]+)\s*\(([^\)]+)\)',
-                body,
-                re.IGNORECASE
-            )
-            location = None
-            if location_pattern:
-                location = location_pattern.group(1).strip()
-                work_type = location_pattern.group(2).strip()  # On-site, Hybrid, Remote
-                if location:
-                    location = f"{location} ({work_type})"
-            
-            # Check if this is an Easy Apply application
-            is_easy_apply = 'easy apply' in body.lower() or 'easyapply' in body.lower()
-            
-            # For Easy Apply applications, use current date/time
-            if is_easy_apply:
-                applied_date = datetime.now().replace(second=0, microsecond=0)
-            else:
-                # Extract applied date - pattern: "Applied on [Date]"
-                date_patterns = [
-                    r'Applied on\s+([A-Za-z]+\s+\d{1,2},\s+\d{4})',
-                    r'Applied on\s+(\d{1,2}[/-]\d{1,2}[/-]\d{4})',
-                ]
-                
-                applied_date = None
-                for pattern in date_patterns:
-                    match = re.search(pattern, body, re.IGNORECASE)
-                    if match:
-                        date_str = match.group(1).strip()
-                        # Try parsing with datetime.strptime first (most common format)
-                        try:
-                            # Try "January 9, 2026" format
-                            applied_date = datetime.strptime(date_str, "%B %d, %Y")
-                            applied_date = applied_date.replace(hour=0, minute=0, second=0, microsecond=0)
-                        except ValueError:
-                            try:
-                                # Try "01/09/2026" format
-                                applied_date = datetime.strptime(date_str, "%m/%d/%Y")
-                                applied_date = applied_date.replace(hour=0, minute=0, second=0, microsecond=0)
-                            except ValueError:
-                                try:
-                                    # Try "01-09-2026" format
-                                    applied_date = datetime.strptime(date_str, "%m-%d-%Y")
-                                    applied_date = applied_date.replace(hour=0, minute=0, second=0, microsecond=0)
-                                except ValueError:
-                                    # Try dateutil as fallback if available
-                                    try:
-                                        from dateutil import parser as date_parser
-                                        applied_date = date_parser.parse(date_str)
-                                        if applied_date.tzinfo:
-                                            applied_date = applied_date.replace(tzinfo=None)
-                                        applied_date = applied_date.replace(hour=0, minute=0, second=0, microsecond=0)
-                                    except:
-                                        pass
-                        if applied_date:
-                            break
-                
-                # If no date found in body, use email date
-                if not applied_date:
-                    email_date = msg.get("Date")
-                    if email_date:
-                        try:
-                            from email.utils import parsedate_to_datetime
-                            applied_date = parsedate_to_datetime(email_date)
-                            if applied_date.tzinfo:
-                                applied_date = applied_date.replace(tzinfo=None)
-                            applied_date = applied_date.replace(hour=0, minute=0, second=0, microsecond=0)
-                        except:
-                            pass
-                
-                # If still no date, use today
-                if not applied_date:
-                    applied_date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-            
-            # If position still not found, try to extract from subject or use a default
-            if not position:
-                # Sometimes the position is in the subject
-                if 'application' in subject.lower() and company_name.lower() in subject.lower():
-                    # Try to extract position from subject
-                    parts = subject.split(' - ')
-                    if len(parts) > 1:
-                        position = parts[-1].strip()
-                    else:
-                        position = "Not Specified"
-                else:
-                    position = "Not Specified"
-            
-            # Build notes
-            notes = "Application confirmation from LinkedIn"
-            if is_easy_apply:
-                notes += " (Easy Apply)"
-            
-            print(f"LinkedIn application detected: Company={company_name}, Position={position}, Location={location}, Date={applied_date}, Easy Apply={is_easy_apply}")
-            
-            return {
-                "company_name": company_name,
-                "position": position,
-                "location": location,
-                "applied_date": applied_date,
-                "status": "pending",
-                "source": "linkedin_email",
-                "notes": notes
-            }
-            
-        except Exception as e:
-            print(f"Error extracting LinkedIn application: {e}")
+    def extract_with_rules(self, email_content: Dict[str, str], msg) -> Optional[Dict]:
+        """
+        Rule-based extraction for mail from known ATS senders (LinkedIn, Greenhouse, ...)
+        and for calendar invitations; None if no rule applies
+        """
+        extracted_data = extractor_registry.extract(email_content, msg)
+        event = calendar_invites.interview_event(email_content)
+        if event is not None:
+            if extracted_data:
+                # The invitation's exact start time beats anything read from the text
+                extracted_data.update(calendar_invites.interview_fields(event))
+                return extracted_data
+            extracted_data = calendar_invites.extract_from_invite(email_content, msg, event)
+        return extracted_data or self.extract_with_sender_cache(email_content, msg)
+    
+    def extract_with_sender_cache(self, email_content: Dict[str, str], msg) -> Optional[Dict]:
+        """
+        Company from the learned sender mapping, position from the common confirmation phrasing.
+        If the position is not found, the known company is left in `email_content` so the LLM
+        only has to find the remaining fields, and None is returned.
+        """
+        if not settings.sender_cache_enabled:
+            return None
+        known = sender_company_cache.lookup(msg.get("From"))
+        if not known:
             return None
+        
+        text = html_to_text(email_content['body'])
+        fields = common_fields(email_content['subject'], text)
+        if not fields.get("position"):
+            email_content["known_company"] = known["company_name"]
+            return None
+        
+        sender_company_cache.avoided_llm_call()
+        return {
+            "company_name": known["company_name"],
+            "position": fields["position"],
+            "status": detect_status(email_content['subject'], text),
+            "source": "sender_cache",
+            "notes": f"Company known from sender ({known['sender_key']})",
+        }
     
-    def extract_with_llm(self, email_content: Dict[str, str]) -> Optional[Dict]:
-        """Use Ollama LLM to extract job application information from email"""
+    def llm_prompt(self, email_content: Dict[str, str]) -> str:
+        """Prompt asking the LLM for the application details of an email"""
+        # A company already known from the sender cache is given to the model and kept as is
+        known_company = email_content.get("known_company")
+        known_company_note = (
+            f"\nThe company is already known to be \"{known_company}\"; use exactly this as company_name "
+            "and focus on the remaining fields.\n" if known_company else ""
+        )
         prompt = f"""Analyze the following email (which may be HTML) and extract job application information. 
 This email is about a job application - extract the company name and position from the subject line and email body.
 
@@ -357,440 +145,930 @@ Return a JSON object with the following fields if available:
 - contact_email: Contact email if mentioned
 - location: Job location if mentioned
 - notes: Any additional relevant information
-
+{known_company_note}
 Email Subject: {email_content['subject']}
 Email Body: {email_content['body'][:8000]}
 
 Return ONLY valid JSON, no additional text. If information is not available, use null for that field."""
-
+        return prompt
+    
+    def llm_request(self, email_content: Dict[str, str]) -> Dict:
+        """Arguments of the generate call extracting an email"""
+        return {"model": self.model, "prompt": self.llm_prompt(email_content), "format": "json"}
+    
+    def extract_with_llm(self, email_content: Dict[str, str], use_cache: bool = True) -> Optional[Dict]:
+        """Use Ollama LLM to extract job application information from email; `use_cache=False` asks again"""
         try:
-            response = self.ollama_client.generate(
-                model=self.model,
-                prompt=prompt,
-                format="json"
-            )
-            
-            # Extract JSON from response - handle different response formats
-            if isinstance(response, dict):
-                response_text = response.get('response', '').strip()
-            else:
-                response_text = str(response).strip()
-            
-            if not response_text:
-                return None
-            
-            # Try to extract JSON if wrapped in markdown code blocks
-            json_match = re.search(r'```json\s*(\{.*?\})\s*```', response_text, re.DOTALL)
+            return cached_generate(self.ollama_client, "email_extraction", use_cache, self.llm_priority,
+                                   parse=lambda response: self.parse_llm_response(response, email_content),
+                                   **self.llm_request(email_content))
+        except Exception as e:
+            return self.llm_failed(e)
+    
+    async def aextract_with_llm(self, email_content: Dict[str, str], use_cache: bool = True) -> Optional[Dict]:
+        """extract_with_llm on the async Ollama client; waiting for the model holds no thread"""
+        try:
+            return await acached_generate(self.async_ollama_client, "email_extraction", use_cache, self.llm_priority,
+                                          parse=lambda response: self.parse_llm_response(response, email_content),
+                                          **self.llm_request(email_content))
+        except Exception as e:
+            return self.llm_failed(e)
+    
+    def llm_failed(self, error: Exception) -> None:
+        """Outcome of an extract_with_llm call that raised `error`"""
+        if isinstance(error, (ConnectionError, httpx.TransportError)):
+            # Ollama unreachable - let callers retry later instead of treating the email as unparseable
+            raise error
+        print(f"Error extracting with LLM: {error}")
+        return None
+    
+    def parse_llm_response(self, response, email_content: Dict[str, str]) -> Optional[Dict]:
+        """Application details from the LLM's answer to llm_prompt, or None if it cannot be parsed"""
+        result = self.llm_json(response)
+        if result is None:
+            return None
+        return self.finish_llm_result(result, email_content)
+    
+    def llm_json(self, response) -> Optional[Dict]:
+        """The JSON object in an LLM answer, tolerating code fences, quoting and Python-style literals"""
+        # Extract JSON from response - handle different response formats
+        if isinstance(response, dict):
+            response_text = response.get('response', '').strip()
+        else:
+            response_text = str(response).strip()
+        
+        if not response_text:
+            return None
+        
+        # Try to extract JSON if wrapped in markdown code blocks
+        json_match = re.search(r'```json\s*(\{.*?\})\s*```', response_text, re.DOTALL)
+        if json_match:
+            response_text = json_match.group(1)
+        else:
+            # Try to find JSON object directly
+            json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
             if json_match:
-                response_text = json_match.group(1)
-            else:
-                # Try to find JSON object directly
-                json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-                if json_match:
-                    response_text = json_match.group(0)
-            
-            # Clean up the response text
-            # Remove wrapping quotes if they exist (e.g. LLM returned '{"a":1}')
-            if response_text.startswith("'") and response_text.endswith("'"):
-                response_text = response_text[1:-1]
-            elif response_text.startswith('"') and response_text.endswith('"'):
-                response_text = response_text[1:-1]
-            
-            # Remove any leading/trailing whitespace
-            response_text = response_text.strip()
-            
-            # Handle escaped newlines - if response contains literal \n, decode them
-            # The LLM might return JSON with escaped newlines as strings
-            if '\\n' in response_text:
+                response_text = json_match.group(0)
+        
+        # Clean up the response text
+        # Remove wrapping quotes if they exist (e.g. LLM returned '{"a":1}')
+        if response_text.startswith("'") and response_text.endswith("'"):
+            response_text = response_text[1:-1]
+        elif response_text.startswith('"') and response_text.endswith('"'):
+            response_text = response_text[1:-1]
+        
+        # Remove any leading/trailing whitespace
+        response_text = response_text.strip()
+        
+        # Handle escaped newlines - if response contains literal \n, decode them
+        # The LLM might return JSON with escaped newlines as strings
+        if '\\n' in response_text:
+            try:
+                # Decode the string representation (convert \n to actual newlines)
+                response_text = response_text.encode('utf-8').decode('unicode_escape')
+            except:
+                # Fallback: manual replacement
+                response_text = response_text.replace('\\n', '\n').replace('\\t', '\t').replace('\\"', '"').replace("\\'", "'")
+        
+        import json
+        import ast
+        
+        try:
+            result = json.loads(response_text)
+        except json.JSONDecodeError as e:
+            print(f"JSON decode error: {e}")
+            print(f"Response text (first 500 chars): {response_text[:500]}")
+            # Try to handle Python-style dicts or fix common issues
+            try:
+                # Handle null/true/false for ast.literal_eval
+                text_for_eval = response_text.replace('null', 'None').replace('true', 'True').replace('false', 'False')
+                result = ast.literal_eval(text_for_eval)
+                if not isinstance(result, dict):
+                    raise ValueError("Parsed result is not a dictionary")
+                # Convert None/True/False back to null/true/false for JSON compatibility
+                result = {k: (None if v is None else (True if v is True else (False if v is False else v))) for k, v in result.items()}
+            except Exception as e2:
+                print(f"Failed to parse JSON: {repr(response_text[:200])}")
+                print(f"Eval error: {e2}")
+                return None
+        return result
+    
+    def finish_llm_result(self, result: Dict, email_content: Dict[str, str]) -> Dict:
+        """Convert the dates of an LLM extraction and apply what is known without the LLM"""
+        # Parse dates
+        if result.get('interview_date'):
+            try:
+                result['interview_date'] = datetime.strptime(result['interview_date'], "%Y-%m-%d %H:%M")
+            except:
                 try:
-                    # Decode the string representation (convert \n to actual newlines)
-                    response_text = response_text.encode('utf-8').decode('unicode_escape')
+                    result['interview_date'] = datetime.strptime(result['interview_date'], "%Y-%m-%d")
                 except:
-                    # Fallback: manual replacement
-                    response_text = response_text.replace('\\n', '\n').replace('\\t', '\t').replace('\\"', '"').replace("\\'", "'")
-            
-            import json
-            import ast
+                    result['interview_date'] = None
+        else:
+            result['interview_date'] = None
             
+        if result.get('rejection_date'):
             try:
-                result = json.loads(response_text)
-            except json.JSONDecodeError as e:
-                print(f"JSON decode error: {e}")
-                print(f"Response text (first 500 chars): {response_text[:500]}")
-                # Try to handle Python-style dicts or fix common issues
-                try:
-                    # Handle null/true/false for ast.literal_eval
-                    text_for_eval = response_text.replace('null', 'None').replace('true', 'True').replace('false', 'False')
-                    result = ast.literal_eval(text_for_eval)
-                    if not isinstance(result, dict):
-                        raise ValueError("Parsed result is not a dictionary")
-                    # Convert None/True/False back to null/true/false for JSON compatibility
-                    result = {k: (None if v is None else (True if v is True else (False if v is False else v))) for k, v in result.items()}
-                except Exception as e2:
-                    print(f"Failed to parse JSON: {repr(response_text[:200])}")
-                    print(f"Eval error: {e2}")
-                    return None
-            
-            # Parse dates
-            if result.get('interview_date'):
-                try:
-                    result['interview_date'] = datetime.strptime(result['interview_date'], "%Y-%m-%d %H:%M")
-                except:
-                    try:
-                        result['interview_date'] = datetime.strptime(result['interview_date'], "%Y-%m-%d")
-                    except:
-                        result['interview_date'] = None
-            else:
-                result['interview_date'] = None
-                
-            if result.get('rejection_date'):
-                try:
-                    result['rejection_date'] = datetime.strptime(result['rejection_date'], "%Y-%m-%d")
-                except:
-                    result['rejection_date'] = None
-            else:
+                result['rejection_date'] = datetime.strptime(result['rejection_date'], "%Y-%m-%d")
+            except:
                 result['rejection_date'] = None
-            
-            # Parse applied_date if extracted by LLM
-            if result.get('applied_date'):
+        else:
+            result['rejection_date'] = None
+        
+        # Parse applied_date if extracted by LLM
+        if result.get('applied_date'):
+            try:
+                result['applied_date'] = datetime.strptime(result['applied_date'], "%Y-%m-%d %H:%M")
+            except:
                 try:
-                    result['applied_date'] = datetime.strptime(result['applied_date'], "%Y-%m-%d %H:%M")
+                    result['applied_date'] = datetime.strptime(result['applied_date'], "%Y-%m-%d")
                 except:
-                    try:
-                        result['applied_date'] = datetime.strptime(result['applied_date'], "%Y-%m-%d")
-                    except:
-                        result['applied_date'] = None
-            else:
-                result['applied_date'] = None
-            
-            return result
+                    result['applied_date'] = None
+        else:
+            result['applied_date'] = None
+        
+        known_company = email_content.get("known_company")
+        if known_company:
+            result['company_name'] = known_company
+        
+        # An attached interview invitation gives the exact interview time
+        event = calendar_invites.interview_event(email_content)
+        if event:
+            result.update(calendar_invites.interview_fields(event))
+        
+        return result
+    
+    def batch_text(self, email_content: Dict[str, str]) -> str:
+        """Plain text of an email body with whitespace collapsed, as it is sent in a batch"""
+        return re.sub(r"\s+", " ", html_to_text(email_content['body'])).strip()
+    
+    def llm_batches(self, items: List[Tuple[Any, Dict[str, str]]]) -> List[List[Tuple[Any, Dict[str, str]]]]:
+        """
+        Groups of (key, email_content) for extract_many_with_llm: short emails up to
+        EMAIL_LLM_BATCH_SIZE per group, longer ones in a group of their own
+        """
+        size = max(1, settings.email_llm_batch_size)
+        groups, short = [], []
+        for item in items:
+            if size == 1 or len(self.batch_text(item[1])) > settings.email_llm_batch_max_chars:
+                groups.append([item])
+                continue
+            short.append(item)
+            if len(short) == size:
+                groups.append(short)
+                short = []
+        if short:
+            groups.append(short)
+        return groups
+    
+    def batch_prompt(self, labelled: List[Tuple[str, Dict[str, str]]]) -> str:
+        """Prompt asking the LLM for the application details of several emails, each under its id"""
+        emails = []
+        for label, email_content in labelled:
+            known_company = email_content.get("known_company")
+            known_company_note = (
+                f"Known company: \"{known_company}\" (use exactly this as company_name)\n" if known_company else ""
+            )
+            emails.append(
+                f"--- Email id: {label} ---\n"
+                f"{known_company_note}"
+                f"Subject: {email_content['subject']}\n"
+                f"Body: {self.batch_text(email_content)[:settings.email_llm_batch_max_chars]}"
+            )
+        emails = "\n\n".join(emails)
+        prompt = f"""Analyze each of the following {len(labelled)} emails and extract job application information.
+Each email is about a job application - extract the company name and position from its subject line and body.
+Treat every email on its own; never mix details of different emails.
+
+IMPORTANT: 
+- Extract the FULL company name (e.g., "Intercontinental Exchange, Inc." not just "ICE")
+- Extract the FULL position title from the subject or body
+- If an email says "Thank you for your application" or similar, it is a confirmation email for an application
+- Status should be "pending" for confirmation emails unless explicitly stated otherwise
+
+Return a JSON object {{"results": [...]}} with exactly one entry per email, each an object with:
+- id: The email id exactly as given (e.g. "m1")
+- company_name: Full name of the company
+- position: Complete job position/title
+- applied_date: Date when the application was submitted (format: YYYY-MM-DD or YYYY-MM-DD HH:MM) - only if explicitly mentioned
+- status: One of: "pending", "interview", "rejected", "accepted" (default to "pending" for confirmation emails)
+- interview_date: Date and time if interview is scheduled (format: YYYY-MM-DD HH:MM or YYYY-MM-DD)
+- rejection_date: Date if rejection mentioned (format: YYYY-MM-DD)
+- rejection_reason: Reason for rejection if mentioned
+- job_url: URL to job posting if mentioned
+- contact_email: Contact email if mentioned
+- location: Job location if mentioned
+- notes: Any additional relevant information
+
+{emails}
+
+Return ONLY valid JSON, no additional text. If information is not available, use null for that field."""
+        return prompt
+    
+    def extract_many_with_llm(self, items: List[Tuple[Any, Dict[str, str]]],
+                              use_cache: bool = True) -> Dict[Any, Optional[Dict]]:
+        """
+        extract_with_llm for several emails in one LLM call; {key: extracted data or None}.
+        Emails whose entry is missing or malformed in the answer (all of them if the
+        answer cannot be parsed) are extracted again one by one.
+        """
+        if len(items) == 1:
+            key, email_content = items[0]
+            return {key: self.extract_with_llm(email_content, use_cache)}
+        
+        # Short per-batch ids instead of the emails' own keys, which the model might alter
+        labelled = {f"m{i}": item for i, item in enumerate(items, 1)}
+        results: Dict[Any, Optional[Dict]] = {}
+        try:
+            entries = cached_generate(
+                self.ollama_client, "email_batch_extraction", use_cache, self.llm_priority,
+                parse=self.batch_entries,
+                model=self.model,
+                prompt=self.batch_prompt([(label, item[1]) for label, item in labelled.items()]),
+                format="json"
+            )
+            seen = set()
+            for entry in entries or []:
+                label = str(entry.get("id")) if isinstance(entry, dict) else None
+                if label not in labelled or label in seen:
+                    continue
+                seen.add(label)
+                key, email_content = labelled[label]
+                entry = {field: value for field, value in entry.items() if field != "id"}
+                results[key] = self.finish_llm_result(entry, email_content)
             
+        except (ConnectionError, httpx.TransportError):
+            # Ollama unreachable - let callers retry later instead of treating the emails as unparseable
+            raise
         except Exception as e:
-            print(f"Error extracting with LLM: {e}")
-            return None
+            print(f"Error extracting email batch with LLM: {e}")
+        
+        missing = [item for item in items if item[0] not in results]
+        _count_batch(batches=1, emails=len(items), fallbacks=len(missing))
+        for key, email_content in missing:
+            results[key] = self.extract_with_llm(email_content, use_cache)
+        return results
     
-    def process_emails(self, db: Session, days_back: int = 0) -> List[Dict]:
-        """Process emails from today (or last N days) and extract job applications"""
-        mail = self.connect_email()
-        mail.select("INBOX")
+    def batch_entries(self, response) -> Optional[List]:
+        """The per-email entries of an answer to batch_prompt, or None if it has none"""
+        answer = self.llm_json(response)
+        entries = answer.get("results") if isinstance(answer, dict) else answer
+        return entries if isinstance(entries, list) else None
+    
+    def fetch_candidate_messages(self, mail, mailbox: str, uidvalidity: int, email_ids: List[bytes],
+                                 skip_outcomes: Sequence[str] = (),
+                                 classifier: Optional[JobEmailClassifier] = None) -> Dict[bytes, bytes]:
+        """
+        Get the messages (by UID) worth parsing. Emails already in the local message
+        cache are not downloaded again. In two-phase mode only headers, size and
+        structure are fetched first; just the emails whose subject or sender look
+        job-related get their text part downloaded. Emails recorded in the processed
+        ledger with one of `skip_outcomes` are left out. `classifier` defaults to the sync's.
+        """
+        message_cache.observe_uidvalidity(mailbox, uidvalidity)
+        cached = self.drop_processed(message_cache.get_many(mailbox, email_ids), skip_outcomes)
+        missing = [uid for uid in email_ids if uid not in cached]
+        if not missing:
+            return cached
         
-        # Search for emails from today (or specified days back)
-        date_since = (datetime.now() - timedelta(days=days_back)).strftime("%d-%b-%Y")
-        status, messages = mail.search(None, f'(SINCE {date_since})')
+        fetched = self.download_messages(mail, missing, filter_candidates=True, skip_outcomes=skip_outcomes,
+                                         classifier=classifier)
+        message_cache.put_many(mailbox, fetched)
+        return {**cached, **fetched}
+    
+    def drop_processed(self, messages: Dict[bytes, bytes], outcomes: Sequence[str]) -> Dict[bytes, bytes]:
+        """Remove messages (raw bytes or just headers) whose Message-ID the ledger has with one of `outcomes`"""
+        if not outcomes or not messages:
+            return messages
+        keys = {uid: message_ledger.raw_message_key(raw) for uid, raw in messages.items()}
+        done = message_ledger.processed_ids(keys.values(), outcomes)
+        if not done:
+            return messages
+        return {uid: raw for uid, raw in messages.items() if keys[uid] not in done}
+    
+    def download_messages(self, mail, email_ids: List[bytes], filter_candidates: bool = False,
+                          skip_outcomes: Sequence[str] = (),
+                          classifier: Optional[JobEmailClassifier] = None) -> Dict[bytes, bytes]:
+        """
+        Download messages by UID. With `filter_candidates`, two-phase mode skips non-job
+        mail and mail the ledger has with one of `skip_outcomes` before any body is fetched.
+        """
+        if not settings.email_two_phase_fetch:
+            return self.drop_processed(fetch_messages(mail, email_ids, uid=True), skip_outcomes)
         
-        email_ids = messages[0].split()
-        new_applications = []
+        header_info = fetch_headers(mail, email_ids, uid=True)
+        if not filter_candidates:
+            return fetch_text_messages(mail, header_info, uid=True)
         
-        # Keywords to identify job-related emails
-        job_keywords = [
-            "application", "applied", "interview", "rejection", "job", "position", 
-            "hiring", "candidate", "thank you for applying", "thank you for your application",
-            "next steps", "thank you for", "your application", "we received", "received your application",
-            "thank you for applying", "position", "role", "opportunity", "linkedin",
-            "application was sent", "your application was sent"
-        ]
+        unprocessed = self.drop_processed({uid: info["headers"] for uid, info in header_info.items()}, skip_outcomes)
+        classifier = classifier or job_classifier
         
-        for email_id in email_ids[-50:]:  # Process last 50 emails
-            try:
-                status, msg_data = mail.fetch(email_id, "(RFC822)")
-                email_body = msg_data[0][1]
-                msg = email.message_from_bytes(email_body)
-                
-                email_content = self.parse_email_content(msg)
-                
-                # Get email date - this is the actual date the email was received
-                email_date = msg.get("Date")
-                if email_date:
-                    try:
-                        from email.utils import parsedate_to_datetime
-                        email_date = parsedate_to_datetime(email_date)
-                        # Convert to naive datetime and set to midnight to use just the date
-                        if email_date.tzinfo:
-                            email_date = email_date.replace(tzinfo=None)
-                        email_date = email_date.replace(hour=0, minute=0, second=0, microsecond=0)
-                    except:
-                        # Fallback to yesterday if parsing fails
-                        email_date = (datetime.now() - timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
-                else:
-                    # Default to yesterday if no date
-                    email_date = (datetime.now() - timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
-                
-                # Check if email is job-related
-                subject_lower = email_content['subject'].lower()
-                body_lower = email_content['body'].lower()
-                
-                if any(keyword in subject_lower or keyword in body_lower for keyword in job_keywords):
-                    # Check if we already processed this email
-                    existing = db.query(Application).filter(
-                        Application.email_id == email_id.decode()
-                    ).first()
-                    
-                    if existing:
-                        continue
-                    
-                    # First, try to extract LinkedIn application (special case)
-                    extracted_data = self.extract_linkedin_application(email_content, msg)
-                    
-                    # If not a LinkedIn email, use LLM extraction
-                    if not extracted_data:
-                        extracted_data = self.extract_with_llm(email_content)
-                    
-                    # Debug: Print extraction results
-                    if extracted_data:
-                        print(f"Extracted data: {extracted_data}")
-                        print(f"Company name: {extracted_data.get('company_name')}")
-                        print(f"Position: {extracted_data.get('position')}")
-                    
-                    if extracted_data and extracted_data.get('company_name'):
-                        # Ensure required fields have values (handle None explicitly)
-                        company_name = extracted_data.get('company_name') or 'Unknown'
-                        position = extracted_data.get('position') or 'Not Specified'
-                        
-                        # Use email date as applied_date, or extracted date if LLM found one
-                        if extracted_data.get('applied_date'):
-                            applied_date = extracted_data.get('applied_date')
-                            # Ensure it's naive datetime and set to midnight
-                            if applied_date.tzinfo:
-                                applied_date = applied_date.replace(tzinfo=None)
-                            applied_date = applied_date.replace(hour=0, minute=0, second=0, microsecond=0)
-                        else:
-                            applied_date = email_date
-                        
-                        # Create application record
-                        application = Application(
-                            company_name=company_name,
-                            position=position,
-                            status=extracted_data.get('status', 'pending'),
-                            interview_date=extracted_data.get('interview_date'),
-                            rejection_date=extracted_data.get('rejection_date'),
-                            rejection_reason=extracted_data.get('rejection_reason'),
-                            notes=extracted_data.get('notes'),
-                            job_url=extracted_data.get('job_url'),
-                            contact_email=extracted_data.get('contact_email'),
-                            location=extracted_data.get('location'),
-                            source=extracted_data.get('source', 'email'),
-                            email_id=email_id.decode(),
-                            applied_date=applied_date
-                        )
-                        
-                        db.add(application)
-                        db.commit()
-                        db.refresh(application)
-                        
-                        new_applications.append({
-                            "id": application.id,
-                            "company_name": application.company_name,
-                            "position": application.position,
-                            "status": application.status
-                        })
-                        
-            except Exception as e:
-                print(f"Error processing email {email_id}: {e}")
-                continue
-        
-        mail.close()
-        mail.logout()
+        candidates = {}
+        skipped_bytes = 0
+        for number, info in header_info.items():
+            msg = mime_parser.parse_headers(info["headers"])
+            subject = mime_parser.header(msg, "Subject")
+            if number in unprocessed and classifier.match(subject=subject, sender=msg.get("From", "")):
+                candidates[number] = info
+            else:
+                skipped_bytes += info["size"]
         
-        return new_applications
+        print(f"Header filter: {len(candidates)}/{len(header_info)} emails are candidates, skipped {skipped_bytes} bytes")
+        return fetch_text_messages(mail, candidates, uid=True)
     
-    def list_emails(self, db: Session, days_back: int = 0, limit: int = 50, unread_only: bool = False) -> List[Dict]:
-        """List emails from today (or last N days), optionally only unread emails"""
-        mail = self.connect_email()
-        mail.select("INBOX")
+    def get_uidvalidity(self, mail, mailbox: str) -> int:
+        """UIDVALIDITY of the selected mailbox (sent with SELECT, otherwise asked for via STATUS)"""
+        typ, data = mail.response("UIDVALIDITY")
+        if data and data[0]:
+            return int(data[0])
+        typ, data = mail.status(mailbox, "(UIDVALIDITY)")
+        match = re.search(rb"UIDVALIDITY (\d+)", data[0] or b"")
+        return int(match.group(1)) if match else 0
+    
+    def search_new_uids(self, mail, db: Session, mailbox: str, days_back: int = 0,
+                        limit: int = 50, state_key: Optional[str] = None) -> Tuple[List[bytes], int]:
+        """
+        Find the UIDs to sync in `mailbox`: everything above the stored checkpoint or,
+        on the first run or after UIDVALIDITY changed, the last `limit` messages of the
+        date window. The checkpoint is stored under `state_key` (default: the mailbox).
+        Returns (uids, uidvalidity).
+        """
+        state_key = state_key or mailbox
+        uidvalidity = self.get_uidvalidity(mail, mailbox)
+        state = db.query(SyncState).filter(SyncState.mailbox == state_key).first()
         
-        # Search for emails from today (or specified days back)
-        date_since = (datetime.now() - timedelta(days=days_back)).strftime("%d-%b-%Y")
+        if state and state.uidvalidity == uidvalidity:
+            status, messages = mail.uid("SEARCH", None, f"UID {state.last_uid + 1}:*")
+            # "n:*" always matches the newest message, even when its UID is below n
+            uids = sorted((uid for uid in (messages[0] or b"").split() if int(uid) > state.last_uid), key=int)
+            # Oldest first; anything beyond the limit is picked up by the next sync
+            return uids[:limit], uidvalidity
+        
+        if state:
+            print(f"UIDVALIDITY of {state_key} changed ({state.uidvalidity} -> {uidvalidity}), resyncing window")
         
-        # Build search criteria
-        if unread_only:
-            # Search for unread emails from the specified date
-            search_criteria = f'(UNSEEN SINCE {date_since})'
+        date_since = (datetime.now() - timedelta(days=days_back)).strftime("%d-%b-%Y")
+        status, messages = mail.uid("SEARCH", None, f'(SINCE {date_since})')
+        uids = sorted((messages[0] or b"").split(), key=int)
+        return uids[-limit:], uidvalidity
+    
+    def save_checkpoint(self, db: Session, mailbox: str, uidvalidity: int, uids: List[bytes],
+                        unsettled: Iterable[bytes] = ()):
+        """
+        Remember the highest UID synced so the next run starts after it. `unsettled`
+        UIDs (whose outcome was not saved) and everything above them are left for the next run.
+        """
+        unsettled = [int(uid) for uid in unsettled]
+        if unsettled:
+            uids = [uid for uid in uids if int(uid) < min(unsettled)]
+        if not uids:
+            return
+        last_uid = max(int(uid) for uid in uids)
+        state = db.query(SyncState).filter(SyncState.mailbox == mailbox).first()
+        if state is None:
+            state = SyncState(mailbox=mailbox, uidvalidity=uidvalidity, last_uid=last_uid)
+            db.add(state)
+        elif state.uidvalidity != uidvalidity:
+            state.uidvalidity = uidvalidity
+            state.last_uid = last_uid
         else:
-            search_criteria = f'(SINCE {date_since})'
+            state.last_uid = max(state.last_uid, last_uid)
+        db.commit()
+    
+    def get_email_date(self, msg) -> datetime:
+        """Date the email was received, as a naive datetime at midnight"""
+        email_date = msg.get("Date")
+        if email_date:
+            try:
+                from email.utils import parsedate_to_datetime
+                email_date = parsedate_to_datetime(email_date)
+                # Convert to naive datetime and set to midnight to use just the date
+                if email_date.tzinfo:
+                    email_date = email_date.replace(tzinfo=None)
+                return email_date.replace(hour=0, minute=0, second=0, microsecond=0)
+            except:
+                pass
+        # Default to yesterday if there is no usable date
+        return (datetime.now() - timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    
+    def is_job_related(self, email_content: Dict[str, str], sender: str = "",
+                       body_text: Optional[str] = None,
+                       classifier: Optional[JobEmailClassifier] = None) -> Optional[Dict[str, str]]:
+        """Classify an email (for the sync unless another classifier is given); the matching rule, or None"""
+        if body_text is None:
+            body_text = html_to_text(email_content['body'])
+        return (classifier or job_classifier).match(subject=email_content['subject'], sender=sender, text=body_text)
+    
+    def unrelated_outcome(self, email_content: Dict[str, str], sender: str = "") -> str:
+        """Ledger outcome of an email the sync does not take: NOT_SYNCED if the email list would still show it"""
+        if self.is_job_related(email_content, sender, classifier=review_classifier):
+            return message_ledger.NOT_SYNCED
+        return message_ledger.NOT_JOB
+    
+    def build_application(self, email_id: str, extracted_data: Dict, email_date: datetime,
+                          sender: Optional[str] = None) -> Application:
+        """Create (but do not save) an application record from extracted email data"""
+        # Ensure required fields have values (handle None explicitly)
+        company_name = extracted_data.get('company_name') or 'Unknown'
+        position = extracted_data.get('position') or 'Not Specified'
         
-        status, messages = mail.search(None, search_criteria)
+        # Use email date as applied_date, or extracted date if LLM found one
+        if extracted_data.get('applied_date'):
+            applied_date = extracted_data.get('applied_date')
+            # Ensure it's naive datetime and set to midnight
+            if applied_date.tzinfo:
+                applied_date = applied_date.replace(tzinfo=None)
+            applied_date = applied_date.replace(hour=0, minute=0, second=0, microsecond=0)
+        else:
+            applied_date = email_date
         
-        email_ids = messages[0].split()
-        emails = []
+        return Application(
+            company_name=company_name,
+            position=position,
+            status=extracted_data.get('status', 'pending'),
+            interview_date=extracted_data.get('interview_date'),
+            rejection_date=extracted_data.get('rejection_date'),
+            rejection_reason=extracted_data.get('rejection_reason'),
+            notes=extracted_data.get('notes'),
+            job_url=extracted_data.get('job_url'),
+            contact_email=extracted_data.get('contact_email'),
+            location=extracted_data.get('location'),
+            source=extracted_data.get('source', 'email'),
+            email_id=email_id,
+            sender=sender,
+            applied_date=applied_date
+        )
+    
+    def followup_data(self, email_content: Dict[str, str], application: Application) -> Dict:
+        """Extracted data for a reply in the thread of a known application (no LLM call)"""
+        extracted_data = {
+            "company_name": application.company_name,
+            "position": application.position,
+            "status": detect_status(email_content['subject'], html_to_text(email_content['body'])),
+            "source": "thread",
+        }
+        # Any invitation in the thread of a known application is taken as its interview
+        event = calendar_invites.invite_event(email_content)
+        if event:
+            extracted_data.update(calendar_invites.interview_fields(event))
+        return extracted_data
+    
+    def status_update_target(self, db: Session, extracted_data: Dict, email_date: datetime) -> Optional[Application]:
+        """The existing application a rejection or interview email is about, found by the company matcher"""
+        if (extracted_data.get('status') or '').lower() not in ("rejected", "interview"):
+            return None
+        return self.find_rejection_match(extracted_data, db, email_date.isoformat())
+    
+    def apply_followup(self, application: Application, extracted_data: Dict, email_date: datetime) -> None:
+        """
+        Update an application from a follow-up email about it; the caller commits.
+        The application keeps the email_id of the email that created it, so callers
+        record the follow-up through its thread link and ledger entry.
+        """
+        status = extracted_data.get('status')
+        if status == "rejected":
+            application.status = "rejected"
+            application.rejection_date = extracted_data.get('rejection_date') or email_date
+            if extracted_data.get('rejection_reason'):
+                application.rejection_reason = extracted_data['rejection_reason']
+        elif status == "interview":
+            application.status = "interview"
+            if extracted_data.get('interview_date'):
+                application.interview_date = extracted_data['interview_date']
+    
+    def process_emails(self, db: Session, days_back: int = 0) -> List[Dict]:
+        """
+        Process new emails (since the last sync, or from today / last N days on the
+        first run) and extract job applications. Fetching, parsing, LLM extraction
+        and database writes run as concurrent pipeline stages (see sync_pipeline), and
+        every configured account/folder (see mail_sources) is read in parallel.
+        """
+        return SyncPipeline(self, db, configured_sources()).run(days_back)
+    
+    def search_emails(self, days_back: int = 0, limit: int = 50, unread_only: bool = False) -> Tuple[List[bytes], int]:
+        """UIDs of the last `limit` emails from today (or last N days), newest first, and the UIDVALIDITY"""
+        with imap_pool.session("INBOX") as mail:
+            # Search for emails from today (or specified days back)
+            date_since = (datetime.now() - timedelta(days=days_back)).strftime("%d-%b-%Y")
+            
+            # Build search criteria
+            if unread_only:
+                # Search for unread emails from the specified date
+                search_criteria = f'(UNSEEN SINCE {date_since})'
+            else:
+                search_criteria = f'(SINCE {date_since})'
+            
+            status, messages = mail.uid("SEARCH", None, search_criteria)
+            uidvalidity = self.get_uidvalidity(mail, "INBOX")
         
-        # Keywords to identify job-related emails
-        job_keywords = [
-            "application", "applied", "interview", "rejection", "job", "position", 
-            "hiring", "candidate", "thank you for applying", "thank you for your application",
-            "next steps", "thank you for", "your application", "we received", "received your application",
-            "offer", "accepted", "declined", "role", "opportunity", "linkedin",
-            "application was sent", "your application was sent"
-        ]
+        email_ids = sorted(messages[0].split(), key=int)
         
         # Get last N emails and reverse to show newest first
         recent_email_ids = email_ids[-limit:]
-        recent_email_ids.reverse()  # Reverse to show newest first
+        recent_email_ids.reverse()
+        return recent_email_ids, uidvalidity
+    
+    def iter_emails(self, db: Session, email_ids: List[bytes], uidvalidity: int,
+                    include_body: bool = False) -> Iterator[Dict]:
+        """
+        Yield a summary row for each job-related email in `email_ids`, one FETCH
+        chunk at a time, so the first rows are available before the last
+        message is downloaded. The full body is only included with `include_body`.
+        """
+        for chunk in chunked(email_ids, settings.imap_fetch_chunk_size):
+            # The pooled session is released while rows are consumed
+            with imap_pool.session("INBOX") as mail:
+                # Mail already found to be unrelated is not fetched or classified again
+                raw_messages = self.fetch_candidate_messages(mail, "INBOX", uidvalidity, chunk,
+                                                             skip_outcomes=(message_ledger.NOT_JOB,),
+                                                             classifier=review_classifier)
+            
+            # Get existing applications to check status
+            existing_apps = db.query(Application).filter(
+                Application.email_id.in_([eid.decode() for eid in chunk])
+            ).all()
+            existing_map = {app.email_id: app for app in existing_apps}
+            
+            for email_id in chunk:
+                email_body = raw_messages.pop(email_id, None)
+                if email_body is None:
+                    continue
+                try:
+                    row = self.summarize_email(db, email_id.decode(), email_body, existing_map, include_body)
+                except Exception as e:
+                    print(f"Error processing email {email_id}: {e}")
+                    continue
+                if row:
+                    yield row
+            
+            # Save the ledger entries for this chunk's unrelated mail
+            db.commit()
+    
+    def summarize_email(self, db: Session, email_id: str, email_body: bytes, existing_map: Dict[str, Application],
+                        include_body: bool = False) -> Optional[Dict]:
+        """List row for one email, or None if it is not job-related (which is recorded in the ledger)"""
+        msg = mime_parser.parse_message(email_body)
         
-        # Get existing applications to check status
-        existing_apps = db.query(Application).filter(
-            Application.email_id.in_([eid.decode() for eid in recent_email_ids])
-        ).all()
-        existing_map = {app.email_id: app for app in existing_apps}
+        email_content = self.parse_email_content(msg)
         
-        for email_id in recent_email_ids:  # Process in reverse order (newest first)
-            try:
-                status, msg_data = mail.fetch(email_id, "(RFC822)")
-                email_body = msg_data[0][1]
-                msg = email.message_from_bytes(email_body)
-                
-                email_content = self.parse_email_content(msg)
-                
-                # Check if email is job-related
-                subject_lower = email_content['subject'].lower()
-                body_lower = email_content['body'].lower()
-                
-                if any(keyword in subject_lower or keyword in body_lower for keyword in job_keywords):
-                    # Get email date
-                    email_date = msg.get("Date")
-                    if email_date:
-                        try:
-                            from email.utils import parsedate_to_datetime
-                            email_date = parsedate_to_datetime(email_date)
-                            # Convert to naive datetime and set to midnight to use just the date
-                            if email_date.tzinfo:
-                                email_date = email_date.replace(tzinfo=None)
-                            email_date = email_date.replace(hour=0, minute=0, second=0, microsecond=0)
-                        except:
-                            # Fallback to yesterday if parsing fails
-                            email_date = (datetime.now() - timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
-                    else:
-                        # Default to yesterday if no date
-                        email_date = (datetime.now() - timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
-                    
-                    # Get sender
-                    sender = msg.get("From", "Unknown")
-
-                    body_text = email_content["body"] or ""
-                    
-                    # Strip HTML tags for preview
-                    clean_text = re.sub(r'<[^>]+>', '', body_text)
-                    clean_text = re.sub(r'\s+', ' ', clean_text).strip()
-                    
-                    # Check if already processed
-                    app_info = None
-                    existing_app = existing_map.get(email_id.decode())
-                    if existing_app:
-                        app_info = {
-                            "status": existing_app.status,
-                            "company": existing_app.company_name,
-                            "position": existing_app.position,
-                            "id": existing_app.id
-                        }
-                    
-                    # Get Message-ID for email linking
-                    message_id = msg.get("Message-ID", "")
-                    
-                    emails.append({
-                        "id": email_id.decode(),
-                        "subject": email_content['subject'],
-                        "from": sender,
-                        "date": email_date.isoformat() if isinstance(email_date, datetime) else str(email_date),
-                        "preview": clean_text[:200] + "..." if len(clean_text) > 200 else clean_text,
-                        "body": body_text,
-                        "application": app_info,
-                        "message_id": message_id
-                    })
-            except Exception as e:
-                print(f"Error processing email {email_id}: {e}")
-                continue
+        # Visible text is used both for classification and for the preview
+        body_text = email_content["body"] or ""
+        clean_text = html_to_text(body_text)
+        
+        # Check if email is job-related
+        match = self.is_job_related(email_content, msg.get("From", ""), clean_text, review_classifier)
+        if not match:
+            message_ledger.record(db, message_ledger.message_key(msg), email_id, message_ledger.NOT_JOB,
+                                  digest=message_ledger.content_hash(email_content))
+            return None
+        
+        email_date = self.get_email_date(msg)
+        
+        # Get sender
+        sender = msg.get("From", "Unknown")
         
-        mail.close()
-        mail.logout()
+        # Single-line preview
+        clean_text = clean_text.replace("\n", " ")
+        preview = clean_text[:200] + "..." if len(clean_text) > 200 else clean_text
         
-        # Return emails sorted by date (newest first) - already reversed by processing order
-        # But also sort by date to ensure proper ordering
+        # Check if already processed
+        app_info = None
+        existing_app = existing_map.get(email_id)
+        if existing_app:
+            app_info = {
+                "status": existing_app.status,
+                "company": existing_app.company_name,
+                "position": existing_app.position,
+                "id": existing_app.id
+            }
+        
+        # Get Message-ID for email linking
+        message_id = msg.get("Message-ID", "")
+        
+        row = {
+            "id": email_id,
+            "subject": email_content['subject'],
+            "from": sender,
+            "date": email_date.isoformat(),
+            "preview": preview,
+            # Lets clients offer "show full email" without downloading the body
+            "has_more": len(body_text) > len(preview),
+            "application": app_info,
+            "message_id": message_id,
+            "matched_rule": match
+        }
+        if include_body:
+            row["body"] = body_text
+        return row
+    
+    def list_emails(self, db: Session, days_back: int = 0, limit: int = 50, unread_only: bool = False,
+                    include_body: bool = True) -> List[Dict]:
+        """List emails from today (or last N days), optionally only unread emails"""
+        email_ids, uidvalidity = self.search_emails(days_back, limit, unread_only)
+        emails = list(self.iter_emails(db, email_ids, uidvalidity, include_body))
+        
+        # Return emails sorted by date (newest first)
         emails.sort(key=lambda x: x.get('date', ''), reverse=True)
         
         return emails
     
-    def process_single_email(self, email_id: str, db: Session) -> Optional[Dict]:
-        """Process a single email and extract information, check for rejections"""
-        mail = None
+    def get_email_body(self, email_id: str) -> Optional[str]:
+        """Body of a single email (by UID), loaded on demand; None if it no longer exists"""
+        raw = self.load_messages([email_id]).get(email_id)
+        if raw is None:
+            return None
+        return self.parse_email_content(mime_parser.parse_message(raw))["body"] or ""
+    
+    def load_messages(self, email_ids: List[str], mailbox: str = "INBOX") -> Dict[str, bytes]:
+        """
+        Raw messages for `email_ids` (UIDs). Emails in the local cache cost no IMAP
+        traffic; all others are downloaded over a single pooled session.
+        """
+        uids = [email_id.encode() for email_id in email_ids]
+        found = message_cache.get_many(mailbox, uids)
+        missing = [uid for uid in uids if uid not in found]
+        if missing:
+            with imap_pool.session(mailbox) as mail:
+                message_cache.observe_uidvalidity(mailbox, self.get_uidvalidity(mail, mailbox))
+                fetched = self.download_messages(mail, missing)
+            message_cache.put_many(mailbox, fetched)
+            found.update(fetched)
+        return {uid.decode(): raw for uid, raw in found.items()}
+    
+    def analyze_email(self, email_id: str, email_body: bytes, use_llm_cache: bool = True) -> Optional[Dict]:
+        """Parse an email and extract application details (no database access, safe to run in threads)"""
+        prepared = self.prepare_analysis(email_body)
+        # Otherwise, use LLM extraction
+        llm_data = None if prepared[2] else self.extract_with_llm(prepared[1], use_cache=use_llm_cache)
+        return self.finish_analysis(email_id, prepared, llm_data)
+    
+    async def aanalyze_email(self, email_id: str, email_body: bytes, use_llm_cache: bool = True) -> Optional[Dict]:
+        """analyze_email with the LLM step on the async Ollama client"""
+        prepared = self.prepare_analysis(email_body)
+        llm_data = None if prepared[2] else await self.aextract_with_llm(prepared[1], use_cache=use_llm_cache)
+        return self.finish_analysis(email_id, prepared, llm_data)
+    
+    def prepare_analysis(self, email_body: bytes) -> Tuple:
+        """(msg, email_content, rule-based extraction or None) for a raw email"""
+        msg = mime_parser.parse_message(email_body)
+        
+        email_content = self.parse_email_content(msg)
+        
+        # First, try the rule-based extractors for known ATS senders
+        return msg, email_content, self.extract_with_rules(email_content, msg)
+    
+    def finish_analysis(self, email_id: str, prepared: Tuple, llm_data: Optional[Dict]) -> Optional[Dict]:
+        """The analyze_email result for a prepare_analysis tuple and the LLM's extraction (used without a rule hit)"""
+        msg, email_content, rule_data = prepared
+        if rule_data:
+            return self.analysis_result(email_id, msg, email_content, rule_data, rule_data.get('source'))
+        return self.analysis_result(email_id, msg, email_content, llm_data, "llm")
+    
+    def analysis_result(self, email_id: str, msg, email_content: Dict[str, str],
+                        extracted_data: Optional[Dict], extractor: Optional[str]) -> Optional[Dict]:
+        """The analyze_email result for an email's extracted data"""
+        if not extracted_data:
+            return None
+        
+        email_date = self.get_email_date(msg)
+        
+        # Check if it's a rejection
+        is_rejection = (
+            (extracted_data.get('status') or '').lower() == 'rejected' or
+            'reject' in email_content['subject'].lower() or
+            'reject' in email_content['body'].lower() or
+            extracted_data.get('rejection_date') is not None
+        )
+        
+        return {
+            "email_id": email_id,
+            "subject": email_content['subject'],
+            "email_date": email_date.isoformat(),
+            "extracted_data": extracted_data,
+            "is_rejection": is_rejection,
+            "extractor": extractor,
+            "content_hash": message_ledger.content_hash(email_content),
+            "message_key": message_ledger.message_key(msg),
+            "sender": msg.get("From"),
+        }
+    
+    def analyze_followup(self, email_id: str, email_body: bytes, application: Application) -> Dict:
+        """analyze_email for a reply in the thread of a known application; no extractor or LLM runs"""
+        msg = mime_parser.parse_message(email_body)
+        email_content = self.parse_email_content(msg)
+        extracted_data = self.followup_data(email_content, application)
+        return {
+            "email_id": email_id,
+            "subject": email_content['subject'],
+            "email_date": self.get_email_date(msg).isoformat(),
+            "extracted_data": extracted_data,
+            "is_rejection": extracted_data['status'] == "rejected",
+            "extractor": "thread",
+            "content_hash": message_ledger.content_hash(email_content),
+            "message_key": message_ledger.message_key(msg),
+            "matched_application_id": application.id,
+            "thread_match": True,
+        }
+    
+    def find_thread_application(self, db: Session, email_body: bytes) -> Optional[Application]:
+        """Application whose thread the email replies to, from its In-Reply-To / References headers"""
+        return thread_index.find_application(db, thread_index.references(mime_parser.parse_headers(email_body)))
+    
+    def find_rejection_match(self, extracted_data: Dict, db: Session,
+                             email_date: Optional[str] = None) -> Optional[Application]:
+        """Find the application a rejection email refers to (scored on company, position and date)"""
+        if not extracted_data.get('company_name'):
+            return None
+        
+        return company_matcher.find_match(
+            db,
+            extracted_data['company_name'],
+            extracted_data.get('position'),
+            datetime.fromisoformat(email_date) if email_date else None,
+        )
+    
+    def record_result(self, db: Session, message_key: Optional[str], email_id: str, result: Optional[Dict]) -> None:
+        """Save the outcome of analyze_email in the processed ledger"""
+        if result and result["extracted_data"].get('company_name'):
+            message_ledger.record(db, message_key, email_id, message_ledger.EXTRACTED,
+                                  result.get("extractor"), result.get("content_hash"))
+        else:
+            message_ledger.record(db, message_key, email_id, message_ledger.NO_DATA,
+                                  result.get("extractor") if result else None,
+                                  result.get("content_hash") if result else None)
+        db.commit()
+    
+    def process_single_email(self, email_id: str, db: Session, force: bool = False) -> Optional[Dict]:
+        """
+        Process a single email and extract information, check for rejections.
+        Emails the ledger already has as unrelated or unparseable are skipped unless `force` is set;
+        a forced run also asks the LLM again instead of reusing a cached answer.
+        """
         try:
-            mail = self.connect_email()
-            mail.select("INBOX")
-            
-            status, msg_data = mail.fetch(email_id.encode(), "(RFC822)")
-            email_body = msg_data[0][1]
-            msg = email.message_from_bytes(email_body)
-            
-            email_content = self.parse_email_content(msg)
-            
-            # First, try to extract LinkedIn application (special case)
-            extracted_data = self.extract_linkedin_application(email_content, msg)
-            
-            # If not a LinkedIn email, use LLM extraction
-            if not extracted_data:
-                extracted_data = self.extract_with_llm(email_content)
-            
-            if not extracted_data:
+            started = self.start_single_email(db, email_id, force)
+            if started is None:
                 return None
-            
-            # Get email date
-            email_date = msg.get("Date")
-            if email_date:
-                try:
-                    from email.utils import parsedate_to_datetime
-                    email_date = parsedate_to_datetime(email_date)
-                    # Convert to naive datetime and set to midnight to use just the date
-                    if email_date.tzinfo:
-                        email_date = email_date.replace(tzinfo=None)
-                    email_date = email_date.replace(hour=0, minute=0, second=0, microsecond=0)
-                except:
-                    # Fallback to yesterday if parsing fails
-                    email_date = (datetime.now() - timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
-            else:
-                # Default to yesterday if no date
-                email_date = (datetime.now() - timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
-            
-            # Check if it's a rejection
-            is_rejection = (
-                extracted_data.get('status', '').lower() == 'rejected' or
-                'reject' in email_content['subject'].lower() or
-                'reject' in email_content['body'].lower() or
-                extracted_data.get('rejection_date') is not None
-            )
-            
-            # If rejection, try to match with existing application
+            email_body, message_key, thread_application, result = started
+            if result is None:
+                result = self.analyze_email(email_id, email_body, use_llm_cache=not force)
+            return self.finish_single_email(db, message_key, email_id, result, thread_application)
+        except Exception as e:
+            return self.single_email_failed(email_id, e)
+    
+    async def aprocess_single_email(self, email_id: str, db: Session, force: bool = False) -> Optional[Dict]:
+        """
+        process_single_email for async endpoints: IMAP and database work run on a worker
+        thread and the LLM call on the async client, so no thread is held while the model works.
+        """
+        try:
+            started = await asyncio.to_thread(self.start_single_email, db, email_id, force)
+            if started is None:
+                return None
+            email_body, message_key, thread_application, result = started
+            if result is None:
+                result = await self.aanalyze_email(email_id, email_body, use_llm_cache=not force)
+            return await asyncio.to_thread(self.finish_single_email, db, message_key, email_id, result,
+                                           thread_application)
+        except Exception as e:
+            return self.single_email_failed(email_id, e)
+    
+    def start_single_email(self, db: Session, email_id: str,
+                           force: bool) -> Optional[Tuple[bytes, Optional[str], Optional[Application], Optional[Dict]]]:
+        """
+        Steps of process_single_email before the LLM: (raw email, Message-ID, thread application,
+        follow-up result), or None to skip the email. The result is None unless the LLM is not needed.
+        """
+        # Emails that were already listed come from the local cache with no IMAP traffic
+        email_body = self.load_messages([email_id]).get(email_id)
+        if email_body is None:
+            return None
+        
+        found = self.single_email_state(db, email_id, email_body, force)
+        if found is None:
+            return None
+        message_key, thread_application = found
+        
+        # Replies in the thread of a known application are linked directly, without the LLM
+        followup = self.analyze_followup(email_id, email_body, thread_application) if thread_application else None
+        return email_body, message_key, thread_application, followup
+    
+    def single_email_failed(self, email_id: str, error: Exception) -> None:
+        """Outcome of a process_single_email call that raised `error`"""
+        print(f"Error processing email {email_id}: {error}")
+        # Re-raise authentication errors so they can be handled properly
+        if "authentication failed" in str(error).lower():
+            raise error
+        return None
+    
+    def single_email_state(self, db: Session, email_id: str, email_body: bytes,
+                           force: bool) -> Optional[Tuple[Optional[str], Optional[Application]]]:
+        """(Message-ID, application whose thread it replies to) for an email, or None to skip it"""
+        message_key = message_ledger.raw_message_key(email_body)
+        if not force:
+            entry = message_ledger.lookup(db, [message_key]).get(message_key)
+            if entry and entry.outcome in (message_ledger.NOT_JOB, message_ledger.NO_DATA):
+                print(f"Skipping email {email_id}: already processed ({entry.outcome})")
+                return None
+        return message_key, self.find_thread_application(db, email_body)
+    
+    def finish_single_email(self, db: Session, message_key: Optional[str], email_id: str,
+                            result: Optional[Dict], thread_application: Optional[Application]) -> Optional[Dict]:
+        """Record a processed email in the ledger and match rejections to their application"""
+        self.record_result(db, message_key, email_id, result)
+        if not result:
+            return None
+        
+        # If rejection, try to match with existing application
+        if not thread_application:
             matched_application = None
-            if is_rejection and extracted_data.get('company_name'):
-                # Try to find matching application
-                matched_application = db.query(Application).filter(
-                    Application.company_name.ilike(f"%{extracted_data['company_name']}%")
-                ).first()
-                
-                if not matched_application and extracted_data.get('position'):
-                    # Try matching by position
-                    matched_application = db.query(Application).filter(
-                        Application.position.ilike(f"%{extracted_data['position']}%")
-                    ).first()
+            if result["is_rejection"]:
+                matched_application = self.find_rejection_match(result["extracted_data"], db, result["email_date"])
+            result["matched_application_id"] = matched_application.id if matched_application else None
+        
+        return result
+    
+    def analyze_emails(self, email_ids: List[str], raw_messages: Dict[str, bytes], db: Session,
+                       max_workers: Optional[int] = None) -> Iterator[Tuple[str, Optional[Dict]]]:
+        """
+        Bulk counterpart of process_single_email for already loaded messages.
+        Extraction runs on up to `max_workers` threads; (email_id, result) pairs are
+        yielded as each email finishes, with None for emails that could not be processed.
+        Database lookups stay on the calling thread.
+        """
+        # Emails the ledger already has as unrelated or unparseable are not sent to the LLM again
+        message_keys = {email_id: message_ledger.raw_message_key(raw) for email_id, raw in raw_messages.items()}
+        ledger = message_ledger.lookup(db, message_keys.values())
+        pending = []
+        for email_id in email_ids:
+            entry = ledger.get(message_keys.get(email_id))
+            if email_id not in raw_messages or (entry and entry.outcome in (message_ledger.NOT_JOB, message_ledger.NO_DATA)):
+                yield email_id, None
+                continue
             
-            result = {
-                "email_id": email_id,
-                "email_date": email_date.isoformat(),
-                "extracted_data": extracted_data,
-                "is_rejection": is_rejection,
-                "matched_application_id": matched_application.id if matched_application else None
+            # Replies in the thread of a known application need no extraction at all
+            thread_application = self.find_thread_application(db, raw_messages[email_id])
+            if not thread_application:
+                pending.append(email_id)
+                continue
+            try:
+                result = self.analyze_followup(email_id, raw_messages[email_id], thread_application)
+                self.record_result(db, message_keys[email_id], email_id, result)
+            except Exception as e:
+                print(f"Error processing email {email_id}: {e}")
+                result = None
+            yield email_id, result
+        
+        max_workers = max_workers or settings.email_llm_workers
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # Parse everything first; rule hits are done, the rest share LLM calls
+            prepared = {}
+            futures = {
+                executor.submit(self.prepare_analysis, raw_messages[email_id]): email_id
+                for email_id in pending
             }
+            for future in as_completed(futures):
+                email_id = futures[future]
+                try:
+                    msg, email_content, extracted_data = future.result()
+                except Exception as e:
+                    print(f"Error processing email {email_id}: {e}")
+                    yield email_id, None
+                    continue
+                if extracted_data:
+                    yield email_id, self.bulk_result(db, message_keys[email_id], email_id, lambda: self.analysis_result(
+                        email_id, msg, email_content, extracted_data, extracted_data.get('source')))
+                else:
+                    prepared[email_id] = (msg, email_content)
             
-            return result
-            
+            groups = self.llm_batches([(email_id, content) for email_id, (_, content) in prepared.items()])
+            futures = {executor.submit(self.extract_many_with_llm, group): group for group in groups}
+            for future in as_completed(futures):
+                try:
+                    extracted = future.result()
+                except Exception as e:
+                    print(f"Error extracting emails {', '.join(email_id for email_id, _ in futures[future])}: {e}")
+                    extracted = None
+                for email_id, _ in futures[future]:
+                    if extracted is None:
+                        yield email_id, None
+                        continue
+                    msg, email_content = prepared[email_id]
+                    yield email_id, self.bulk_result(db, message_keys[email_id], email_id, lambda: self.analysis_result(
+                        email_id, msg, email_content, extracted.get(email_id), "llm"))
+    
+    def bulk_result(self, db: Session, message_key: Optional[str], email_id: str, analyze) -> Optional[Dict]:
+        """Record the result of `analyze()` for analyze_emails and match rejections to their application"""
+        try:
+            result = analyze()
+            self.record_result(db, message_key, email_id, result)
         except Exception as e:
             print(f"Error processing email {email_id}: {e}")
-            # Re-raise authentication errors so they can be handled properly
-            if "authentication failed" in str(e).lower():
-                raise
-            return None
-        finally:
-            if mail:
-                try:
-                    mail.close()
-                    mail.logout()
-                except:
-                    pass
-
+            result = None
+        
+        if result:
+            matched_application = None
+            if result["is_rejection"]:
+                matched_application = self.find_rejection_match(result["extracted_data"], db, result["email_date"])
+            result["matched_application_id"] = matched_application.id if matched_application else None
+        
+        return result
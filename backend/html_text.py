@@ -0,0 +1,33 @@
+"""
+HTML to visible-text conversion shared by classification, extraction and previews.
+"""
+import html
+import re
+
+_HIDDEN_RE = re.compile(r"<(script|style|head|title)\b[^>]*>.*?</\1\s*>", re.IGNORECASE | re.DOTALL)
+_COMMENT_RE = re.compile(r"<!--.*?-->", re.DOTALL)
+_BREAK_RE = re.compile(r"<\s*(?:br|/p|/div|/tr|/li|/h[1-6]|/table|/td)\b[^>]*>", re.IGNORECASE)
+_TAG_RE = re.compile(r"<[^>]+>")
+_SPACES_RE = re.compile(r"[ \t\r\f\v\xa0]+")
+_LOOKS_LIKE_HTML_RE = re.compile(r"<(?:html|head|body|style|script|div|p|br|table|span|a)\b", re.IGNORECASE)
+
+
+def looks_like_html(text: str) -> bool:
+    return bool(_LOOKS_LIKE_HTML_RE.search(text[:5000]))
+
+
+def html_to_text(body: str) -> str:
+    """
+    Visible text of an HTML body, one line per block element. Plain-text
+    bodies are returned with whitespace normalised.
+    """
+    if not body:
+        return ""
+    if looks_like_html(body):
+        body = _HIDDEN_RE.sub(" ", body)
+        body = _COMMENT_RE.sub(" ", body)
+        body = _BREAK_RE.sub("\n", body)
+        body = _TAG_RE.sub(" ", body)
+        body = html.unescape(body)
+    lines = (_SPACES_RE.sub(" ", line).strip() for line in body.split("\n"))
+    return "\n".join(line for line in lines if line)
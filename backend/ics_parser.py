@@ -0,0 +1,131 @@
+"""
+Minimal iCalendar (RFC 5545) reader for interview invitations.
+Only the fields the tracker needs are read from the first event: DTSTART,
+DTEND, SUMMARY, LOCATION and ORGANIZER, plus the calendar's METHOD. Times
+with a TZID or a trailing Z are converted to the server's local time; floating
+times are kept as written.
+"""
+import re
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+# Calendar methods that do not announce a (still) scheduled event
+IGNORED_METHODS = {"CANCEL", "REPLY", "DECLINECOUNTER"}
+
+_ESCAPES_RE = re.compile(r"\\([\\;,nN])")
+
+
+def _unfold(text: str) -> List[str]:
+    """Content lines with folded continuation lines joined back"""
+    lines: List[str] = []
+    for line in text.replace("\r\n", "\n").replace("\r", "\n").split("\n"):
+        if line[:1] in (" ", "\t") and lines:
+            lines[-1] += line[1:]
+        elif line:
+            lines.append(line)
+    return lines
+
+
+def _split(line: str) -> Tuple[str, Dict[str, str], str]:
+    """'DTSTART;TZID=Europe/Berlin:20261020T140000' -> ('DTSTART', {'TZID': 'Europe/Berlin'}, '20261020T140000')"""
+    # The value starts at the first colon outside a quoted parameter
+    in_quotes = False
+    for i, ch in enumerate(line):
+        if ch == '"':
+            in_quotes = not in_quotes
+        elif ch == ":" and not in_quotes:
+            head, value = line[:i], line[i + 1:]
+            break
+    else:
+        return line.upper(), {}, ""
+    name, *params = head.split(";")
+    parsed = {}
+    for param in params:
+        key, _, param_value = param.partition("=")
+        parsed[key.upper()] = param_value.strip('"')
+    return name.upper(), parsed, value
+
+
+def _text(value: str) -> str:
+    return _ESCAPES_RE.sub(lambda m: "\n" if m.group(1) in "nN" else m.group(1), value).strip()
+
+
+def parse_datetime(value: str, params: Dict[str, str]) -> Optional[datetime]:
+    """A DTSTART/DTEND value as a naive datetime in server local time (all-day events at midnight)"""
+    value = value.strip()
+    try:
+        if params.get("VALUE", "").upper() == "DATE" or len(value) == 8:
+            day = datetime.strptime(value[:8], "%Y%m%d").date()
+            return datetime.combine(day, datetime.min.time())
+        if value.endswith("Z"):
+            parsed = datetime.strptime(value[:-1], "%Y%m%dT%H%M%S").replace(tzinfo=timezone.utc)
+        else:
+            parsed = datetime.strptime(value[:15], "%Y%m%dT%H%M%S")
+            if params.get("TZID"):
+                try:
+                    parsed = parsed.replace(tzinfo=ZoneInfo(params["TZID"]))
+                except (ZoneInfoNotFoundError, ValueError):
+                    # e.g. Windows zone names from Outlook - keep the wall-clock time
+                    pass
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+
+def parse_event(text: str) -> Optional[Dict]:
+    """
+    The first VEVENT of a calendar as
+    {"method", "start", "end", "summary", "description", "location", "organizer_name", "organizer_email"},
+    or None if there is no event with a start time.
+    """
+    method = None
+    event: Optional[Dict] = None
+    depth = event_depth = 0
+    for line in _unfold(text):
+        name, params, value = _split(line)
+        if name == "BEGIN":
+            depth += 1
+            if value.upper() == "VEVENT" and event is None:
+                event = {"method": method, "start": None, "end": None, "summary": None, "description": None,
+                         "location": None, "organizer_name": None, "organizer_email": None}
+                event_depth = depth
+            continue
+        if name == "END":
+            if event is not None and depth == event_depth and value.upper() == "VEVENT":
+                break
+            depth -= 1
+            continue
+        if name == "METHOD":
+            method = value.strip().upper()
+            continue
+        if event is None or depth != event_depth:
+            # Calendar-level properties and nested components such as VALARM
+            continue
+        if name == "DTSTART":
+            event["start"] = parse_datetime(value, params)
+        elif name == "DTEND":
+            event["end"] = parse_datetime(value, params)
+        elif name == "SUMMARY":
+            event["summary"] = _text(value)
+        elif name == "DESCRIPTION":
+            event["description"] = _text(value) or None
+        elif name == "LOCATION":
+            event["location"] = _text(value) or None
+        elif name == "ORGANIZER":
+            address = value.strip()
+            if address.lower().startswith("mailto:"):
+                address = address[7:]
+            event["organizer_email"] = address.lower() or None
+            event["organizer_name"] = params.get("CN") or None
+
+    if event is None or event["start"] is None:
+        return None
+    return event
+
+
+def is_scheduled(event: Optional[Dict]) -> bool:
+    """Whether an event announces a meeting (not a cancellation or an attendee's reply)"""
+    return bool(event) and (event.get("method") or "REQUEST") not in IGNORED_METHODS
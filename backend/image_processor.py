@@ -1,134 +1,168 @@
+import asyncio
 import base64
-import ollama
 from typing import Dict, Optional
 import json
 import re
 from datetime import datetime
 
 from config import settings
+from llm_cache import acached_generate, cached_generate
+from llm_gateway import ollama_gateway
+from llm_scheduler import llm_scheduler
+
+IMAGE_PROMPT = """Analyze this job posting image and extract the following information. 
+Return a JSON object with these fields if available:
+- company_name: Name of the company
+- position: Job position/title
+- location: Job location (city, state, remote, etc.)
+- job_url: URL to job posting if visible
+- contact_email: Contact email if mentioned
+- salary_range: Salary range if mentioned
+- notes: Any additional relevant information from the posting
+
+Return ONLY valid JSON, no additional text. If information is not available, use null for that field."""
+
+# Used when the vision model fails (won't process the image, but won't crash)
+TEXT_FALLBACK_PROMPT = "Extract job information from text. Return JSON with company_name, position, location, job_url, contact_email, salary_range, notes. Use null for unavailable fields."
 
 class ImageProcessor:
-    def __init__(self):
-        self.ollama_client = ollama.Client(host=settings.ollama_base_url)
+    def __init__(self, llm_client=None, async_llm_client=None):
+        # The application-wide clients unless others are passed in
+        self.ollama_client = llm_client or ollama_gateway.client
+        self._async_ollama_client = async_llm_client
         # Use a vision model if available, otherwise fall back to regular model
         self.model = settings.ollama_model
         # Try vision-capable models first
         self.vision_models = ["llava", "bakllava", "llava:latest"]
+    
+    @property
+    def async_ollama_client(self):
+        return self._async_ollama_client or ollama_gateway.async_client
         
     def image_to_base64(self, image_path: str) -> str:
         """Convert image file to base64 string"""
         with open(image_path, "rb") as image_file:
             return base64.b64encode(image_file.read()).decode('utf-8')
     
-    def extract_from_image(self, image_path: str) -> Optional[Dict]:
-        """Extract job application information from an image using Ollama vision model"""
+    def find_vision_model(self) -> Optional[str]:
+        """Name of an installed vision-capable model, if any"""
         try:
-            # Read image data
-            with open(image_path, "rb") as image_file:
-                image_data = image_file.read()
+            # Listed once every few minutes, not on every upload
+            available_models = ollama_gateway.model_names()
             
-            prompt = """Analyze this job posting image and extract the following information. 
-Return a JSON object with these fields if available:
-- company_name: Name of the company
-- position: Job position/title
-- location: Job location (city, state, remote, etc.)
-- job_url: URL to job posting if visible
-- contact_email: Contact email if mentioned
-- salary_range: Salary range if mentioned
-- notes: Any additional relevant information from the posting
-
-Return ONLY valid JSON, no additional text. If information is not available, use null for that field."""
-
-            # Try to find an available vision model
-            vision_model_available = None
+            # Check for vision models
+            for vision_model_name in self.vision_models:
+                for available_model in available_models:
+                    if vision_model_name in available_model.lower():
+                        return available_model
+        except Exception as e:
+            print(f"Error checking for vision models: {e}")
+        return None
+    
+    def vision_unavailable(self) -> Dict:
+        # No vision model available
+        error_msg = (
+            "Vision model not available. To enable image processing:\n"
+            "1. Make sure Ollama is installed: https://ollama.ai\n"
+            "2. Install a vision model: ollama pull llava\n"
+            "3. Restart the application"
+        )
+        print(error_msg)
+        return {
+            "company_name": None,
+            "position": None,
+            "location": None,
+            "job_url": None,
+            "contact_email": None,
+            "salary_range": None,
+            "notes": error_msg
+        }
+    
+    def extract_from_image(self, image_path: str, use_cache: bool = True) -> Optional[Dict]:
+        """Extract job application information from an image using Ollama vision model; `use_cache=False` asks again"""
+        try:
+            request = self.image_request(image_path)
+            if request is None:
+                return self.vision_unavailable()
             try:
-                models_response = self.ollama_client.list()
-                available_models = [m['name'] for m in models_response.get('models', [])]
-                
-                # Check for vision models
-                for vision_model_name in self.vision_models:
-                    for available_model in available_models:
-                        if vision_model_name in available_model.lower():
-                            vision_model_available = available_model
-                            break
-                    if vision_model_available:
-                        break
+                return cached_generate(self.ollama_client, "image_extraction", use_cache,
+                                       parse=self.parse_image_response, **request)
             except Exception as e:
-                print(f"Error checking for vision models: {e}")
-            
-            # Use vision model if available, otherwise use regular model
-            if vision_model_available:
-                try:
-                    response = self.ollama_client.generate(
-                        model=vision_model_available,
-                        prompt=prompt,
-                        images=[image_data],
-                        format="json"
-                    )
-                except Exception as e:
-                    print(f"Error with vision model {vision_model_available}, trying regular model: {e}")
-                    # Fallback to regular model (won't process image, but won't crash)
-                    response = self.ollama_client.generate(
-                        model=self.model,
-                        prompt="Extract job information from text. Return JSON with company_name, position, location, job_url, contact_email, salary_range, notes. Use null for unavailable fields.",
-                        format="json"
-                    )
-            else:
-                # No vision model available
-                error_msg = (
-                    "Vision model not available. To enable image processing:\n"
-                    "1. Make sure Ollama is installed: https://ollama.ai\n"
-                    "2. Install a vision model: ollama pull llava\n"
-                    "3. Restart the application"
-                )
-                print(error_msg)
-                return {
-                    "company_name": None,
-                    "position": None,
-                    "location": None,
-                    "job_url": None,
-                    "contact_email": None,
-                    "salary_range": None,
-                    "notes": error_msg
-                }
-            
-            # Extract JSON from response
-            if isinstance(response, dict):
-                response_text = response.get('response', '').strip()
-            else:
-                response_text = str(response).strip()
-            
-            if not response_text:
-                return None
-            
-            # Try to extract JSON if wrapped in markdown code blocks
-            json_match = re.search(r'```json\s*(\{.*?\})\s*```', response_text, re.DOTALL)
+                print(f"Error with vision model {request['model']}, trying regular model: {e}")
+                response = llm_scheduler.generate(self.ollama_client, **self.fallback_request())
+            return self.parse_image_response(response)
+        except Exception as e:
+            print(f"Error extracting from image: {e}")
+            return None
+    
+    async def aextract_from_image(self, image_path: str, use_cache: bool = True) -> Optional[Dict]:
+        """extract_from_image on the async Ollama client; waiting for the model holds no thread"""
+        try:
+            # Reading the file and listing the models (an HTTP call when not cached yet) block
+            request = await asyncio.to_thread(self.image_request, image_path)
+            if request is None:
+                return self.vision_unavailable()
+            try:
+                return await acached_generate(self.async_ollama_client, "image_extraction", use_cache,
+                                              parse=self.parse_image_response, **request)
+            except Exception as e:
+                print(f"Error with vision model {request['model']}, trying regular model: {e}")
+                response = await llm_scheduler.agenerate(self.async_ollama_client, **self.fallback_request())
+            return self.parse_image_response(response)
+        except Exception as e:
+            print(f"Error extracting from image: {e}")
+            return None
+    
+    def image_request(self, image_path: str) -> Optional[Dict]:
+        """Arguments of the generate call on the vision model for an image, or None without a vision model"""
+        # Read image data
+        with open(image_path, "rb") as image_file:
+            image_data = image_file.read()
+        
+        vision_model_available = self.find_vision_model()
+        if not vision_model_available:
+            return None
+        return {"model": vision_model_available, "prompt": IMAGE_PROMPT, "images": [image_data], "format": "json"}
+    
+    def fallback_request(self) -> Dict:
+        """Arguments of the generate call on the regular model when the vision model fails"""
+        return {"model": self.model, "prompt": TEXT_FALLBACK_PROMPT, "format": "json"}
+    
+    def parse_image_response(self, response) -> Optional[Dict]:
+        """Job details from the model's answer to IMAGE_PROMPT, or None if it cannot be parsed"""
+        # Extract JSON from response
+        if isinstance(response, dict):
+            response_text = response.get('response', '').strip()
+        else:
+            response_text = str(response).strip()
+        
+        if not response_text:
+            return None
+        
+        # Try to extract JSON if wrapped in markdown code blocks
+        json_match = re.search(r'```json\s*(\{.*?\})\s*```', response_text, re.DOTALL)
+        if json_match:
+            response_text = json_match.group(1)
+        else:
+            # Try to find JSON object directly
+            json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
             if json_match:
-                response_text = json_match.group(1)
-            else:
-                # Try to find JSON object directly
-                json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-                if json_match:
-                    response_text = json_match.group(0)
-            
+                response_text = json_match.group(0)
+        
+        try:
             result = json.loads(response_text)
-            
-            # Ensure all fields are present
-            return {
-                "company_name": result.get('company_name'),
-                "position": result.get('position'),
-                "location": result.get('location'),
-                "job_url": result.get('job_url'),
-                "contact_email": result.get('contact_email'),
-                "salary_range": result.get('salary_range'),
-                "notes": result.get('notes')
-            }
-            
         except json.JSONDecodeError as e:
             print(f"Error parsing JSON from LLM response: {e}")
             print(f"Response was: {response_text[:500]}")
             return None
-        except Exception as e:
-            print(f"Error extracting from image: {e}")
-            return None
-
+        
+        # Ensure all fields are present
+        return {
+            "company_name": result.get('company_name'),
+            "position": result.get('position'),
+            "location": result.get('location'),
+            "job_url": result.get('job_url'),
+            "contact_email": result.get('contact_email'),
+            "salary_range": result.get('salary_range'),
+            "notes": result.get('notes')
+        }
@@ -0,0 +1,396 @@
+"""
+Batched IMAP FETCH helpers.
+Instead of one FETCH round trip per message, message numbers are packed into
+message sets (e.g. "1:50" or "3,7,9:12") and sent in chunks; the combined
+response is parsed back into per-message items.
+"""
+import base64
+import binascii
+import quopri
+import uuid
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from config import settings
+
+
+def message_set(ids: Iterable[bytes]) -> str:
+    """Compress message numbers into an IMAP message set, e.g. [1,2,3,7] -> '1:3,7'"""
+    numbers = sorted({int(i) for i in ids})
+    ranges = []
+    start = prev = None
+    for n in numbers:
+        if start is None:
+            start = prev = n
+        elif n == prev + 1:
+            prev = n
+        else:
+            ranges.append((start, prev))
+            start = prev = n
+    if start is not None:
+        ranges.append((start, prev))
+    return ",".join(str(a) if a == b else f"{a}:{b}" for a, b in ranges)
+
+
+def chunked(ids: List[bytes], chunk_size: int) -> Iterator[List[bytes]]:
+    for i in range(0, len(ids), chunk_size):
+        yield ids[i:i + chunk_size]
+
+
+class _ResponseReader:
+    """Minimal parser for FETCH response data as returned by imaplib"""
+
+    def __init__(self, data: List):
+        text_parts = []
+        self.literals: List[bytes] = []
+        for part in data:
+            if isinstance(part, tuple):
+                # Text up to "{n}" followed by the n literal bytes; the line continues afterwards
+                text_parts.append(part[0])
+                self.literals.append(part[1])
+            else:
+                # A plain bytes element always ends a response line
+                text_parts.append(part + b" ")
+        self.text = b"".join(text_parts)
+        self.pos = 0
+        self.literal_index = 0
+
+    def _skip_space(self):
+        while self.pos < len(self.text) and self.text[self.pos:self.pos + 1] in (b" ", b"\r", b"\n"):
+            self.pos += 1
+
+    def at_end(self) -> bool:
+        self._skip_space()
+        return self.pos >= len(self.text)
+
+    def read(self):
+        self._skip_space()
+        ch = self.text[self.pos:self.pos + 1]
+        if ch == b"(":
+            self.pos += 1
+            items = []
+            while True:
+                self._skip_space()
+                if self.pos >= len(self.text):
+                    return items
+                if self.text[self.pos:self.pos + 1] == b")":
+                    self.pos += 1
+                    return items
+                items.append(self.read())
+        if ch == b")":
+            # Stray closing paren (e.g. the tail of a truncated response)
+            self.pos += 1
+            return None
+        if ch == b'"':
+            return self._read_quoted()
+        if ch == b"{":
+            end = self.text.index(b"}", self.pos)
+            self.pos = end + 1
+            literal = self.literals[self.literal_index]
+            self.literal_index += 1
+            return literal
+        return self._read_atom()
+
+    def _read_quoted(self) -> bytes:
+        self.pos += 1
+        out = bytearray()
+        while self.pos < len(self.text):
+            ch = self.text[self.pos:self.pos + 1]
+            if ch == b"\\":
+                out += self.text[self.pos + 1:self.pos + 2]
+                self.pos += 2
+                continue
+            self.pos += 1
+            if ch == b'"':
+                break
+            out += ch
+        return bytes(out)
+
+    def _read_atom(self) -> Optional[bytes]:
+        start = self.pos
+        depth = 0
+        while self.pos < len(self.text):
+            ch = self.text[self.pos:self.pos + 1]
+            if ch == b"[":
+                depth += 1
+            elif ch == b"]":
+                depth -= 1
+            elif depth == 0 and ch in (b" ", b"(", b")", b"\r", b"\n"):
+                break
+            self.pos += 1
+        atom = self.text[start:self.pos]
+        return None if atom.upper() == b"NIL" else atom
+
+
+def parse_fetch_response(data: List) -> List[Tuple[bytes, Dict[str, object]]]:
+    """
+    Parse imaplib FETCH data into [(message number, {ITEM: value})].
+    Item names are upper-cased strings such as 'RFC822', 'UID' or
+    'BODY[HEADER.FIELDS (SUBJECT FROM)]'; literal values are bytes.
+    """
+    reader = _ResponseReader([part for part in data if part is not None])
+    results = []
+    while not reader.at_end():
+        number = reader.read()
+        items = reader.read()
+        if not isinstance(items, list):
+            continue
+        fields = {}
+        for i in range(0, len(items) - 1, 2):
+            name = items[i]
+            if isinstance(name, bytes):
+                fields[name.decode("ascii", "replace").upper()] = items[i + 1]
+        results.append((number, fields))
+    return results
+
+
+def iter_fetch(mail, ids: List[bytes], items: str = "(RFC822)", chunk_size: Optional[int] = None,
+               uid: bool = False) -> Iterator[Tuple[bytes, Dict[str, object]]]:
+    """
+    Fetch `items` for `ids` with one FETCH per chunk, yielding (id, items).
+    With `uid=True` the ids are UIDs, UID FETCH is used and results are keyed by UID.
+    """
+    chunk_size = chunk_size or settings.imap_fetch_chunk_size
+    for chunk in chunked(list(ids), chunk_size):
+        if uid:
+            status, data = mail.uid("FETCH", message_set(chunk), items)
+        else:
+            status, data = mail.fetch(message_set(chunk), items)
+        if status != "OK":
+            print(f"FETCH failed for {len(chunk)} messages: {data}")
+            continue
+        for number, fields in parse_fetch_response(data):
+            if uid:
+                # Servers may interleave unsolicited FETCH responses without a UID
+                number = fields.get("UID")
+                if not isinstance(number, bytes):
+                    continue
+            yield number, fields
+
+
+def fetch_messages(mail, ids: List[bytes], chunk_size: Optional[int] = None,
+                   uid: bool = False) -> Dict[bytes, bytes]:
+    """Fetch full RFC822 messages for `ids` in batches, returning {id: raw bytes}"""
+    messages = {}
+    for number, fields in iter_fetch(mail, ids, "(RFC822)", chunk_size, uid):
+        raw = fields.get("RFC822")
+        if isinstance(raw, bytes):
+            messages[number] = raw
+    return messages
+
+
+# --- Two-phase fetch: headers + structure first, text parts only for candidates ---
+
+# Sender-related headers also let ATS extractors recognise the sending system,
+# and the threading headers let replies be linked to their application
+HEADER_FIELDS = "SUBJECT FROM DATE MESSAGE-ID SENDER REPLY-TO RETURN-PATH IN-REPLY-TO REFERENCES"
+
+
+def fetch_headers(mail, ids: List[bytes], chunk_size: Optional[int] = None,
+                  uid: bool = False) -> Dict[bytes, Dict]:
+    """
+    Phase one: fetch only the headers needed for filtering, the message size and
+    its MIME structure. Nothing is marked as read (BODY.PEEK).
+    Returns {id: {"headers": bytes, "size": int, "structure": list}}.
+    """
+    items = f"(RFC822.SIZE BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS ({HEADER_FIELDS})])"
+    results = {}
+    for number, fields in iter_fetch(mail, ids, items, chunk_size, uid):
+        headers = next((v for k, v in fields.items() if k.startswith("BODY[HEADER")), None)
+        if not isinstance(headers, bytes):
+            continue
+        try:
+            size = int(fields.get("RFC822.SIZE") or 0)
+        except ValueError:
+            size = 0
+        results[number] = {
+            "headers": headers,
+            "size": size,
+            "structure": fields.get("BODYSTRUCTURE"),
+        }
+    return results
+
+
+def _params(value) -> Dict[str, str]:
+    """Turn a BODYSTRUCTURE parameter list ("charset" "utf-8" ...) into a dict"""
+    if not isinstance(value, list):
+        return {}
+    params = {}
+    for i in range(0, len(value) - 1, 2):
+        if isinstance(value[i], bytes) and isinstance(value[i + 1], bytes):
+            params[value[i].decode("ascii", "replace").lower()] = value[i + 1].decode("ascii", "replace")
+    return params
+
+
+def _leaf_parts(structure, section: str = "") -> Iterator[Dict]:
+    """Yield every non-multipart part of a BODYSTRUCTURE with its section, type and disposition"""
+    if not isinstance(structure, list) or not structure:
+        return
+
+    if isinstance(structure[0], list):
+        # multipart: child parts first, then the subtype and extension data
+        index = 0
+        for child in structure:
+            if not isinstance(child, list):
+                break
+            index += 1
+            yield from _leaf_parts(child, f"{section}.{index}" if section else str(index))
+        return
+
+    if len(structure) < 7 or not isinstance(structure[0], bytes) or not isinstance(structure[1], bytes):
+        return
+    main_type = structure[0].decode("ascii", "replace").lower()
+    sub_type = structure[1].decode("ascii", "replace").lower()
+
+    # Text parts carry a line count, so their disposition sits one field later
+    disposition_index = 9 if main_type == "text" else 8
+    disposition = structure[disposition_index] if len(structure) > disposition_index else None
+    disposition_type = None
+    filename = ""
+    if isinstance(disposition, list) and disposition and isinstance(disposition[0], bytes):
+        disposition_type = disposition[0].decode("ascii", "replace").lower()
+        filename = _params(disposition[1] if len(disposition) > 1 else None).get("filename", "")
+    filename = filename or _params(structure[2]).get("name", "")
+
+    try:
+        size = int(structure[6] or 0)
+    except (TypeError, ValueError):
+        size = 0
+    yield {
+        "section": section or "1",
+        "type": main_type,
+        "subtype": sub_type,
+        "disposition": disposition_type,
+        "filename": filename,
+        "charset": _params(structure[2]).get("charset") or "utf-8",
+        "encoding": (structure[5] or b"7bit").decode("ascii", "replace").lower(),
+        "size": size,
+    }
+
+
+def _text_parts(structure) -> Iterator[Dict]:
+    """Yield the non-attachment text/html and text/plain parts of a BODYSTRUCTURE"""
+    for part in _leaf_parts(structure):
+        if part["type"] == "text" and part["subtype"] in ("html", "plain") and part["disposition"] != "attachment":
+            yield part
+
+
+def preferred_text_part(structure) -> Optional[Dict]:
+    """Pick the part the parser would use: HTML if present, otherwise plain text"""
+    parts = list(_text_parts(structure))
+    for subtype in ("html", "plain"):
+        for part in parts:
+            if part["subtype"] == subtype:
+                return part
+    return None
+
+
+def calendar_part(structure) -> Optional[Dict]:
+    """The first calendar invitation of a BODYSTRUCTURE (text/calendar, application/ics or an .ics file)"""
+    for part in _leaf_parts(structure):
+        content_type = f"{part['type']}/{part['subtype']}"
+        if content_type in ("text/calendar", "application/ics") or part["filename"].lower().endswith(".ics"):
+            return part
+    return None
+
+
+def decode_part(data: bytes, encoding: str, charset: str) -> str:
+    """Undo the transfer encoding of a fetched part and decode it with its declared charset"""
+    if encoding == "base64":
+        compact = b"".join(data.split())
+        # Partial fetches can cut a base64 quantum in half
+        compact = compact[:len(compact) - len(compact) % 4]
+        try:
+            data = base64.b64decode(compact)
+        except (binascii.Error, ValueError):
+            data = b""
+    elif encoding == "quoted-printable":
+        data = quopri.decodestring(data)
+    try:
+        return data.decode(charset, errors="replace")
+    except LookupError:
+        return data.decode("utf-8", errors="replace")
+
+
+def build_text_message(headers: bytes, body: str, subtype: str = "plain", calendar: str = "") -> bytes:
+    """
+    Assemble an RFC822 message from fetched headers and a decoded text body:
+    single-part, or multipart/mixed when a calendar invitation is attached.
+    """
+    headers = headers.rstrip(b"\r\n") + b"\r\nMIME-Version: 1.0"
+    text_part = (
+        f"Content-Type: text/{subtype}; charset=utf-8".encode("ascii")
+        + b"\r\nContent-Transfer-Encoding: 8bit\r\n\r\n"
+        + body.encode("utf-8", errors="replace")
+    )
+    if not calendar:
+        return headers + b"\r\n" + text_part
+
+    boundary = b"=_text_and_calendar_" + uuid.uuid4().hex.encode("ascii")
+    calendar_part = (
+        b"Content-Type: text/calendar; charset=utf-8\r\nContent-Transfer-Encoding: 8bit\r\n\r\n"
+        + calendar.encode("utf-8", errors="replace")
+    )
+    return (
+        headers
+        + b'\r\nContent-Type: multipart/mixed; boundary="' + boundary + b'"\r\n\r\n'
+        + b"--" + boundary + b"\r\n" + text_part
+        + b"\r\n--" + boundary + b"\r\n" + calendar_part
+        + b"\r\n--" + boundary + b"--\r\n"
+    )
+
+
+def _fetch_sections(mail, parts: Dict[bytes, Dict], max_part_size: int, chunk_size: Optional[int],
+                    uid: bool) -> Dict[bytes, str]:
+    """Download and decode one part per message ({id: part info}) with BODY.PEEK[n], capped at `max_part_size`"""
+    # Messages whose part lives at the same section can share a FETCH
+    by_section: Dict[str, List[bytes]] = {}
+    for number, part in parts.items():
+        by_section.setdefault(part["section"], []).append(number)
+
+    decoded = {}
+    for section, numbers in by_section.items():
+        items = f"(BODY.PEEK[{section}]<0.{max_part_size}>)"
+        for number, fields in iter_fetch(mail, numbers, items, chunk_size, uid):
+            part = parts.get(number)
+            if part is None:
+                continue
+            data = next((v for k, v in fields.items() if k.startswith(f"BODY[{section}]")), None)
+            decoded[number] = decode_part(data, part["encoding"], part["charset"]) if isinstance(data, bytes) else ""
+    return decoded
+
+
+def fetch_text_messages(mail, header_info: Dict[bytes, Dict], chunk_size: Optional[int] = None,
+                        max_part_size: Optional[int] = None, uid: bool = False) -> Dict[bytes, bytes]:
+    """
+    Phase two: download only the preferred text part of each message in
+    `header_info` (as returned by fetch_headers), plus its calendar invitation
+    if it has one, capped at `max_part_size` bytes each. Returns {id: raw message}.
+    """
+    max_part_size = max_part_size or settings.email_max_message_size
+
+    text_parts = {}
+    calendar_parts = {}
+    for number, info in header_info.items():
+        part = preferred_text_part(info.get("structure"))
+        if part is not None:
+            text_parts[number] = part
+        invite = calendar_part(info.get("structure"))
+        if invite is not None:
+            calendar_parts[number] = invite
+
+    bodies = _fetch_sections(mail, text_parts, max_part_size, chunk_size, uid)
+    calendars = _fetch_sections(mail, calendar_parts, max_part_size, chunk_size, uid) if calendar_parts else {}
+
+    messages = {}
+    for number, info in header_info.items():
+        # Messages with nothing readable (e.g. attachment-only) keep their headers for filtering
+        part = text_parts.get(number)
+        if part is not None and number not in bodies:
+            continue
+        messages[number] = build_text_message(
+            info["headers"],
+            bodies.get(number, ""),
+            part["subtype"] if part else "plain",
+            calendars.get(number, ""),
+        )
+    return messages
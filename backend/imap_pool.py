@@ -0,0 +1,238 @@
+"""
+Process-wide pool of authenticated IMAP sessions.
+Opening a session costs a TLS handshake plus LOGIN, so sessions are kept
+alive between requests (with periodic NOOPs) and handed out again instead
+of logging in for every API call.
+"""
+import imaplib
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+from config import settings
+
+
+def open_imap_connection(provider: Optional[str] = None, address: Optional[str] = None,
+                         password: Optional[str] = None, imap_server: Optional[str] = None,
+                         imap_port: Optional[int] = None) -> imaplib.IMAP4_SSL:
+    """Open and authenticate a new IMAP session; arguments default to the account in settings"""
+    if address is None:
+        provider = settings.email_provider
+        address = settings.email_address
+        # Use app password for Gmail, regular password for Outlook
+        password = settings.email_app_password or settings.email_password
+        imap_server = settings.imap_server
+        imap_port = settings.imap_port
+
+    if provider == "gmail":
+        imap_server = imap_server or "imap.gmail.com"
+        imap_port = imap_port or 993
+    elif provider == "outlook":
+        imap_server = imap_server or "outlook.office365.com"
+        imap_port = imap_port or 993
+    elif not imap_server:
+        raise ValueError(f"Unsupported email provider: {provider}")
+
+    if not address or not password:
+        raise ValueError(
+            "Email address and password must be set in .env file.\n"
+            "For Gmail: You need an App Password (not your regular password).\n"
+            "Generate one at: https://myaccount.google.com/apppasswords\n"
+            "Make sure 2FA is enabled first!"
+        )
+
+    mail = imaplib.IMAP4_SSL(imap_server, imap_port)
+
+    try:
+        # Remove spaces from app password if present
+        password = password.replace(" ", "")
+        mail.login(address, password)
+    except imaplib.IMAP4.error as e:
+        _safe_logout(mail)
+        error_msg = str(e)
+        if "AUTHENTICATIONFAILED" in error_msg or "Invalid credentials" in error_msg:
+            raise ValueError(
+                "Email authentication failed. Please check:\n"
+                "1. For Gmail: Use an App Password (not your regular password)\n"
+                "2. Generate App Password at: https://myaccount.google.com/apppasswords\n"
+                "3. Make sure 2FA is enabled on your Google account\n"
+                "4. Remove spaces from the app password in .env file\n"
+                "5. Restart the server after updating .env"
+            ) from e
+        raise
+    return mail
+
+
+def _safe_logout(mail) -> None:
+    try:
+        mail.logout()
+    except Exception:
+        pass
+
+
+# Errors that mean the session itself is unusable and must not go back to the pool
+CONNECTION_ERRORS = (imaplib.IMAP4.abort, OSError, EOFError)
+
+
+class IMAPConnectionPool:
+    """Bounded pool of logged-in IMAP sessions shared by all requests"""
+
+    def __init__(self, connect=open_imap_connection, size: int = 2,
+                 keepalive_interval: float = 240, max_idle: float = 3600,
+                 acquire_timeout: float = 60):
+        self._connect = connect
+        self.size = max(1, size)
+        self.keepalive_interval = keepalive_interval
+        self.max_idle = max_idle
+        self.acquire_timeout = acquire_timeout
+
+        self._idle: List[Tuple[imaplib.IMAP4, float, float]] = []  # (session, last used, last ping)
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._keepalive_thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+        self.logins = 0
+        self.reuses = 0
+        self.discarded = 0
+
+    @contextmanager
+    def session(self, mailbox: Optional[str] = None):
+        """
+        Lease a healthy session, optionally with `mailbox` selected.
+        Sessions that fail with a connection error are dropped; everything
+        else is returned to the pool for the next caller.
+        """
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise TimeoutError("Timed out waiting for a free IMAP session")
+
+        mail = None
+        broken = False
+        try:
+            mail = self._checkout()
+            if mailbox:
+                try:
+                    mail.select(mailbox)
+                except CONNECTION_ERRORS:
+                    # Stale session slipped past the health check - reconnect once
+                    self._discard(mail)
+                    mail = None
+                    mail = self._new_session()
+                    mail.select(mailbox)
+            yield mail
+        except CONNECTION_ERRORS:
+            broken = True
+            raise
+        finally:
+            if mail is not None:
+                if broken:
+                    self._discard(mail)
+                else:
+                    self._checkin(mail)
+            self._slots.release()
+
+    def connect(self) -> imaplib.IMAP4:
+        """A new session of this pool's account that is not pooled, for long-lived uses such as IDLE"""
+        return self._connect()
+
+    def _checkout(self) -> imaplib.IMAP4:
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                mail, _, last_ping = self._idle.pop()
+
+            # Sessions that have not talked to the server for a while get a NOOP before reuse
+            if time.monotonic() - last_ping < self.keepalive_interval or self._is_healthy(mail):
+                with self._lock:
+                    self.reuses += 1
+                return mail
+            self._discard(mail)
+
+        return self._new_session()
+
+    def _new_session(self) -> imaplib.IMAP4:
+        mail = self._connect()
+        with self._lock:
+            self.logins += 1
+        self._ensure_keepalive()
+        return mail
+
+    def _checkin(self, mail) -> None:
+        with self._lock:
+            if len(self._idle) < self.size:
+                now = time.monotonic()
+                self._idle.append((mail, now, now))
+                return
+        _safe_logout(mail)
+
+    def _discard(self, mail) -> None:
+        with self._lock:
+            self.discarded += 1
+        _safe_logout(mail)
+
+    @staticmethod
+    def _is_healthy(mail) -> bool:
+        try:
+            status, _ = mail.noop()
+            return status == "OK"
+        except Exception:
+            return False
+
+    def _ensure_keepalive(self) -> None:
+        if self._keepalive_thread and self._keepalive_thread.is_alive():
+            return
+        self._stop.clear()
+        self._keepalive_thread = threading.Thread(
+            target=self._keepalive_loop, name="imap-keepalive", daemon=True
+        )
+        self._keepalive_thread.start()
+
+    def _keepalive_loop(self) -> None:
+        """Ping idle sessions so the server does not drop them, and retire very old ones"""
+        while not self._stop.wait(self.keepalive_interval):
+            with self._lock:
+                idle, self._idle = self._idle, []
+
+            now = time.monotonic()
+            keep = []
+            for mail, last_used, _ in idle:
+                if now - last_used > self.max_idle or not self._is_healthy(mail):
+                    self._discard(mail)
+                else:
+                    keep.append((mail, last_used, now))
+
+            # Sessions checked in meanwhile count against the cap too
+            with self._lock:
+                room = max(0, self.size - len(self._idle))
+                keep, surplus = keep[:room], keep[room:]
+                self._idle.extend(keep)
+            for mail, _, _ in surplus:
+                self._discard(mail)
+
+    def stats(self) -> dict:
+        with self._lock:
+            idle = len(self._idle)
+        return {
+            "size": self.size,
+            "idle": idle,
+            "logins": self.logins,
+            "reuses": self.reuses,
+            "discarded": self.discarded,
+        }
+
+    def close(self) -> None:
+        """Log out every idle session and stop the keep-alive thread"""
+        self._stop.set()
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for mail, _, _ in idle:
+            _safe_logout(mail)
+
+
+imap_pool = IMAPConnectionPool(
+    size=settings.imap_pool_size,
+    keepalive_interval=settings.imap_keepalive_interval,
+    max_idle=settings.imap_max_idle,
+)
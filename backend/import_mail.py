@@ -0,0 +1,301 @@
+"""
+Bulk import of past email from an mbox file (e.g. Google Takeout) or a
+directory of .eml files, without going through IMAP.
+
+    python import_mail.py ~/Takeout/Mail/All\ mail.mbox
+    python import_mail.py ./exported-emails --workers 8 --no-llm
+
+Messages are streamed from disk; MIME parsing, classification and the
+rule-based extractors run in a process pool, and only emails no rule could
+handle are sent to the LLM. Applications are inserted in batches and every
+message is recorded in the processed ledger, so re-running an import (or a
+later IMAP sync of the same mail) skips what was already handled. Progress
+is saved after each batch and an interrupted import resumes where it stopped,
+seeking straight to the saved offset in an mbox file.
+"""
+import argparse
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+from config import settings
+from database import SessionLocal, init_db
+from llm_scheduler import BULK
+import message_ledger
+import mime_parser
+import thread_index
+from sender_companies import UNLEARNED_SOURCES, sender_company_cache
+
+# EmailProcessor of each worker process
+_worker_processor = None
+
+
+def _init_worker():
+    global _worker_processor
+    from email_processor import EmailProcessor
+    _worker_processor = EmailProcessor(llm_priority=BULK)
+
+
+def analyze_raw(raw: bytes) -> Dict:
+    """
+    Parse, classify and try the rule-based extractors on one raw message (runs in a worker).
+    The result carries the email content only when it still needs the LLM.
+    """
+    processor = _worker_processor
+    msg = mime_parser.parse_message(raw)
+    email_content = processor.parse_email_content(msg)
+    result = {
+        "message_key": message_ledger.message_key(msg),
+        "content_hash": message_ledger.content_hash(email_content),
+    }
+    # Messages without a Message-ID are recognised on a rerun by their content
+    result["ledger_key"] = result["message_key"] or f"hash:{result['content_hash']}"
+    if not processor.is_job_related(email_content, msg.get("From", "")):
+        result["outcome"] = processor.unrelated_outcome(email_content, msg.get("From", ""))
+        return result
+
+    result["email_date"] = processor.get_email_date(msg)
+    result["sender"] = msg.get("From")
+    result["references"] = thread_index.references(msg)
+    if result["references"]:
+        # Kept in case the reply belongs to a known application (see run_import)
+        result["reply_content"] = email_content
+    extracted_data = processor.extract_with_rules(email_content, msg)
+    if extracted_data:
+        result["extracted"] = extracted_data
+        result["extractor"] = extracted_data.get("source")
+    else:
+        result["content"] = email_content
+    return result
+
+
+def iter_messages(path: Path, position: int = 0) -> Iterator[Tuple[int, bytes]]:
+    """
+    (position, raw message) for the messages of an mbox file, or of every .eml file
+    below a directory (in a stable order), starting at `position`. A message's
+    position is where reading resumes after it: a byte offset in an mbox file,
+    the number of files read in a directory.
+    """
+    if path.is_dir():
+        eml_paths = sorted(path.rglob("*.eml"))
+        for index in range(position, len(eml_paths)):
+            yield index + 1, eml_paths[index].read_bytes()
+    else:
+        yield from _iter_mbox(path, position)
+
+
+def _iter_mbox(path: Path, offset: int) -> Iterator[Tuple[int, bytes]]:
+    """Messages of an mbox file from byte `offset` on, split on "From " lines as mailbox.mbox does"""
+    with open(path, "rb") as mbox_file:
+        mbox_file.seek(offset)
+        lines: List[bytes] = []
+        in_message = False
+        for line in mbox_file:
+            if line.startswith(b"From "):
+                if in_message:
+                    yield offset, _mbox_message(lines)
+                lines, in_message = [], True
+            elif in_message:
+                lines.append(line)
+            offset += len(line)
+        if in_message:
+            yield offset, _mbox_message(lines)
+
+
+def _mbox_message(lines: List[bytes]) -> bytes:
+    # The blank line after a message separates it from the next "From " line
+    if lines and lines[-1] in (b"\n", b"\r\n"):
+        lines = lines[:-1]
+    return b"".join(lines)
+
+
+def _load_progress(progress_path: Path, source: Path) -> Tuple[int, Optional[int]]:
+    """(messages done, position to resume reading at) saved for `source`"""
+    try:
+        progress = json.loads(progress_path.read_text())
+    except (OSError, ValueError):
+        return 0, 0
+    if progress.get("source") != str(source):
+        return 0, 0
+    # Progress files of older versions only have the count
+    return progress.get("done", 0), progress.get("position")
+
+
+def _save_progress(progress_path: Path, source: Path, done: int, position: int) -> None:
+    tmp_path = progress_path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps({"source": str(source), "done": done, "position": position}))
+    os.replace(tmp_path, progress_path)
+
+
+def _batches(messages: Iterator[Tuple[int, bytes]], size: int) -> Iterator[List[Tuple[int, bytes]]]:
+    while True:
+        batch = list(itertools.islice(messages, size))
+        if not batch:
+            return
+        yield batch
+
+
+def run_import(path: Path, workers: Optional[int] = None, batch_size: int = 200, use_llm: bool = True,
+               progress_path: Optional[Path] = None, restart: bool = False) -> Dict:
+    from email_processor import EmailProcessor
+
+    init_db()
+    progress_path = progress_path or Path(f"{str(path).rstrip(os.sep)}.import-progress.json")
+    skip, position = (0, 0) if restart else _load_progress(progress_path, path)
+    if skip:
+        print(f"Resuming after {skip} messages")
+
+    processor = EmailProcessor(llm_priority=BULK)
+    db = SessionLocal()
+    totals = {"messages": 0, "job_related": 0, "already_processed": 0, "llm_emails": 0, "llm_calls": 0,
+              "created": 0, "follow_ups_linked": 0, "llm_failed": 0}
+    started = time.monotonic()
+    done = skip
+    # Set once an LLM call failed: progress stays before the unrecorded emails so a rerun reads them again
+    held_back = False
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool, \
+                ThreadPoolExecutor(max_workers=settings.email_llm_workers) as llm_pool:
+            if position is None:
+                messages = itertools.islice(iter_messages(path), skip, None)
+            else:
+                messages = iter_messages(path, position)
+            for batch in _batches(messages, batch_size):
+                results = list(pool.map(analyze_raw, [raw for _, raw in batch], chunksize=8))
+
+                # Messages seen by an earlier import or sync are dropped
+                known = message_ledger.lookup(db, [r["ledger_key"] for r in results])
+                seen = set(known)
+                fresh = []
+                for result in results:
+                    if result["ledger_key"] in seen:
+                        totals["already_processed"] += 1
+                        continue
+                    seen.add(result["ledger_key"])
+                    fresh.append(result)
+
+                # Replies in the thread of an application imported or synced earlier just update it
+                for result in fresh:
+                    if result.get("references"):
+                        application = thread_index.find_application(db, result["references"])
+                        if application is not None:
+                            result["thread_application"] = application
+
+                # Only emails without a matching rule wait for the LLM
+                needs_llm = [r for r in fresh if "content" in r and "thread_application" not in r] if use_llm else []
+                # Short emails share a call (keys are positions in needs_llm)
+                groups = processor.llm_batches([(i, r["content"]) for i, r in enumerate(needs_llm)])
+                futures = [(group, llm_pool.submit(processor.extract_many_with_llm, group)) for group in groups]
+                for group, future in futures:
+                    try:
+                        extracted = future.result()
+                    except (ConnectionError, httpx.TransportError) as e:
+                        print(f"Error extracting {len(group)} emails, leaving them for the next import: {e}")
+                        for i, _ in group:
+                            needs_llm[i]["llm_failed"] = True
+                        totals["llm_failed"] += len(group)
+                        held_back = True
+                        continue
+                    for i, extracted_data in extracted.items():
+                        needs_llm[i]["extracted"] = extracted_data
+                        needs_llm[i]["extractor"] = "llm"
+                totals["llm_emails"] += len(needs_llm)
+                totals["llm_calls"] += len(groups)
+
+                created = []  # (application, Message-ID of the email that created it)
+                for result in fresh:
+                    if result.get("outcome") in message_ledger.UNRELATED_OUTCOMES:
+                        outcome = result["outcome"]
+                    elif "thread_application" in result:
+                        totals["job_related"] += 1
+                        totals["follow_ups_linked"] += 1
+                        application = result["thread_application"]
+                        extracted_data = processor.followup_data(result["reply_content"], application)
+                        processor.apply_followup(application, extracted_data, result["email_date"])
+                        thread_index.link(db, result["message_key"], application.id)
+                        outcome = message_ledger.EXTRACTED
+                        result["extractor"] = "thread"
+                    else:
+                        totals["job_related"] += 1
+                        extracted_data = result.get("extracted")
+                        if ("content" in result and not use_llm) or result.get("llm_failed"):
+                            # Left for a later import with the LLM enabled (or reachable)
+                            continue
+                        email_id = f"import/{result['ledger_key']}"
+                        existing = (processor.status_update_target(db, extracted_data, result["email_date"])
+                                    if extracted_data else None)
+                        if existing is not None:
+                            # A rejection or interview for an application imported or synced earlier
+                            outcome = message_ledger.EXTRACTED
+                            processor.apply_followup(existing, extracted_data, result["email_date"])
+                            thread_index.link(db, result["message_key"], existing.id)
+                            totals["follow_ups_linked"] += 1
+                        elif extracted_data and extracted_data.get("company_name"):
+                            outcome = message_ledger.EXTRACTED
+                            application = processor.build_application(email_id, extracted_data, result["email_date"],
+                                                                      result["sender"])
+                            db.add(application)
+                            if result.get("extractor") not in UNLEARNED_SOURCES:
+                                sender_company_cache.learn(db, result["sender"], application.company_name)
+                            created.append((application, result["message_key"]))
+                            totals["created"] += 1
+                        else:
+                            outcome = message_ledger.NO_DATA
+                    message_ledger.record(db, result["ledger_key"], None, outcome,
+                                          result.get("extractor"), result["content_hash"])
+
+                # One flush for the batch's new applications gives them ids for the thread links,
+                # so replies later in the import find them
+                db.flush()
+                for application, message_key in created:
+                    thread_index.link(db, message_key, application.id)
+                db.commit()
+                done += len(batch)
+                totals["messages"] += len(batch)
+                if not held_back:
+                    _save_progress(progress_path, path, done, batch[-1][0])
+
+                elapsed = time.monotonic() - started
+                print(f"{done} messages ({totals['messages'] / elapsed:.1f}/s), "
+                      f"{totals['job_related']} job-related, {totals['created']} applications created")
+    finally:
+        db.close()
+
+    if held_back:
+        print(f"{totals['llm_failed']} emails could not be extracted (Ollama unreachable?); "
+              f"run the import again to pick them up")
+    elapsed = time.monotonic() - started
+    totals["seconds"] = round(elapsed, 1)
+    totals["messages_per_second"] = round(totals["messages"] / elapsed, 1) if elapsed else 0.0
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import job application emails from an mbox file or a folder of .eml files")
+    parser.add_argument("path", type=Path, help="mbox file or directory containing .eml files")
+    parser.add_argument("--workers", type=int, default=None, help="parser processes (default: CPU count)")
+    parser.add_argument("--batch-size", type=int, default=200, help="messages per batch / commit")
+    parser.add_argument("--no-llm", action="store_true",
+                        help="only use the rule-based extractors (run again with --restart to send the rest to the LLM)")
+    parser.add_argument("--progress-file", type=Path, default=None, help="where to keep resume progress")
+    parser.add_argument("--restart", action="store_true", help="ignore saved progress and start from the beginning")
+    args = parser.parse_args()
+
+    if not args.path.exists():
+        parser.error(f"{args.path} does not exist")
+
+    totals = run_import(args.path, args.workers, args.batch_size, not args.no_llm, args.progress_file, args.restart)
+    print("\nImport finished:")
+    for name, value in totals.items():
+        print(f"  {name.replace('_', ' ')}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""
+Local store of LLM responses.
+Responses are kept zlib-compressed in a separate SQLite file, keyed by a hash
+of everything that determines them (model, prompt, images, format and
+options), so re-processing an email, re-uploading a screenshot or generating
+a resume for the same job description again returns at once instead of
+repeating inference. Entries expire after a TTL, and the least recently used
+are evicted when the store grows past its size limit.
+
+Call sites go through `cached_generate` (or `acached_generate` with an
+ollama.AsyncClient) and can bypass the cache per call (`use_cache=False`),
+e.g. when the user asks for a fresh answer. Call sites pass the parser of
+their answers, so only answers that parse are stored and a malformed one is
+asked for again instead of being replayed until it expires. Calls that reach
+the model are run by llm_scheduler with the caller's priority.
+"""
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from config import settings
+from llm_scheduler import INTERACTIVE, llm_scheduler
+
+
+def cache_key(model: str, prompt: str, images: Optional[Iterable] = None,
+              format: Optional[str] = None, options: Optional[Dict] = None) -> str:
+    """SHA-256 over the inputs of one generate call"""
+    digest = hashlib.sha256()
+    digest.update(json.dumps([model, prompt, format, options or {}], sort_keys=True, default=str).encode())
+    for image in images or ():
+        if isinstance(image, str):
+            image = image.encode()
+        # Length-prefixed so image boundaries cannot collide
+        digest.update(len(image).to_bytes(8, "big"))
+        digest.update(hashlib.sha256(image).digest())
+    return digest.hexdigest()
+
+
+def response_text(response: Any) -> str:
+    """The generated text of an ollama generate response (dict or response object)"""
+    if isinstance(response, dict):
+        return response.get("response") or ""
+    text = getattr(response, "response", None)
+    return text if isinstance(text, str) else str(response)
+
+
+class LLMCache:
+    def __init__(self, path: str, max_bytes: int, ttl: int, enabled: bool = True):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.enabled = enabled
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.bytes_saved = 0  # Response bytes served from the cache instead of generated
+        self.seconds_saved = 0.0  # Generation time of the responses served from the cache
+        self.sites: Dict[str, Dict[str, int]] = {}
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, model TEXT NOT NULL, site TEXT,"
+                " data BLOB NOT NULL, size INTEGER NOT NULL, duration REAL NOT NULL,"
+                " created_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_responses_last_access ON responses (last_access)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _count(self, site: str, field: str) -> None:
+        counts = self.sites.setdefault(site, {"hits": 0, "misses": 0, "bypassed": 0})
+        counts[field] += 1
+
+    def get(self, key: str, site: str = "other") -> Optional[str]:
+        """The cached response text for `key`, or None if missing or expired"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT data, duration, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            now = time.time()
+            if row is not None and self.ttl and now - row[2] > self.ttl:
+                db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                db.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                self._count(site, "misses")
+                return None
+            db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            db.commit()
+            text = zlib.decompress(row[0]).decode()
+            self.hits += 1
+            self._count(site, "hits")
+            self.bytes_saved += len(text.encode())
+            self.seconds_saved += row[1]
+            return text
+
+    def put(self, key: str, model: str, text: str, duration: float, site: str = "other") -> None:
+        """Store a response, then enforce the size limit"""
+        if not self.enabled or not text:
+            return
+        with self._lock:
+            db = self._db()
+            now = time.time()
+            data = zlib.compress(text.encode(), 6)
+            db.execute(
+                "INSERT OR REPLACE INTO responses (key, model, site, data, size, duration, created_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, model, site, data, len(data), duration, now, now),
+            )
+            db.commit()
+            self._evict(db)
+
+    def _evict(self, db: sqlite3.Connection) -> None:
+        if self.ttl:
+            db.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl,))
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total > self.max_bytes:
+            excess = total - self.max_bytes
+            victims = []
+            for rowid, size in db.execute("SELECT rowid, size FROM responses ORDER BY last_access"):
+                victims.append((rowid,))
+                excess -= size
+                if excess <= 0:
+                    break
+            db.executemany("DELETE FROM responses WHERE rowid = ?", victims)
+        db.commit()
+
+    def invalidate(self, key: str) -> None:
+        """Drop a stored response, e.g. one its caller could not parse"""
+        if not self.enabled:
+            return
+        with self._lock:
+            db = self._db()
+            db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            db.commit()
+
+    def bypass(self, site: str = "other") -> None:
+        with self._lock:
+            self.bypassed += 1
+            self._count(site, "bypassed")
+
+    def stats(self) -> Dict:
+        if not self.enabled:
+            return {"enabled": False}
+        with self._lock:
+            count, total = self._db().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "enabled": True,
+                "responses": count,
+                "bytes": total,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "bytes_saved": self.bytes_saved,
+                "seconds_saved": round(self.seconds_saved, 1),
+                "sites": {site: dict(counts) for site, counts in self.sites.items()},
+            }
+
+
+llm_cache = LLMCache(
+    settings.llm_cache_path,
+    settings.llm_cache_max_bytes,
+    settings.llm_cache_ttl,
+    settings.llm_cache_enabled,
+)
+
+
+def cached_generate(client, site: str, use_cache: bool = True, priority: int = INTERACTIVE,
+                    parse: Optional[Callable[[Any], Any]] = None, **kwargs) -> Any:
+    """
+    `client.generate(**kwargs)` through the response cache and the scheduler. A
+    cached answer is returned as {"response": text, "cached": True}; otherwise
+    the client's own response is returned and its text stored.
+    With `parse`, the caller gets `parse(response)` instead, and only answers it
+    accepts are stored; a cached answer it rejects is dropped and asked again.
+    """
+    key = _generate_key(kwargs)
+    if not use_cache or not llm_cache.enabled:
+        if llm_cache.enabled:
+            llm_cache.bypass(site)
+        return _parsed(parse, llm_scheduler.generate(client, priority, key, **kwargs))[0]
+
+    text = llm_cache.get(key, site)
+    if text is not None:
+        value, accepted = _parsed(parse, {"response": text, "cached": True})
+        if accepted:
+            return value
+        llm_cache.invalidate(key)
+
+    started = time.monotonic()
+    response = llm_scheduler.generate(client, priority, key, **kwargs)
+    value, accepted = _parsed(parse, response)
+    if accepted:
+        llm_cache.put(key, kwargs.get("model"), response_text(response), time.monotonic() - started, site)
+    return value
+
+
+async def acached_generate(async_client, site: str, use_cache: bool = True, priority: int = INTERACTIVE,
+                           parse: Optional[Callable[[Any], Any]] = None, **kwargs) -> Any:
+    """cached_generate for an ollama.AsyncClient; the SQLite work runs off the event loop"""
+    key = _generate_key(kwargs)
+    if not use_cache or not llm_cache.enabled:
+        if llm_cache.enabled:
+            llm_cache.bypass(site)
+        return _parsed(parse, await llm_scheduler.agenerate(async_client, priority, key, **kwargs))[0]
+
+    text = await asyncio.to_thread(llm_cache.get, key, site)
+    if text is not None:
+        value, accepted = _parsed(parse, {"response": text, "cached": True})
+        if accepted:
+            return value
+        await asyncio.to_thread(llm_cache.invalidate, key)
+
+    started = time.monotonic()
+    response = await llm_scheduler.agenerate(async_client, priority, key, **kwargs)
+    value, accepted = _parsed(parse, response)
+    if accepted:
+        await asyncio.to_thread(llm_cache.put, key, kwargs.get("model"), response_text(response),
+                                time.monotonic() - started, site)
+    return value
+
+
+def _parsed(parse: Optional[Callable[[Any], Any]], response: Any) -> Tuple[Any, bool]:
+    """
+    (what the caller gets for `response`, whether it may be stored). Parsers reject an
+    answer by returning None or {"error": ...}; one that raises stores nothing either.
+    """
+    if parse is None:
+        return response, True
+    value = parse(response)
+    return value, value is not None and not (isinstance(value, dict) and "error" in value)
+
+
+def _generate_key(kwargs: Dict) -> str:
+    return cache_key(kwargs.get("model"), kwargs.get("prompt", ""), kwargs.get("images"),
+                     kwargs.get("format"), kwargs.get("options"))
@@ -0,0 +1,101 @@
+"""
+Application-wide Ollama clients.
+One ollama.Client, and so one httpx connection pool to the Ollama host, is
+shared by every request, sync job and worker thread instead of each
+EmailProcessor, ImageProcessor and ResumeBuilder building its own. Async
+endpoints use the ollama.AsyncClient next to it, so waiting on inference only
+parks a coroutine instead of holding a worker thread. Connections are kept
+alive between calls; timeouts and pool limits come from the OLLAMA_* settings.
+The clients are created at startup and closed at shutdown; endpoints get them
+with Depends(get_llm_client) / Depends(get_async_llm_client).
+"""
+import threading
+import time
+from typing import Dict, List, Optional
+
+import httpx
+import ollama
+
+from config import settings
+
+# Seconds the list of installed models is reused
+_MODELS_MAX_AGE = 300
+
+
+def _client_options() -> Dict:
+    return {
+        "host": settings.ollama_base_url,
+        "timeout": httpx.Timeout(settings.ollama_timeout, connect=settings.ollama_connect_timeout),
+        "limits": httpx.Limits(
+            max_connections=settings.ollama_max_connections,
+            max_keepalive_connections=settings.ollama_max_connections,
+            keepalive_expiry=settings.ollama_keepalive_expiry,
+        ),
+    }
+
+
+class OllamaGateway:
+    def __init__(self):
+        self._client: Optional[ollama.Client] = None
+        self._async_client: Optional[ollama.AsyncClient] = None
+        self._lock = threading.Lock()
+        self._models: List[str] = []
+        self._models_at = 0.0
+
+    @property
+    def client(self) -> ollama.Client:
+        """The shared client, created on first use"""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = ollama.Client(**_client_options())
+        return self._client
+
+    @property
+    def async_client(self) -> ollama.AsyncClient:
+        """The shared async client, created on first use (from the app's event loop)"""
+        if self._async_client is None:
+            with self._lock:
+                if self._async_client is None:
+                    self._async_client = ollama.AsyncClient(**_client_options())
+        return self._async_client
+
+    def start(self) -> None:
+        self.client
+        self.async_client
+
+    def close(self) -> None:
+        with self._lock:
+            client, self._client = self._client, None
+        if client is not None:
+            # The httpx client behind ollama.Client
+            client._client.close()
+
+    async def aclose(self) -> None:
+        """Close both clients"""
+        with self._lock:
+            async_client, self._async_client = self._async_client, None
+        if async_client is not None:
+            await async_client._client.aclose()
+        self.close()
+
+    def model_names(self) -> List[str]:
+        """Names of the models installed on the Ollama host, refreshed every few minutes"""
+        if time.monotonic() - self._models_at > _MODELS_MAX_AGE:
+            response = self.client.list()
+            self._models = [model["name"] for model in response.get("models", [])]
+            self._models_at = time.monotonic()
+        return self._models
+
+
+ollama_gateway = OllamaGateway()
+
+
+def get_llm_client() -> ollama.Client:
+    """FastAPI dependency: the shared Ollama client"""
+    return ollama_gateway.client
+
+
+def get_async_llm_client() -> ollama.AsyncClient:
+    """FastAPI dependency: the shared async Ollama client"""
+    return ollama_gateway.async_client
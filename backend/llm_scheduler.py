@@ -0,0 +1,257 @@
+"""
+Coordination of all calls to the Ollama host.
+
+Every generate call takes a slot for its model first. At most OLLAMA_CONCURRENCY
+calls per model run at once (OLLAMA_CONCURRENCY_OVERRIDES sets other caps for
+single models), so the host is never asked for more than it can serve. Waiting
+calls are granted slots by priority: interactive requests (the dashboard
+waiting on an answer) go before bulk work such as email syncs and imports, so
+a background sync cannot hold up a resume generation.
+
+Identical calls (same model, prompt, images and options) that arrive while one
+is already running wait for that one's answer instead of computing it again.
+If the running call is cancelled (its caller went away), the waiting calls
+take over and compute the answer themselves.
+
+Works for threads (`generate`) and coroutines (`agenerate`); waiting
+coroutines never block the event loop.
+"""
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+from config import settings
+
+# Priority classes, most urgent first
+INTERACTIVE = 0
+BULK = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+
+def _concurrency_overrides(value: str) -> Dict[str, int]:
+    """'llava=1,llama3:70b=1' -> {'llava': 1, 'llama3:70b': 1}"""
+    overrides = {}
+    for item in value.split(","):
+        model, _, limit = item.strip().rpartition("=")
+        if model and limit.strip().isdigit():
+            overrides[model.strip()] = max(1, int(limit))
+    return overrides
+
+
+class _Abandoned(Exception):
+    """Set on a shared answer whose call was cancelled; the callers waiting for it compute it again"""
+
+
+class _Waiter:
+    __slots__ = ("priority", "enqueued", "grant", "cancelled")
+
+    def __init__(self, priority: int, grant: Callable[[], None]):
+        self.priority = priority
+        self.enqueued = time.monotonic()
+        self.grant = grant
+        self.cancelled = False
+
+
+class LLMScheduler:
+    def __init__(self, concurrency: int, overrides: Optional[Dict[str, int]] = None):
+        self.concurrency = max(1, concurrency)
+        self.overrides = overrides or {}
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._running: Dict[str, int] = {}
+        self._queues: Dict[str, List] = {}  # model -> heap of (priority, seq, waiter)
+        self._inflight: Dict[str, Future] = {}  # request key -> answer of the call computing it
+
+        self.max_queue_depth = 0
+        self._classes = {
+            priority: {"requests": 0, "coalesced": 0, "queued": 0, "waited": 0, "wait_total": 0.0, "wait_max": 0.0}
+            for priority in PRIORITY_NAMES
+        }
+
+    def limit(self, model: str) -> int:
+        return self.overrides.get(model, self.concurrency)
+
+    # --- slots ---
+
+    def _try_acquire(self, model: str, waiter: _Waiter) -> bool:
+        """Take a slot now, or queue `waiter` to be granted one later"""
+        with self._lock:
+            queue = self._queues.setdefault(model, [])
+            if not queue and self._running.get(model, 0) < self.limit(model):
+                self._running[model] = self._running.get(model, 0) + 1
+                return True
+            heapq.heappush(queue, (waiter.priority, next(self._seq), waiter))
+            self._classes[waiter.priority]["queued"] += 1
+            self.max_queue_depth = max(self.max_queue_depth, sum(len(q) for q in self._queues.values()))
+            return False
+
+    def _release(self, model: str) -> None:
+        """Hand the slot to the most urgent waiter, or free it"""
+        with self._lock:
+            queue = self._queues.get(model, [])
+            while queue:
+                waiter = heapq.heappop(queue)[2]
+                if not waiter.cancelled:
+                    break
+            else:
+                self._running[model] -= 1
+                return
+            wait = time.monotonic() - waiter.enqueued
+            counts = self._classes[waiter.priority]
+            counts["waited"] += 1
+            counts["wait_total"] += wait
+            counts["wait_max"] = max(counts["wait_max"], wait)
+        # The slot passes on without ever being free
+        waiter.grant()
+
+    def _acquire(self, model: str, priority: int) -> None:
+        granted = threading.Event()
+        if not self._try_acquire(model, _Waiter(priority, granted.set)):
+            granted.wait()
+
+    async def _aacquire(self, model: str, priority: int) -> None:
+        loop = asyncio.get_running_loop()
+        slot = loop.create_future()
+
+        def grant():
+            loop.call_soon_threadsafe(deliver)
+
+        def deliver():
+            if slot.cancelled():
+                # The caller gave up after the slot was handed over
+                self._release(model)
+            else:
+                slot.set_result(None)
+
+        waiter = _Waiter(priority, grant)
+        if self._try_acquire(model, waiter):
+            return
+        try:
+            await slot
+        except asyncio.CancelledError:
+            with self._lock:
+                # Cancelled after deliver() handed the slot over but before this coroutine resumed
+                granted = slot.done() and not slot.cancelled()
+                if not granted:
+                    waiter.cancelled = True
+            if granted:
+                self._release(model)
+            raise
+
+    # --- coalescing ---
+
+    def _join(self, key: Optional[str], priority: int, rejoin: bool = False):
+        """(answer of an identical call already running, None) or (None, future this call must fill)"""
+        with self._lock:
+            if not rejoin:
+                self._classes[priority]["requests"] += 1
+            if key is None:
+                return None, None
+            running = self._inflight.get(key)
+            if running is not None:
+                if not rejoin:
+                    self._classes[priority]["coalesced"] += 1
+                return running, None
+            own = Future()
+            self._inflight[key] = own
+            return None, own
+
+    def _finish(self, key: Optional[str], own: Optional[Future], response: Any = None,
+                error: Optional[BaseException] = None) -> None:
+        if own is None:
+            return
+        with self._lock:
+            self._inflight.pop(key, None)
+        if error is not None and not isinstance(error, Exception):
+            # Cancelled (or interrupted): not an answer to hand to the other callers
+            error = _Abandoned()
+        if error is not None:
+            own.set_exception(error)
+        else:
+            own.set_result(response)
+
+    # --- calls ---
+
+    def generate(self, client, priority: int = INTERACTIVE, key: Optional[str] = None, **kwargs) -> Any:
+        """`client.generate(**kwargs)` once a slot for the model is free; `key` identifies identical calls"""
+        running, own = self._join(key, priority)
+        while running is not None:
+            try:
+                return running.result()
+            except _Abandoned:
+                running, own = self._join(key, priority, rejoin=True)
+        model = kwargs.get("model") or ""
+        try:
+            self._acquire(model, priority)
+            try:
+                response = client.generate(**kwargs)
+            finally:
+                self._release(model)
+        except BaseException as e:
+            self._finish(key, own, error=e)
+            raise
+        self._finish(key, own, response)
+        return response
+
+    async def agenerate(self, async_client, priority: int = INTERACTIVE, key: Optional[str] = None, **kwargs) -> Any:
+        """generate for an ollama.AsyncClient"""
+        running, own = self._join(key, priority)
+        while running is not None:
+            try:
+                # shield: a caller that gives up must not cancel the shared call
+                return await asyncio.shield(asyncio.wrap_future(running))
+            except _Abandoned:
+                running, own = self._join(key, priority, rejoin=True)
+        model = kwargs.get("model") or ""
+        try:
+            await self._aacquire(model, priority)
+            try:
+                response = await async_client.generate(**kwargs)
+            finally:
+                self._release(model)
+        except BaseException as e:
+            self._finish(key, own, error=e)
+            raise
+        self._finish(key, own, response)
+        return response
+
+    def stats(self) -> Dict:
+        with self._lock:
+            models = {
+                model: {
+                    "running": self._running.get(model, 0),
+                    "limit": self.limit(model),
+                    "queued": {PRIORITY_NAMES[p]: sum(1 for entry in queue if entry[0] == p and not entry[2].cancelled)
+                               for p in PRIORITY_NAMES},
+                }
+                for model, queue in self._queues.items()
+            }
+            classes = {}
+            for priority, counts in self._classes.items():
+                waited = counts["waited"]
+                classes[PRIORITY_NAMES[priority]] = {
+                    "requests": counts["requests"],
+                    "coalesced": counts["coalesced"],
+                    "queued": counts["queued"],  # Calls that had to wait for a slot
+                    "avg_wait_ms": round(counts["wait_total"] / waited * 1000, 1) if waited else 0.0,
+                    "max_wait_ms": round(counts["wait_max"] * 1000, 1),
+                }
+            return {
+                "concurrency": self.concurrency,
+                "overrides": dict(self.overrides),
+                "queue_depth": sum(sum(model["queued"].values()) for model in models.values()),
+                "max_queue_depth": self.max_queue_depth,
+                "in_flight": len(self._inflight),
+                "models": models,
+                "priorities": classes,
+            }
+
+
+llm_scheduler = LLMScheduler(
+    settings.ollama_concurrency,
+    _concurrency_overrides(settings.ollama_concurrency_overrides),
+)
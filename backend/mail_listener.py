@@ -0,0 +1,237 @@
+"""
+Background ingestion of new mail.
+
+Each configured mail source gets a watcher thread with its own IMAP session
+(outside the shared pool, which serves requests). On servers that support it
+the watcher sits in IMAP IDLE and wakes up as soon as the server reports new
+mail; elsewhere it polls UIDNEXT, backing off while nothing arrives. Either
+way it only marks the source as changed: a single ingestion thread runs the
+sync pipeline for the changed sources, so new applications show up within
+seconds and no HTTP request is held open for IMAP or LLM work.
+
+Enabled with EMAIL_LISTENER_ENABLED; started and stopped with the app.
+"""
+import imaplib
+import re
+import select
+import threading
+import time
+from typing import Dict, List, Optional
+
+from config import settings
+from database import SessionLocal
+from email_processor import EmailProcessor
+from imap_pool import CONNECTION_ERRORS
+from llm_scheduler import BULK
+from mail_sources import MailSource, configured_sources
+from sync_jobs import sync_jobs
+from sync_pipeline import SyncPipeline
+
+_EXISTS_RE = re.compile(rb"^\* \d+ (?:EXISTS|RECENT)")
+_UIDNEXT_RE = re.compile(rb"UIDNEXT (\d+)")
+
+# Reconnect delays after errors, in seconds
+_RETRY_DELAYS = (5, 15, 60, 300)
+
+
+def idle(mail: imaplib.IMAP4, timeout: float) -> bool:
+    """
+    Run one IMAP IDLE command (RFC 2177) on the selected mailbox.
+    Returns True as soon as the server announces new mail, False after `timeout` seconds.
+    """
+    tag = mail._new_tag()
+    mail.send(tag + b" IDLE\r\n")
+    line = mail.readline()
+    if not line.startswith(b"+"):
+        raise imaplib.IMAP4.error(f"IDLE rejected: {line.decode(errors='replace').strip()}")
+
+    changed = False
+    deadline = time.monotonic() + timeout
+    while not changed:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        # Wait on the socket itself; a timeout on the socket would leave imaplib's file object unusable
+        if not getattr(mail.sock, "pending", lambda: 0)():
+            readable, _, _ = select.select([mail.sock], [], [], remaining)
+            if not readable:
+                break
+        line = mail.readline()
+        if not line:
+            raise imaplib.IMAP4.abort("connection closed during IDLE")
+        changed = bool(_EXISTS_RE.match(line))
+
+    mail.send(b"DONE\r\n")
+    while True:
+        line = mail.readline()
+        if not line:
+            raise imaplib.IMAP4.abort("connection closed ending IDLE")
+        if line.startswith(tag):
+            break
+        # Mail that arrived just as IDLE ended
+        changed = changed or bool(_EXISTS_RE.match(line))
+    return changed
+
+
+def uidnext(mail: imaplib.IMAP4, mailbox: str) -> Optional[int]:
+    """UIDNEXT of a mailbox (changes whenever mail is added)"""
+    status, data = mail.status(mailbox, "(UIDNEXT)")
+    match = _UIDNEXT_RE.search(data[0] or b"") if status == "OK" and data else None
+    return int(match.group(1)) if match else None
+
+
+class MailListener:
+    """Watches every mail source and syncs the ones with new mail on a background thread"""
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._changed = threading.Condition()
+        self._pending: Dict[str, MailSource] = {}
+        self._threads: List[threading.Thread] = []
+        self._sources: Dict[str, Dict] = {}
+        self._connections: Dict[str, imaplib.IMAP4] = {}  # Watcher sessions, closed on stop to end IDLE
+
+        self.syncs = 0
+        self.applications_created = 0
+        self.last_sync: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    @property
+    def running(self) -> bool:
+        return any(thread.is_alive() for thread in self._threads)
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stop.clear()
+        sources = configured_sources()
+        self._threads = [threading.Thread(target=self._ingest_loop, name="mail-ingest", daemon=True)]
+        for source in sources:
+            self._sources[source.key] = {"mode": None, "events": 0, "connected": False, "error": None}
+            self._threads.append(threading.Thread(
+                target=self._watch, args=(source,), name=f"mail-watch-{source.key}", daemon=True
+            ))
+        for thread in self._threads:
+            thread.start()
+        # Catch up on mail that arrived while the app was not running
+        for source in sources:
+            self.notify(source)
+        print(f"Mail listener started for {', '.join(s.key for s in sources)}")
+
+    def stop(self, timeout: float = 5) -> None:
+        self._stop.set()
+        with self._changed:
+            self._changed.notify_all()
+        for mail in list(self._connections.values()):
+            try:
+                mail.shutdown()
+            except Exception:
+                pass
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def notify(self, source: MailSource) -> None:
+        """Mark a source as having new mail"""
+        with self._changed:
+            self._pending[source.key] = source
+            self._changed.notify()
+
+    # --- watchers ---
+
+    def _watch(self, source: MailSource) -> None:
+        state = self._sources[source.key]
+        failures = 0
+        while not self._stop.is_set():
+            mail = None
+            try:
+                mail = source.pool.connect()
+                self._connections[source.key] = mail
+                status, _ = mail.select(source.mailbox, readonly=True)
+                if status != "OK":
+                    raise imaplib.IMAP4.error(f"Cannot select {source.folder}")
+                state.update(connected=True, error=None)
+                failures = 0
+                if "IDLE" in mail.capabilities:
+                    state["mode"] = "idle"
+                    self._idle_loop(source, mail)
+                else:
+                    state["mode"] = "poll"
+                    self._poll_loop(source, mail)
+            except (imaplib.IMAP4.error, ValueError, *CONNECTION_ERRORS) as e:
+                state.update(connected=False, error=str(e))
+                print(f"Mail listener for {source.key}: {e}")
+                delay = _RETRY_DELAYS[min(failures, len(_RETRY_DELAYS) - 1)]
+                failures += 1
+                self._stop.wait(delay)
+            finally:
+                self._connections.pop(source.key, None)
+                if mail is not None:
+                    try:
+                        mail.logout()
+                    except Exception:
+                        pass
+                state["connected"] = False
+
+    def _idle_loop(self, source: MailSource, mail: imaplib.IMAP4) -> None:
+        # IDLE is renewed regularly; servers end it after about 30 minutes
+        while not self._stop.is_set():
+            if idle(mail, min(settings.email_idle_timeout, 1500)):
+                self._sources[source.key]["events"] += 1
+                self.notify(source)
+
+    def _poll_loop(self, source: MailSource, mail: imaplib.IMAP4) -> None:
+        interval = settings.email_poll_interval
+        last = uidnext(mail, source.mailbox)
+        while not self._stop.wait(interval):
+            current = uidnext(mail, source.mailbox)
+            if current != last:
+                last = current
+                interval = settings.email_poll_interval
+                self._sources[source.key]["events"] += 1
+                self.notify(source)
+            else:
+                # Nothing new - check less often, up to the configured maximum
+                interval = min(interval * 2, settings.email_poll_max_interval)
+
+    # --- ingestion ---
+
+    def _ingest_loop(self) -> None:
+        while True:
+            with self._changed:
+                while not self._pending and not self._stop.is_set():
+                    self._changed.wait()
+                if self._stop.is_set():
+                    return
+                sources, self._pending = list(self._pending.values()), {}
+
+            db = SessionLocal()
+            try:
+                # One sync at a time, shared with syncs started from the API
+                with sync_jobs.run_lock:
+                    created = SyncPipeline(EmailProcessor(llm_priority=BULK), db, sources).run()
+                self.syncs += 1
+                self.applications_created += len(created)
+                self.last_sync = time.time()
+                self.last_error = None
+                if created:
+                    print(f"Mail listener: {len(created)} new applications from {', '.join(s.key for s in sources)}")
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Mail listener sync failed: {e}")
+            finally:
+                db.close()
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": settings.email_listener_enabled,
+            "running": self.running,
+            "sources": {key: dict(state) for key, state in self._sources.items()},
+            "syncs": self.syncs,
+            "applications_created": self.applications_created,
+            "last_sync": self.last_sync,
+            "last_error": self.last_error,
+        }
+
+
+mail_listener = MailListener()
@@ -0,0 +1,160 @@
+"""
+Mail sources (account + folder pairs) that the sync reads from.
+The account in settings uses the shared imap_pool for API requests; further
+accounts from EMAIL_EXTRA_ACCOUNTS each get a pool of their own. The sync reads
+through separate pools with one session per folder of the account, so every
+source is fetched over its own connection and a running sync never takes the
+sessions that API requests wait for.
+"""
+import json
+import threading
+from functools import partial
+from typing import Callable, Dict, List, Optional
+
+from config import settings
+from imap_pool import IMAPConnectionPool, imap_pool, open_imap_connection
+
+# Name of the account configured directly in settings
+DEFAULT_ACCOUNT = "default"
+
+
+class MailSource:
+    """One folder of one account, with the pools its sessions come from"""
+
+    def __init__(self, account: str, folder: str, pool: IMAPConnectionPool,
+                 sync_pool: Optional[IMAPConnectionPool] = None):
+        self.account = account
+        self.folder = folder
+        self.pool = pool
+        # Sessions the sync fetches this source with
+        self.sync_pool = sync_pool or pool
+
+    @property
+    def key(self) -> str:
+        """
+        Identifies the source in checkpoints, the message cache and email ids.
+        The main account's folders use the folder name, so INBOX keeps its existing state.
+        """
+        return self.folder if self.account == DEFAULT_ACCOUNT else f"{self.account}:{self.folder}"
+
+    @property
+    def mailbox(self) -> str:
+        """Folder name as sent to SELECT (quoted when it contains spaces)"""
+        return f'"{self.folder}"' if " " in self.folder and not self.folder.startswith('"') else self.folder
+
+    def email_id(self, uid: bytes) -> str:
+        """Application.email_id for a message; plain UIDs are kept for the main INBOX"""
+        uid = uid.decode()
+        return uid if self.key == "INBOX" else f"{self.key}/{uid}"
+
+    def __repr__(self) -> str:
+        return f"MailSource({self.key!r})"
+
+
+_extra_pools: Dict[str, IMAPConnectionPool] = {}
+_sync_pools: Dict[str, IMAPConnectionPool] = {}  # account name -> sessions of the sync
+_pools_lock = threading.Lock()
+
+
+def _split_folders(value) -> List[str]:
+    if isinstance(value, str):
+        value = value.split(",")
+    return [folder.strip() for folder in value or [] if folder and folder.strip()]
+
+
+def _account_connect(account: Dict) -> Callable:
+    return partial(
+        open_imap_connection,
+        provider=account.get("provider", "gmail"),
+        address=account.get("address"),
+        password=account.get("password") or account.get("app_password"),
+        imap_server=account.get("imap_server"),
+        imap_port=account.get("imap_port"),
+    )
+
+
+def _account_pool(account: Dict) -> IMAPConnectionPool:
+    name = account["name"]
+    with _pools_lock:
+        pool = _extra_pools.get(name)
+        if pool is None:
+            pool = IMAPConnectionPool(
+                _account_connect(account),
+                size=account.get("pool_size") or settings.imap_pool_size,
+                keepalive_interval=settings.imap_keepalive_interval,
+                max_idle=settings.imap_max_idle,
+            )
+            _extra_pools[name] = pool
+        return pool
+
+
+def _sync_pool(name: str, connect: Callable, folders: int) -> IMAPConnectionPool:
+    """Pool the sync reads an account's `folders` folders through, one session each"""
+    with _pools_lock:
+        pool = _sync_pools.get(name)
+        if pool is None or pool.size != folders:
+            stale, pool = pool, IMAPConnectionPool(
+                connect,
+                size=folders,
+                keepalive_interval=settings.imap_keepalive_interval,
+                max_idle=settings.imap_max_idle,
+            )
+            _sync_pools[name] = pool
+        else:
+            stale = None
+    if stale is not None:
+        stale.close()
+    return pool
+
+
+def extra_accounts() -> List[Dict]:
+    """Accounts from EMAIL_EXTRA_ACCOUNTS (a JSON list), skipping malformed entries"""
+    if not settings.email_extra_accounts:
+        return []
+    try:
+        accounts = json.loads(settings.email_extra_accounts)
+    except ValueError as e:
+        print(f"Ignoring EMAIL_EXTRA_ACCOUNTS, invalid JSON: {e}")
+        return []
+
+    valid = []
+    for i, account in enumerate(accounts if isinstance(accounts, list) else []):
+        if not isinstance(account, dict) or not account.get("address"):
+            print(f"Ignoring extra account #{i}: an address is required")
+            continue
+        account.setdefault("name", account["address"])
+        valid.append(account)
+    return valid
+
+
+def configured_sources() -> List[MailSource]:
+    """Every (account, folder) pair the sync should read"""
+    folders = _split_folders(settings.email_sync_folders) or ["INBOX"]
+    sync_pool = _sync_pool(DEFAULT_ACCOUNT, open_imap_connection, len(folders))
+    sources = [MailSource(DEFAULT_ACCOUNT, folder, imap_pool, sync_pool) for folder in folders]
+    for account in extra_accounts():
+        pool = _account_pool(account)
+        folders = _split_folders(account.get("folders")) or ["INBOX"]
+        sync_pool = _sync_pool(account["name"], _account_connect(account), len(folders))
+        for folder in folders:
+            sources.append(MailSource(account["name"], folder, pool, sync_pool))
+    return sources
+
+
+def pool_stats() -> Dict[str, Dict]:
+    with _pools_lock:
+        pools = dict(_extra_pools)
+        sync_pools = dict(_sync_pools)
+    stats = {DEFAULT_ACCOUNT: imap_pool.stats(), **{name: pool.stats() for name, pool in pools.items()}}
+    stats.update({f"{name} (sync)": pool.stats() for name, pool in sync_pools.items()})
+    return stats
+
+
+def close_pools() -> None:
+    """Log out of every pooled session, including the extra accounts'"""
+    imap_pool.close()
+    with _pools_lock:
+        pools = list(_extra_pools.values()) + list(_sync_pools.values())
+    for pool in pools:
+        pool.close()
+
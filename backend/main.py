@@ -1,18 +1,34 @@
 from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Body, Header
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import StreamingResponse
+from fastapi.encoders import jsonable_encoder
 from sqlalchemy.orm import Session
 from typing import List, Optional, Set
 from datetime import datetime
 import uvicorn
+import asyncio
 import os
 import shutil
 from pathlib import Path
 import secrets
+import json
+import re
 
 from database import get_db, init_db
 from models import Application, ApplicationCreate, ApplicationUpdate, ApplicationResponse
-from email_processor import EmailProcessor
+from email_processor import EmailProcessor, batch_stats
+from mail_sources import close_pools, pool_stats
+from mail_listener import mail_listener
+from sync_jobs import sync_jobs
+from message_cache import message_cache
+from llm_cache import acached_generate, llm_cache
+from llm_gateway import get_async_llm_client, get_llm_client, ollama_gateway
+from llm_scheduler import BULK, INTERACTIVE, llm_scheduler
+from email_classifier import job_classifier, review_classifier
+from ats_extractors import extractor_registry
+from sender_companies import UNLEARNED_SOURCES, sender_company_cache
+import thread_index
 from image_processor import ImageProcessor
 from resume_builder import ResumeBuilder
 from user_profile import UserProfile
@@ -59,6 +75,18 @@ RESUMES_DIR.mkdir(exist_ok=True)
 @app.on_event("startup")
 async def startup_event():
     init_db()
+    # One Ollama connection pool for the whole app
+    ollama_gateway.start()
+    # Optional background ingestion (IMAP IDLE / polling)
+    if settings.email_listener_enabled:
+        mail_listener.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    mail_listener.stop()
+    # Log out of pooled IMAP sessions
+    close_pools()
+    await ollama_gateway.aclose()
 
 # Mount static files for serving uploaded images and resumes
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
@@ -146,9 +174,11 @@ def create_application(
 @app.post("/api/upload-image")
 async def upload_image(
     file: UploadFile = File(...),
+    refresh: bool = False,
+    llm_client=Depends(get_async_llm_client),
     current_user: str = Depends(require_auth),
 ):
-    """Upload an image and extract job information"""
+    """Upload an image and extract job information (`refresh=true` skips the LLM response cache)"""
     try:
         # Validate file type
         if not file.content_type or not file.content_type.startswith('image/'):
@@ -158,12 +188,11 @@ async def upload_image(
         file_ext = Path(file.filename).suffix
         file_path = UPLOAD_DIR / f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{file.filename}"
         
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        await asyncio.to_thread(_save_upload, file.file, file_path)
         
         # Process image with LLM
-        processor = ImageProcessor()
-        extracted_data = processor.extract_from_image(str(file_path))
+        processor = ImageProcessor(async_llm_client=llm_client)
+        extracted_data = await processor.aextract_from_image(str(file_path), use_cache=not refresh)
         
         if extracted_data:
             # Add image path to the extracted data
@@ -185,6 +214,10 @@ async def upload_image(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
 
+def _save_upload(source, file_path: Path) -> None:
+    with open(file_path, "wb") as buffer:
+        shutil.copyfileobj(source, buffer)
+
 @app.put("/api/applications/{application_id}", response_model=ApplicationResponse)
 def update_application(
     application_id: int,
@@ -259,6 +292,10 @@ def update_application(
             if key in update_data and isinstance(update_data[key], str) and not update_data[key].strip():
                 update_data[key] = None
         
+        # A corrected company name teaches the sender cache for mail from the same sender
+        if update_data.get('company_name') and update_data['company_name'] != db_application.company_name:
+            sender_company_cache.learn(db, db_application.sender, update_data['company_name'], manual=True)
+        
         for field, value in update_data.items():
             setattr(db_application, field, value)
         
@@ -286,173 +323,309 @@ def delete_application(
     return {"message": "Application deleted successfully"}
 
 @app.post("/api/sync-emails")
-def sync_emails(
-    db: Session = Depends(get_db),
+async def sync_emails(
+    days_back: int = 0,
     current_user: str = Depends(require_auth),
 ):
-    """Sync emails and extract job application information"""
+    """
+    Start syncing emails in the background and return the job handle right away.
+    While a sync is running, further calls attach to it instead of starting another.
+    """
     try:
-        processor = EmailProcessor()
-        new_applications = processor.process_emails(db)
-        return {
-            "message": f"Email sync completed. Found {len(new_applications)} new applications.",
-            "applications": new_applications
-        }
+        job, started = sync_jobs.start(days_back)
+        return {**job.to_dict(), "attached": not started}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error syncing emails: {str(e)}")
 
+@app.get("/api/sync-emails/{job_id}")
+async def get_sync_job(
+    job_id: str,
+    current_user: str = Depends(require_auth),
+):
+    """Status, progress and (when done) the new applications of a sync job"""
+    job = sync_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Sync job not found")
+    return job.to_dict()
+
 @app.get("/api/emails")
 def list_emails(
     days_back: int = 0,
     limit: int = 50,
     unread_only: bool = False,
+    stream: bool = False,
+    include_body: bool = True,
     db: Session = Depends(get_db),
     current_user: str = Depends(require_auth),
 ):
-    """List job-related emails from today (or last N days), optionally only unread emails"""
+    """
+    List job-related emails from today (or last N days), optionally only unread emails.
+    With `stream=true`, summary rows (without bodies) are streamed as NDJSON as soon
+    as each batch is parsed; bodies are loaded separately from /api/emails/{id}/body.
+    """
     try:
         processor = EmailProcessor()
-        emails = processor.list_emails(db, days_back=days_back, limit=limit, unread_only=unread_only)
-        return emails
+        if not stream:
+            return processor.list_emails(db, days_back=days_back, limit=limit, unread_only=unread_only,
+                                         include_body=include_body)
+        email_ids, uidvalidity = processor.search_emails(days_back=days_back, limit=limit, unread_only=unread_only)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error listing emails: {str(e)}")
+    
+    def stream_rows():
+        try:
+            for row in processor.iter_emails(db, email_ids, uidvalidity):
+                yield json.dumps(row) + "\n"
+        except Exception as e:
+            # Headers are already sent, so report the failure in-band
+            yield json.dumps({"error": f"Error listing emails: {str(e)}"}) + "\n"
+    
+    return StreamingResponse(stream_rows(), media_type="application/x-ndjson")
 
-@app.post("/api/process-email/{email_id}")
-def process_email(
+@app.get("/api/emails/{email_id}/body")
+def get_email_body(
     email_id: str,
-    db: Session = Depends(get_db),
     current_user: str = Depends(require_auth),
 ):
-    """Process a specific email, extract details, and update application if rejection"""
+    """Full body of one email, for clients that listed emails without bodies"""
     try:
         processor = EmailProcessor()
-        result = processor.process_single_email(email_id, db)
-        
-        if not result:
-            raise HTTPException(status_code=404, detail="Could not process email")
-        
-        extracted = result['extracted_data']
-        is_rejection = result['is_rejection']
-        matched_app_id = result['matched_application_id']
-        
-        # If rejection and we found a match, update the application
-        if is_rejection and matched_app_id:
-            application = db.query(Application).filter(Application.id == matched_app_id).first()
-            if application:
-                application.status = "rejected"
-                if extracted.get('rejection_date'):
-                    application.rejection_date = extracted['rejection_date']
-                elif result.get('email_date'):
-                    from datetime import datetime
-                    application.rejection_date = datetime.fromisoformat(result['email_date'])
-                if extracted.get('rejection_reason'):
-                    application.rejection_reason = extracted['rejection_reason']
-                application.email_id = email_id
-                db.commit()
-                db.refresh(application)
-                
-                return {
-                    "message": "Rejection detected and application updated",
-                    "application_updated": True,
-                    "application": {
-                        "id": application.id,
-                        "company_name": application.company_name,
-                        "position": application.position,
-                        "status": application.status
-                    },
-                    "extracted_data": extracted
-                }
-        
-        # If not a rejection or no match, create new application if we have company name
-        if extracted.get('company_name') and not is_rejection:
-            # Check if already exists
-            existing = db.query(Application).filter(
-                Application.email_id == email_id
-            ).first()
+        body = processor.get_email_body(email_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error loading email: {str(e)}")
+    if body is None:
+        raise HTTPException(status_code=404, detail="Email not found")
+    return {"id": email_id, "body": body}
+
+def apply_email_result(result: dict, email_id: str, db: Session) -> dict:
+    """
+    Apply a processed email to the database: mark the matched application as
+    rejected, update the application whose thread the email replies to, or create
+    a new application. Returns the API response payload.
+    """
+    extracted = result['extracted_data']
+    is_rejection = result['is_rejection']
+    matched_app_id = result['matched_application_id']
+    
+    # If rejection and we found a match, update the application
+    if is_rejection and matched_app_id:
+        application = db.query(Application).filter(Application.id == matched_app_id).first()
+        if application:
+            application.status = "rejected"
+            if extracted.get('rejection_date'):
+                application.rejection_date = extracted['rejection_date']
+            elif result.get('email_date'):
+                application.rejection_date = datetime.fromisoformat(result['email_date'])
+            if extracted.get('rejection_reason'):
+                application.rejection_reason = extracted['rejection_reason']
+            # email_id stays the confirmation's; the rejection is found through its thread link and ledger entry
+            thread_index.link(db, result.get('message_key'), application.id)
+            db.commit()
+            db.refresh(application)
+            
+            return {
+                "message": "Rejection detected and application updated",
+                "application_updated": True,
+                "application": {
+                    "id": application.id,
+                    "company_name": application.company_name,
+                    "position": application.position,
+                    "status": application.status
+                },
+                "extracted_data": extracted
+            }
+    
+    # Other replies in an application's thread (e.g. interview invites) update that application
+    if result.get('thread_match') and matched_app_id:
+        application = db.query(Application).filter(Application.id == matched_app_id).first()
+        if application:
+            EmailProcessor().apply_followup(application, extracted, datetime.fromisoformat(result['email_date']))
+            thread_index.link(db, result.get('message_key'), application.id)
+            db.commit()
+            db.refresh(application)
+            
+            return {
+                "message": "Follow-up linked to application",
+                "application_updated": True,
+                "application": {
+                    "id": application.id,
+                    "company_name": application.company_name,
+                    "position": application.position,
+                    "status": application.status
+                },
+                "extracted_data": extracted
+            }
+    
+    # If not a rejection or no match, create new application if we have company name
+    if extracted.get('company_name') and not is_rejection:
+        # Check if already exists
+        existing = db.query(Application).filter(
+            Application.email_id == email_id
+        ).first()
+        
+        if not existing:
+            # Ensure required fields have values
+            company_name = extracted.get('company_name') or 'Unknown'
+            position = extracted.get('position') or 'Not Specified'
             
-            if not existing:
-                # Ensure required fields have values
-                company_name = extracted.get('company_name') or 'Unknown'
-                position = extracted.get('position') or 'Not Specified'
-                
-                # Use email date as applied_date, or extracted date if LLM found one
-                email_date_str = result.get('email_date')
-                if email_date_str:
+            # Use email date as applied_date, or extracted date if LLM found one
+            email_date_str = result.get('email_date')
+            if email_date_str:
+                try:
+                    from dateutil import parser as date_parser
+                    email_date = date_parser.parse(email_date_str)
+                    # Convert to naive datetime (remove timezone info) to store date only
+                    if email_date.tzinfo:
+                        email_date = email_date.replace(tzinfo=None)
+                    # Set time to midnight to ensure we're using just the date
+                    email_date = email_date.replace(hour=0, minute=0, second=0, microsecond=0)
+                except:
                     try:
-                        from dateutil import parser as date_parser
-                        email_date = date_parser.parse(email_date_str)
-                        # Convert to naive datetime (remove timezone info) to store date only
+                        email_date = datetime.fromisoformat(email_date_str.replace('Z', '+00:00'))
                         if email_date.tzinfo:
                             email_date = email_date.replace(tzinfo=None)
-                        # Set time to midnight to ensure we're using just the date
                         email_date = email_date.replace(hour=0, minute=0, second=0, microsecond=0)
                     except:
-                        try:
-                            email_date = datetime.fromisoformat(email_date_str.replace('Z', '+00:00'))
-                            if email_date.tzinfo:
-                                email_date = email_date.replace(tzinfo=None)
-                            email_date = email_date.replace(hour=0, minute=0, second=0, microsecond=0)
-                        except:
-                            # Fallback: use yesterday's date if we can't parse
-                            from datetime import timedelta
-                            email_date = (datetime.now() - timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
-                else:
-                    # Default to yesterday if no email date
-                    from datetime import timedelta
-                    email_date = (datetime.now() - timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
-                
-                # Use extracted date if LLM found one, otherwise use email date
-                if extracted.get('applied_date'):
-                    applied_date = extracted.get('applied_date')
-                    # Ensure it's naive datetime and set to midnight
-                    if applied_date.tzinfo:
-                        applied_date = applied_date.replace(tzinfo=None)
-                    applied_date = applied_date.replace(hour=0, minute=0, second=0, microsecond=0)
-                else:
-                    applied_date = email_date
-                
-                application = Application(
-                    company_name=company_name,
-                    position=position,
-                    status=extracted.get('status', 'pending'),
-                    interview_date=extracted.get('interview_date'),
-                    rejection_date=extracted.get('rejection_date'),
-                    rejection_reason=extracted.get('rejection_reason'),
-                    notes=extracted.get('notes'),
-                    job_url=extracted.get('job_url'),
-                    contact_email=extracted.get('contact_email'),
-                    location=extracted.get('location'),
-                    source="email",
-                    email_id=email_id,
-                    applied_date=applied_date
-                )
-                db.add(application)
-                db.commit()
-                db.refresh(application)
-                
-                return {
-                    "message": "New application created from email",
-                    "application_created": True,
-                    "application": {
-                        "id": application.id,
-                        "company_name": application.company_name,
-                        "position": application.position
-                    },
-                    "extracted_data": extracted
-                }
+                        # Fallback: use yesterday's date if we can't parse
+                        from datetime import timedelta
+                        email_date = (datetime.now() - timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+            else:
+                # Default to yesterday if no email date
+                from datetime import timedelta
+                email_date = (datetime.now() - timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+            
+            # Use extracted date if LLM found one, otherwise use email date
+            if extracted.get('applied_date'):
+                applied_date = extracted.get('applied_date')
+                # Ensure it's naive datetime and set to midnight
+                if applied_date.tzinfo:
+                    applied_date = applied_date.replace(tzinfo=None)
+                applied_date = applied_date.replace(hour=0, minute=0, second=0, microsecond=0)
+            else:
+                applied_date = email_date
+            
+            application = Application(
+                company_name=company_name,
+                position=position,
+                status=extracted.get('status', 'pending'),
+                interview_date=extracted.get('interview_date'),
+                rejection_date=extracted.get('rejection_date'),
+                rejection_reason=extracted.get('rejection_reason'),
+                notes=extracted.get('notes'),
+                job_url=extracted.get('job_url'),
+                contact_email=extracted.get('contact_email'),
+                location=extracted.get('location'),
+                source="email",
+                email_id=email_id,
+                sender=result.get('sender'),
+                applied_date=applied_date
+            )
+            db.add(application)
+            if result.get('extractor') not in UNLEARNED_SOURCES:
+                sender_company_cache.learn(db, result.get('sender'), company_name)
+            db.flush()
+            # Later replies to this email are linked to the application directly
+            thread_index.link(db, result.get('message_key'), application.id)
+            db.commit()
+            db.refresh(application)
+            
+            return {
+                "message": "New application created from email",
+                "application_created": True,
+                "application": {
+                    "id": application.id,
+                    "company_name": application.company_name,
+                    "position": application.position
+                },
+                "extracted_data": extracted
+            }
+    
+    return {
+        "message": "Email processed",
+        "is_rejection": is_rejection,
+        "matched_application_id": matched_app_id,
+        "extracted_data": extracted
+    }
+
+@app.post("/api/process-email/{email_id}")
+async def process_email(
+    email_id: str,
+    force: bool = False,
+    db: Session = Depends(get_db),
+    llm_client=Depends(get_async_llm_client),
+    current_user: str = Depends(require_auth),
+):
+    """
+    Process a specific email, extract details, and update application if rejection.
+    `force=true` reprocesses emails already recorded as unrelated or unparseable.
+    """
+    try:
+        processor = EmailProcessor(async_llm_client=llm_client)
+        result = await processor.aprocess_single_email(email_id, db, force=force)
         
-        return {
-            "message": "Email processed",
-            "is_rejection": is_rejection,
-            "matched_application_id": matched_app_id,
-            "extracted_data": extracted
-        }
+        if not result:
+            raise HTTPException(status_code=404, detail="Could not process email")
+        
+        # The session's queries and commits stay off the event loop
+        return await asyncio.to_thread(apply_email_result, result, email_id, db)
         
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing email: {str(e)}")
 
+@app.post("/api/process-emails")
+def process_emails_bulk(
+    request: dict = Body(...),
+    db: Session = Depends(get_db),
+    llm_client=Depends(get_llm_client),
+    current_user: str = Depends(require_auth),
+):
+    """
+    Process many emails in one request. Takes {"email_ids": [...]} or, without ids,
+    the job-related emails from {"days_back": N, "limit": M}. Messages are loaded
+    over one IMAP session, extraction runs in parallel, and one NDJSON line is
+    streamed back per email as it finishes.
+    """
+    try:
+        processor = EmailProcessor(llm_client, llm_priority=BULK)
+        email_ids = [str(email_id) for email_id in (request.get("email_ids") or [])]
+        if not email_ids:
+            emails = processor.list_emails(
+                db,
+                days_back=int(request.get("days_back", 0)),
+                limit=int(request.get("limit", 50)),
+                include_body=False,
+            )
+            email_ids = [item["id"] for item in emails]
+        
+        raw_messages = processor.load_messages(email_ids)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error loading emails: {str(e)}")
+    
+    def stream_results():
+        yield json.dumps({"type": "start", "total": len(email_ids)}) + "\n"
+        
+        succeeded = 0
+        for email_id, result in processor.analyze_emails(email_ids, raw_messages, db):
+            if result is None:
+                event = {"type": "result", "email_id": email_id, "success": False,
+                         "message": "Could not process email"}
+            else:
+                try:
+                    event = {"type": "result", "email_id": email_id, "success": True,
+                             "subject": result.get("subject"), **apply_email_result(result, email_id, db)}
+                    succeeded += 1
+                except Exception as e:
+                    db.rollback()
+                    event = {"type": "result", "email_id": email_id, "success": False,
+                             "message": f"Error processing email: {str(e)}"}
+            yield json.dumps(jsonable_encoder(event)) + "\n"
+        
+        yield json.dumps({"type": "done", "total": len(email_ids), "succeeded": succeeded}) + "\n"
+    
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
 @app.get("/api/stats")
 def get_stats(
     db: Session = Depends(get_db),
@@ -473,13 +646,39 @@ def get_stats(
         "accepted": accepted
     }
 
+@app.get("/api/email-stats")
+def get_email_stats(
+    current_user: str = Depends(require_auth),
+):
+    """Counters for the email pipeline: IMAP pool, message cache, LLM cache, scheduler and batching, classifier, rule-based extractors, listener, sync jobs and sender cache"""
+    return {
+        "imap_pools": pool_stats(),
+        "message_cache": message_cache.stats(),
+        "llm_cache": llm_cache.stats(),
+        "llm_scheduler": llm_scheduler.stats(),
+        "llm_batching": batch_stats(),
+        "classifier": job_classifier.stats(),
+        "review_classifier": review_classifier.stats(),
+        "extractors": extractor_registry.stats(),
+        "listener": mail_listener.stats(),
+        "sync_jobs": sync_jobs.stats(),
+        "sender_cache": sender_company_cache.stats(),
+    }
+
+@app.get("/api/sender-companies")
+def get_sender_companies(
+    current_user: str = Depends(require_auth),
+):
+    """Learned sender -> company mappings with their confidence"""
+    return {"entries": sender_company_cache.entries(), "stats": sender_company_cache.stats()}
+
 @app.post("/api/resume/generate")
-def generate_resume(
+async def generate_resume(
     job_description: dict = Body(...),
-    db: Session = Depends(get_db),
+    llm_client=Depends(get_async_llm_client),
     current_user: str = Depends(require_auth),
 ):
-    """Generate a resume from job description"""
+    """Generate a resume from job description ({"refresh": true} generates a new one instead of a cached one)"""
     try:
         jd_text = job_description.get("job_description", "")
         application_id = job_description.get("application_id")
@@ -488,9 +687,10 @@ def generate_resume(
         if not jd_text:
             raise HTTPException(status_code=400, detail="Job description is required")
         
-        builder = ResumeBuilder()
+        builder = ResumeBuilder(async_llm_client=llm_client)
         use_profile = job_description.get("use_profile", True)
-        resume_data = builder.generate_resume_from_jd(jd_text, existing_resume, use_profile)
+        resume_data = await builder.agenerate_resume_from_jd(jd_text, existing_resume, use_profile,
+                                                             use_cache=not job_description.get("refresh", False))
         
         if "error" in resume_data:
             raise HTTPException(status_code=500, detail=resume_data["error"])
@@ -606,23 +806,66 @@ def save_user_profile(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error saving profile: {str(e)}")
 
+def parse_portfolio_response(response) -> dict:
+    """{"extracted_data": ..., "message": ...} from the answer to the portfolio prompt, or {"error": ...}"""
+    # Extract JSON from response
+    if isinstance(response, dict):
+        response_text = response.get('response', '').strip()
+    else:
+        response_text = str(response).strip()
+    
+    if not response_text:
+        return {"error": "Empty response from Ollama"}
+    
+    # Try to extract JSON if wrapped in markdown code blocks (fallback)
+    json_match = re.search(r'```json\s*(\{.*?\})\s*```', response_text, re.DOTALL)
+    if json_match:
+        response_text = json_match.group(1)
+    else:
+        json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
+        if json_match:
+            response_text = json_match.group(0)
+    
+    # Clean up the response text
+    response_text = response_text.strip()
+    
+    try:
+        extracted_data = json.loads(response_text)
+    except json.JSONDecodeError as e:
+        print(f"JSON decode error: {e}")
+        print(f"Response text (first 500 chars): {response_text[:500]}")
+        # Try to extract JSON if wrapped in markdown code blocks
+        json_match = re.search(r'```json\s*(\{.*?\})\s*```', response_text, re.DOTALL)
+        if json_match:
+            response_text = json_match.group(1)
+        else:
+            json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
+            if json_match:
+                response_text = json_match.group(0)
+        try:
+            extracted_data = json.loads(response_text.strip())
+        except json.JSONDecodeError as e2:
+            return {"error": f"Failed to parse Ollama response: {str(e2)}"}
+    
+    return {
+        "extracted_data": extracted_data,
+        "message": "Information extracted successfully"
+    }
+
 @app.post("/api/extract-from-portfolio")
-def extract_from_portfolio(
+async def extract_from_portfolio(
     portfolio_data: dict = Body(...),
+    llm_client=Depends(get_async_llm_client),
     current_user: str = Depends(require_auth),
 ):
-    """Extract information from portfolio text using local Ollama model (gemma3:4b)"""
+    """Extract information from portfolio text using local Ollama model (gemma3:4b); {"refresh": true} skips the cache"""
     try:
         portfolio_text = portfolio_data.get("portfolio_text", "")
         if not portfolio_text:
             raise HTTPException(status_code=400, detail="Portfolio text is required")
         
-        import ollama
-        import json
-        import re
-        
-        # Initialize Ollama client with local model
-        client = ollama.Client(host=settings.ollama_base_url)
+        # Local model through the shared async Ollama client
+        client = llm_client
         model = settings.ollama_model  # gemma3:4b
         
         prompt = f"""You are an expert at extracting structured information from resumes, CVs, and portfolio text. 
@@ -712,8 +955,11 @@ Portfolio Text:
 
 Return ONLY valid JSON, no additional text or markdown formatting."""
 
-        # Call Ollama API
-        response = client.generate(
+        # Call Ollama API; only answers that parse are cached
+        return await acached_generate(
+            client, "portfolio_extraction", not portfolio_data.get("refresh", False),
+            priority=INTERACTIVE,
+            parse=parse_portfolio_response,
             model=model,
             prompt=prompt,
             format="json",
@@ -722,50 +968,6 @@ Return ONLY valid JSON, no additional text or markdown formatting."""
             }
         )
         
-        # Extract JSON from response
-        if isinstance(response, dict):
-            response_text = response.get('response', '').strip()
-        else:
-            response_text = str(response).strip()
-        
-        if not response_text:
-            return {"error": "Empty response from Ollama"}
-        
-        # Try to extract JSON if wrapped in markdown code blocks (fallback)
-        json_match = re.search(r'```json\s*(\{.*?\})\s*```', response_text, re.DOTALL)
-        if json_match:
-            response_text = json_match.group(1)
-        else:
-            json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-            if json_match:
-                response_text = json_match.group(0)
-        
-        # Clean up the response text
-        response_text = response_text.strip()
-        
-        try:
-            extracted_data = json.loads(response_text)
-        except json.JSONDecodeError as e:
-            print(f"JSON decode error: {e}")
-            print(f"Response text (first 500 chars): {response_text[:500]}")
-            # Try to extract JSON if wrapped in markdown code blocks
-            json_match = re.search(r'```json\s*(\{.*?\})\s*```', response_text, re.DOTALL)
-            if json_match:
-                response_text = json_match.group(1)
-            else:
-                json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-                if json_match:
-                    response_text = json_match.group(0)
-            try:
-                extracted_data = json.loads(response_text.strip())
-            except json.JSONDecodeError as e2:
-                return {"error": f"Failed to parse Ollama response: {str(e2)}"}
-        
-        return {
-            "extracted_data": extracted_data,
-            "message": "Information extracted successfully"
-        }
-        
     except HTTPException:
         raise
     except Exception as e:
@@ -0,0 +1,159 @@
+"""
+Local store of downloaded email messages.
+Messages are kept zlib-compressed in a separate SQLite file, keyed by
+(mailbox, UIDVALIDITY, UID), so listing an email and then processing it
+only downloads it once. The least recently used entries are evicted when
+the store grows past its size limit.
+"""
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, Iterable, Optional
+
+from config import settings
+
+
+class MessageCache:
+    def __init__(self, path: str, max_bytes: int, enabled: bool = True):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._uidvalidity: Dict[str, int] = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                " mailbox TEXT NOT NULL, uidvalidity INTEGER NOT NULL, uid INTEGER NOT NULL,"
+                " data BLOB NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL,"
+                " PRIMARY KEY (mailbox, uidvalidity, uid))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_messages_last_access ON messages (last_access)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS mailboxes (mailbox TEXT PRIMARY KEY, uidvalidity INTEGER NOT NULL)"
+            )
+            conn.commit()
+            self._uidvalidity = dict(conn.execute("SELECT mailbox, uidvalidity FROM mailboxes"))
+            self._conn = conn
+        return self._conn
+
+    def observe_uidvalidity(self, mailbox: str, uidvalidity: int) -> None:
+        """Record the mailbox's current UIDVALIDITY; entries from an older one are dropped"""
+        if not self.enabled:
+            return
+        with self._lock:
+            db = self._db()
+            if self._uidvalidity.get(mailbox) == uidvalidity:
+                return
+            db.execute("DELETE FROM messages WHERE mailbox = ? AND uidvalidity != ?", (mailbox, uidvalidity))
+            db.execute("INSERT OR REPLACE INTO mailboxes (mailbox, uidvalidity) VALUES (?, ?)", (mailbox, uidvalidity))
+            db.commit()
+            self._uidvalidity[mailbox] = uidvalidity
+
+    def get_many(self, mailbox: str, uids: Iterable[bytes]) -> Dict[bytes, bytes]:
+        """Return the cached raw messages among `uids` for the mailbox's current UIDVALIDITY"""
+        uids = list(uids)
+        if not self.enabled or not uids:
+            return {}
+        with self._lock:
+            db = self._db()
+            uidvalidity = self._uidvalidity.get(mailbox)
+            if uidvalidity is None:
+                self.misses += len(uids)
+                return {}
+
+            found = {}
+            wanted = {int(uid): uid for uid in uids}
+            numbers = list(wanted)
+            for i in range(0, len(numbers), 500):
+                batch = numbers[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = db.execute(
+                    f"SELECT uid, data FROM messages WHERE mailbox = ? AND uidvalidity = ? AND uid IN ({placeholders})",
+                    [mailbox, uidvalidity, *batch],
+                )
+                for uid, data in rows:
+                    found[wanted[uid]] = zlib.decompress(data)
+
+            if found:
+                now = time.time()
+                db.executemany(
+                    "UPDATE messages SET last_access = ? WHERE mailbox = ? AND uidvalidity = ? AND uid = ?",
+                    [(now, mailbox, uidvalidity, int(uid)) for uid in found],
+                )
+                db.commit()
+
+            self.hits += len(found)
+            self.misses += len(uids) - len(found)
+            return found
+
+    def get(self, mailbox: str, uid: bytes) -> Optional[bytes]:
+        return self.get_many(mailbox, [uid]).get(uid)
+
+    def put_many(self, mailbox: str, messages: Dict[bytes, bytes]) -> None:
+        """Store raw messages under the mailbox's current UIDVALIDITY, then enforce the size limit"""
+        if not self.enabled or not messages:
+            return
+        with self._lock:
+            db = self._db()
+            uidvalidity = self._uidvalidity.get(mailbox)
+            if uidvalidity is None:
+                return
+            now = time.time()
+            rows = []
+            for uid, raw in messages.items():
+                data = zlib.compress(raw, 6)
+                rows.append((mailbox, uidvalidity, int(uid), data, len(data), now))
+            db.executemany(
+                "INSERT OR REPLACE INTO messages (mailbox, uidvalidity, uid, data, size, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            db.commit()
+            self._evict(db)
+
+    def put(self, mailbox: str, uid: bytes, raw: bytes) -> None:
+        self.put_many(mailbox, {uid: raw})
+
+    def _evict(self, db: sqlite3.Connection) -> None:
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM messages").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        victims = []
+        for rowid, size in db.execute("SELECT rowid, size FROM messages ORDER BY last_access"):
+            victims.append((rowid,))
+            excess -= size
+            if excess <= 0:
+                break
+        db.executemany("DELETE FROM messages WHERE rowid = ?", victims)
+        db.commit()
+
+    def stats(self) -> Dict:
+        if not self.enabled:
+            return {"enabled": False}
+        with self._lock:
+            count, total = self._db().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM messages").fetchone()
+        return {
+            "enabled": True,
+            "messages": count,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+message_cache = MessageCache(
+    settings.message_cache_path,
+    settings.message_cache_max_bytes,
+    settings.message_cache_enabled,
+)
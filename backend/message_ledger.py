@@ -0,0 +1,73 @@
+"""
+Ledger of processed emails (the processed_messages table).
+Every email the sync classifies or extracts is recorded by Message-ID with its
+outcome, so later syncs, listings and manual processing can skip mail that was
+already found to be unrelated or unparseable instead of re-fetching it and
+sending it to the LLM again.
+"""
+import hashlib
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import ProcessedMessage
+import mime_parser
+
+NOT_JOB = "not_job"  # Classifier found nothing job-related
+NOT_SYNCED = "not_synced"  # Only the email list's keywords matched (e.g. "offer"); the sync skips it
+NO_DATA = "no_data"  # Job-related, but extraction found no company
+EXTRACTED = "extracted"  # Application data was extracted
+
+ALL_OUTCOMES = (NOT_JOB, NOT_SYNCED, NO_DATA, EXTRACTED)
+# Outcomes of emails the classifier turned down
+UNRELATED_OUTCOMES = (NOT_JOB, NOT_SYNCED)
+
+
+def message_key(msg) -> Optional[str]:
+    """Normalised Message-ID of a parsed message, or None if it has none"""
+    value = (msg.get("Message-ID") or "").strip()
+    return value.strip("<>").strip().lower() or None
+
+
+def raw_message_key(raw: bytes) -> Optional[str]:
+    """Message-ID of raw message (or header) bytes, parsing only the headers"""
+    return message_key(mime_parser.parse_headers(raw))
+
+
+def content_hash(email_content: Dict[str, str]) -> str:
+    data = f"{email_content.get('subject', '')}\0{email_content.get('body', '')}"
+    return hashlib.sha1(data.encode("utf-8", errors="replace")).hexdigest()
+
+
+def lookup(db: Session, message_ids: Iterable[str]) -> Dict[str, ProcessedMessage]:
+    """Ledger entries for `message_ids`, keyed by Message-ID"""
+    ids = [message_id for message_id in set(message_ids) if message_id]
+    found = {}
+    for i in range(0, len(ids), 500):
+        for entry in db.query(ProcessedMessage).filter(ProcessedMessage.message_id.in_(ids[i:i + 500])):
+            found[entry.message_id] = entry
+    return found
+
+
+def processed_ids(message_ids: Iterable[str], outcomes=ALL_OUTCOMES) -> set:
+    """Message-IDs among `message_ids` recorded with one of `outcomes` (uses its own session, safe in threads)"""
+    db = SessionLocal()
+    try:
+        return {message_id for message_id, entry in lookup(db, message_ids).items() if entry.outcome in outcomes}
+    finally:
+        db.close()
+
+
+def record(db: Session, message_id: Optional[str], email_id: Optional[str], outcome: str,
+           extractor: Optional[str] = None, digest: Optional[str] = None) -> None:
+    """Add or update a ledger entry in `db`; the caller commits"""
+    if not message_id:
+        return
+    db.merge(ProcessedMessage(
+        message_id=message_id,
+        email_id=email_id,
+        outcome=outcome,
+        extractor=extractor,
+        content_hash=digest,
+    ))
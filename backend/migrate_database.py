@@ -59,7 +59,58 @@ try:
         print("Successfully added resume_path column!")
     else:
         print("resume_path column already exists.")
-    
+
+    # Index email_id (IMAP UID) used for deduplication during sync
+    cursor.execute("CREATE INDEX IF NOT EXISTS ix_applications_email_id ON applications (email_id)")
+    conn.commit()
+
+    # Sender of the source email, used to learn sender -> company mappings
+    if 'sender' not in columns:
+        print("Adding sender column...")
+        cursor.execute("ALTER TABLE applications ADD COLUMN sender VARCHAR")
+        conn.commit()
+        print("Successfully added sender column!")
+    else:
+        print("sender column already exists.")
+
+    # Normalized company name and its trigram index, used to match rejection emails
+    if 'company_key' not in columns:
+        print("Adding company_key column...")
+        cursor.execute("ALTER TABLE applications ADD COLUMN company_key VARCHAR")
+        conn.commit()
+        print("Successfully added company_key column!")
+    else:
+        print("company_key column already exists.")
+    cursor.execute("CREATE INDEX IF NOT EXISTS ix_applications_company_key ON applications (company_key)")
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS company_trigrams ("
+        "trigram VARCHAR NOT NULL, company_key VARCHAR NOT NULL, PRIMARY KEY (trigram, company_key))"
+    )
+    cursor.execute("CREATE INDEX IF NOT EXISTS ix_company_trigrams_company_key ON company_trigrams (company_key)")
+
+    from company_matcher import normalize_company, trigrams
+    cursor.execute("SELECT id, company_name FROM applications WHERE company_key IS NULL")
+    missing = cursor.fetchall()
+    cursor.executemany(
+        "UPDATE applications SET company_key = ? WHERE id = ?",
+        [(normalize_company(name), app_id) for app_id, name in missing],
+    )
+    cursor.execute("SELECT DISTINCT company_key FROM applications WHERE company_key IS NOT NULL")
+    cursor.executemany(
+        "INSERT OR IGNORE INTO company_trigrams (trigram, company_key) VALUES (?, ?)",
+        [(gram, key) for (key,) in cursor.fetchall() for gram in trigrams(key)],
+    )
+    conn.commit()
+    if missing:
+        print(f"Filled company_key for {len(missing)} applications.")
+
+    # Older versions stored IMAP sequence numbers in email_id; the sync now stores UIDs there,
+    # so a leftover sequence number would hide the message that has it as UID
+    from database import mark_sequence_email_ids
+    marked = mark_sequence_email_ids(conn)
+    if marked:
+        print(f"Marked {marked} legacy sequence-number email ids.")
+
     conn.close()
     print("\nDatabase migration completed successfully!")
     
@@ -0,0 +1,143 @@
+"""
+MIME parsing for email processing, built on the standard library's
+BytesParser / BytesHeaderParser.
+
+- parse_headers() reads only the header block, for filtering and listing.
+- parse_message() blanks attachment bodies at the byte level before parsing,
+  so large attachments are never split into lines or materialized.
+- message_content() stops at the preferred body part (HTML, else plain
+  text), decodes just that part with its declared charset and never decodes
+  the alternative part. A calendar invitation (text/calendar or an .ics
+  attachment) is decoded as well, since it is small and exact.
+
+The compat32 policy is used on purpose: policy.default re-parses structured
+headers such as Content-Type on every access, which made it slower than the
+code it replaces (see benchmark_parser.py).
+"""
+import re
+from email.header import decode_header, make_header
+from email.message import Message
+from email.parser import BytesHeaderParser, BytesParser
+from typing import Dict, Optional
+
+_parser = BytesParser()
+_header_parser = BytesHeaderParser()
+_HEADER_END_RE = re.compile(rb"\r?\n\r?\n")
+
+# Content types of calendar invitations; kept even when sent as attachments
+CALENDAR_TYPES = ("text/calendar", "application/ics")
+
+
+def _without_attachments(raw: bytes, depth: int = 0) -> bytes:
+    """
+    Blank the bodies of attachments and other non-text leaf parts at the byte
+    level, so the MIME parser never has to split them into lines. Multipart
+    boundaries are found with plain byte splits; nothing is decoded.
+    """
+    end = _HEADER_END_RE.search(raw)
+    if end is None:
+        return raw
+    head, body = raw[:end.end()], raw[end.end():]
+    headers = _header_parser.parsebytes(head)
+    main_type = headers.get_content_maintype()
+
+    if main_type == "multipart":
+        boundary = headers.get_boundary()
+        if not boundary or depth > 10:
+            return raw
+        delimiter = b"--" + boundary.encode("ascii", "replace")
+        # Delimiters start a line; a plain bytes split is far cheaper than a regex here
+        chunks = (b"\n" + body).split(b"\n" + delimiter)
+        chunks = [chunk[:-1] if chunk.endswith(b"\r") else chunk for chunk in chunks]
+        out = [chunks[0][1:]]
+        for chunk in chunks[1:]:
+            if chunk.startswith(b"--"):
+                # Closing delimiter and epilogue
+                out.append(chunk)
+                continue
+            # The rest of the delimiter line, then the part itself
+            line_end = chunk.find(b"\n")
+            if line_end < 0:
+                out.append(chunk)
+                continue
+            out.append(chunk[:line_end + 1] + _without_attachments(chunk[line_end + 1:], depth + 1))
+        return head + (b"\r\n" + delimiter).join(out)
+
+    disposition = str(headers.get("Content-Disposition", "")).lower()
+    if main_type == "text" and "attachment" not in disposition:
+        return raw
+    if main_type == "message" or is_calendar_part(headers):
+        return raw
+    return head
+
+
+def parse_message(raw: bytes, skip_attachments: bool = True) -> Message:
+    """Parse a complete raw message; attachment bodies are dropped unread unless `skip_attachments` is off"""
+    if skip_attachments:
+        raw = _without_attachments(raw)
+    return _parser.parsebytes(raw)
+
+
+def parse_headers(raw: bytes) -> Message:
+    """Parse only the headers of a raw message (or of a header block); the body is not read"""
+    end = _HEADER_END_RE.search(raw)
+    return _header_parser.parsebytes(raw[:end.end()] if end else raw)
+
+
+def header(msg, name: str, default: str = "") -> str:
+    """A header with RFC 2047 encoded words decoded"""
+    value = msg.get(name)
+    if value is None:
+        return default
+    try:
+        return str(make_header(decode_header(value)))
+    except Exception:
+        return str(value)
+
+
+def decode_text_part(part) -> str:
+    """Decode a text part with its declared charset, falling back to UTF-8 for unknown charsets"""
+    payload = part.get_payload(decode=True) or b""
+    charset = part.get_content_charset() or "utf-8"
+    try:
+        return payload.decode(charset, errors="replace")
+    except LookupError:
+        return payload.decode("utf-8", errors="replace")
+
+
+def preferred_body_part(msg) -> Optional[Message]:
+    """The part the app reads: the first non-attachment text/html part, else the first text/plain one"""
+    fallback = None
+    for part in msg.walk():
+        if part.is_multipart() or "attachment" in str(part.get("Content-Disposition", "")).lower():
+            continue
+        content_type = part.get_content_type()
+        if content_type == "text/html":
+            return part
+        if content_type == "text/plain" and fallback is None:
+            fallback = part
+    return fallback
+
+
+def is_calendar_part(part) -> bool:
+    """Whether a part is an iCalendar object (inline or as an .ics attachment)"""
+    if part.get_content_type() in CALENDAR_TYPES:
+        return True
+    filename = part.get_param("filename", header="Content-Disposition") or part.get_param("name") or ""
+    return isinstance(filename, str) and filename.lower().endswith(".ics")
+
+
+def calendar_text(msg) -> str:
+    """Decoded text of the first calendar part of a message, or "" if it has none"""
+    for part in msg.walk():
+        if not part.is_multipart() and is_calendar_part(part):
+            return decode_text_part(part)
+    return ""
+
+
+def message_content(msg) -> Dict[str, str]:
+    """{"subject", "body", "calendar"} of a parsed message, decoding only the preferred body part"""
+    subject = header(msg, "Subject")
+    part = preferred_body_part(msg)
+    body = decode_text_part(part) if part is not None else ""
+    return {"subject": subject, "body": body, "calendar": calendar_text(msg)}
@@ -11,6 +11,7 @@ class Application(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     company_name = Column(String, nullable=False, index=True)
+    company_key = Column(String, nullable=True, index=True)  # Normalized company_name (see company_matcher), kept up to date automatically
     position = Column(String, nullable=False)
     applied_date = Column(DateTime, default=datetime.utcnow, nullable=False)
     status = Column(String, default="pending", nullable=False)  # pending, interview, rejected, accepted
@@ -23,10 +24,58 @@ class Application(Base):
     location = Column(String, nullable=True)
     salary_range = Column(String, nullable=True)
     source = Column(String, nullable=True)  # email, manual, etc.
-    email_id = Column(String, nullable=True)  # Store email ID for deduplication
+    email_id = Column(String, nullable=True, index=True)  # IMAP UID of the source email, for deduplication
+    sender = Column(String, nullable=True)  # From header of the source email, so corrections can teach the sender cache
     image_path = Column(String, nullable=True)  # Path to uploaded job posting image
     resume_path = Column(String, nullable=True)  # Path to generated resume PDF
 
+class SyncState(Base):
+    """Per-mailbox IMAP checkpoint so each sync only fetches mail newer than the last one"""
+    __tablename__ = "sync_state"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    mailbox = Column(String, nullable=False, unique=True, index=True)
+    uidvalidity = Column(Integer, nullable=False)  # UIDs are only comparable while this is unchanged
+    last_uid = Column(Integer, nullable=False, default=0)  # Highest UID already synced
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class ProcessedMessage(Base):
+    """Outcome of every email the sync has looked at, so repeat syncs skip it"""
+    __tablename__ = "processed_messages"
+    
+    message_id = Column(String, primary_key=True)  # Message-ID header, stable across folders and UIDVALIDITY changes
+    email_id = Column(String, nullable=True)  # IMAP UID when last seen
+    outcome = Column(String, nullable=False)  # not_job, no_data, extracted
+    extractor = Column(String, nullable=True)  # Rule-based extractor or "llm"
+    content_hash = Column(String, nullable=True)  # Hash of subject + body, to notice edited drafts/resends
+    processed_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class CompanyTrigram(Base):
+    """Trigrams of every normalized company name, so rejections can be matched on misspelled or shortened names"""
+    __tablename__ = "company_trigrams"
+    
+    trigram = Column(String, primary_key=True)
+    company_key = Column(String, primary_key=True, index=True)
+
+class ThreadMessage(Base):
+    """Message-IDs of the emails behind an application, so replies in the same thread are linked directly"""
+    __tablename__ = "thread_messages"
+    
+    message_id = Column(String, primary_key=True)  # Normalised Message-ID, as in processed_messages
+    application_id = Column(Integer, nullable=False, index=True)
+    linked_at = Column(DateTime, default=datetime.utcnow)
+
+class SenderCompany(Base):
+    """Company learned for a sender domain or display name, so known senders need no LLM call"""
+    __tablename__ = "sender_companies"
+    
+    sender_key = Column(String, primary_key=True)  # "domain:acme.com" or "name:acme recruiting"
+    company_name = Column(String, nullable=False)
+    confirmations = Column(Integer, default=0, nullable=False)  # Extractions/edits that agreed
+    conflicts = Column(Integer, default=0, nullable=False)  # Extractions that named another company
+    manual = Column(Boolean, default=False, nullable=False)  # Set from an edit in the dashboard
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 # Pydantic Models
 class ApplicationBase(BaseModel):
     company_name: str
@@ -43,6 +92,7 @@ class ApplicationBase(BaseModel):
     salary_range: Optional[str] = None
     source: Optional[str] = None
     email_id: Optional[str] = None
+    sender: Optional[str] = None
     image_path: Optional[str] = None
     resume_path: Optional[str] = None
 
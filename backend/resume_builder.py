@@ -1,5 +1,5 @@
-import ollama
 from typing import Dict, Optional
+import asyncio
 import json
 import re
 from datetime import datetime
@@ -13,36 +13,77 @@ from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 
 from config import settings
+from llm_cache import acached_generate, cached_generate
+from llm_gateway import ollama_gateway
 from user_profile import UserProfile
 
 class ResumeBuilder:
-    def __init__(self):
-        self.ollama_client = ollama.Client(host=settings.ollama_base_url)
+    def __init__(self, llm_client=None, async_llm_client=None):
+        # The application-wide clients unless others are passed in
+        self.ollama_client = llm_client or ollama_gateway.client
+        self._async_ollama_client = async_llm_client
         self.model = settings.ollama_model
         self.resumes_dir = Path("resumes")
         self.resumes_dir.mkdir(exist_ok=True)
         self.user_profile = UserProfile()
+    
+    @property
+    def async_ollama_client(self):
+        return self._async_ollama_client or ollama_gateway.async_client
         
-    def generate_resume_from_jd(self, job_description: str, existing_resume: Optional[str] = None, use_profile: bool = True) -> Dict:
-        """Generate a tailored resume based on job description using LLM"""
+    def generate_resume_from_jd(self, job_description: str, existing_resume: Optional[str] = None, use_profile: bool = True,
+                                use_cache: bool = True) -> Dict:
+        """Generate a tailored resume based on job description using LLM; `use_cache=False` generates a new one"""
         try:
-            # Get user profile if available
-            profile_data = None
-            if use_profile:
-                profile = self.user_profile.get_profile()
-                # Only use profile if it has meaningful data
-                if profile.get('personal_info', {}).get('name') or profile.get('experience'):
-                    profile_data = json.dumps(profile, indent=2)
+            return cached_generate(
+                self.ollama_client, "resume_generation", use_cache,
+                parse=self.parse_resume_response,
+                model=self.model,
+                prompt=self.resume_prompt(job_description, existing_resume, use_profile),
+                format="json"
+            )
             
-            if existing_resume:
-                base_context = existing_resume
-            elif profile_data:
-                base_context = f"My Profile Information:\n{profile_data}"
-            else:
-                base_context = None
+        except Exception as e:
+            print(f"Error generating resume: {e}")
+            return {"error": str(e)}
+    
+    async def agenerate_resume_from_jd(self, job_description: str, existing_resume: Optional[str] = None,
+                                       use_profile: bool = True, use_cache: bool = True) -> Dict:
+        """generate_resume_from_jd on the async Ollama client; waiting for the model holds no thread"""
+        try:
+            # Reading the profile from disk stays off the event loop
+            prompt = await asyncio.to_thread(self.resume_prompt, job_description, existing_resume, use_profile)
+            return await acached_generate(
+                self.async_ollama_client, "resume_generation", use_cache,
+                parse=self.parse_resume_response,
+                model=self.model,
+                prompt=prompt,
+                format="json"
+            )
             
-            if base_context:
-                prompt = f"""Based on the following job description and my profile information, create a tailored resume that highlights ONLY the most relevant skills, experiences, projects, publications, awards, and achievements for this specific job. Exclude anything that is not directly relevant.
+        except Exception as e:
+            print(f"Error generating resume: {e}")
+            return {"error": str(e)}
+    
+    def resume_prompt(self, job_description: str, existing_resume: Optional[str] = None, use_profile: bool = True) -> str:
+        """Prompt asking the LLM for a resume tailored to a job description"""
+        # Get user profile if available
+        profile_data = None
+        if use_profile:
+            profile = self.user_profile.get_profile()
+            # Only use profile if it has meaningful data
+            if profile.get('personal_info', {}).get('name') or profile.get('experience'):
+                profile_data = json.dumps(profile, indent=2)
+        
+        if existing_resume:
+            base_context = existing_resume
+        elif profile_data:
+            base_context = f"My Profile Information:\n{profile_data}"
+        else:
+            base_context = None
+        
+        if base_context:
+            prompt = f"""Based on the following job description and my profile information, create a tailored resume that highlights ONLY the most relevant skills, experiences, projects, publications, awards, and achievements for this specific job. Exclude anything that is not directly relevant.
 
 Job Description:
 {job_description}
@@ -134,8 +175,8 @@ Create a professional resume in the following JSON format:
 }}
 
 Return ONLY valid JSON, no additional text."""
-            else:
-                prompt = f"""Based on the following job description, create a professional resume that matches the requirements.
+        else:
+            prompt = f"""Based on the following job description, create a professional resume that matches the requirements.
 
 Job Description:
 {job_description}
@@ -218,69 +259,62 @@ Create a professional resume in the following JSON format:
 }}
 
 Return ONLY valid JSON, no additional text."""
-
-            response = self.ollama_client.generate(
-                model=self.model,
-                prompt=prompt,
-                format="json"
-            )
-            
-            # Extract JSON from response
-            if isinstance(response, dict):
-                response_text = response.get('response', '').strip()
-            else:
-                response_text = str(response).strip()
-            
-            if not response_text:
-                return {"error": "Empty response from LLM"}
-            
-            # Try to extract JSON if wrapped in markdown code blocks
-            json_match = re.search(r'```json\s*(\{.*?\})\s*```', response_text, re.DOTALL)
+        return prompt
+    
+    def parse_resume_response(self, response) -> Dict:
+        """Resume data from the LLM's answer to resume_prompt, or {"error": ...}"""
+        # Extract JSON from response
+        if isinstance(response, dict):
+            response_text = response.get('response', '').strip()
+        else:
+            response_text = str(response).strip()
+        
+        if not response_text:
+            return {"error": "Empty response from LLM"}
+        
+        # Try to extract JSON if wrapped in markdown code blocks
+        json_match = re.search(r'```json\s*(\{.*?\})\s*```', response_text, re.DOTALL)
+        if json_match:
+            response_text = json_match.group(1)
+        else:
+            # Try to find JSON object directly
+            json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
             if json_match:
-                response_text = json_match.group(1)
-            else:
-                # Try to find JSON object directly
-                json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-                if json_match:
-                    response_text = json_match.group(0)
-            
-            # Clean up the response text
-            if response_text.startswith("'") and response_text.endswith("'"):
-                response_text = response_text[1:-1]
-            elif response_text.startswith('"') and response_text.endswith('"'):
-                response_text = response_text[1:-1]
-            
-            response_text = response_text.strip()
-            
-            # Handle escaped newlines
-            if '\\n' in response_text:
-                try:
-                    response_text = response_text.encode('utf-8').decode('unicode_escape')
-                except:
-                    response_text = response_text.replace('\\n', '\n').replace('\\t', '\t').replace('\\"', '"').replace("\\'", "'")
-            
+                response_text = json_match.group(0)
+        
+        # Clean up the response text
+        if response_text.startswith("'") and response_text.endswith("'"):
+            response_text = response_text[1:-1]
+        elif response_text.startswith('"') and response_text.endswith('"'):
+            response_text = response_text[1:-1]
+        
+        response_text = response_text.strip()
+        
+        # Handle escaped newlines
+        if '\\n' in response_text:
             try:
-                result = json.loads(response_text)
-            except json.JSONDecodeError as e:
-                print(f"JSON decode error: {e}")
-                print(f"Response text (first 500 chars): {response_text[:500]}")
-                # Try to handle Python-style dicts
-                try:
-                    import ast
-                    text_for_eval = response_text.replace('null', 'None').replace('true', 'True').replace('false', 'False')
-                    result = ast.literal_eval(text_for_eval)
-                    if not isinstance(result, dict):
-                        raise ValueError("Parsed result is not a dictionary")
-                    result = {k: (None if v is None else (True if v is True else (False if v is False else v))) for k, v in result.items()}
-                except Exception as e2:
-                    print(f"Failed to parse JSON: {repr(response_text[:200])}")
-                    return {"error": f"Failed to parse LLM response: {str(e2)}"}
-            
-            return result
-            
-        except Exception as e:
-            print(f"Error generating resume: {e}")
-            return {"error": str(e)}
+                response_text = response_text.encode('utf-8').decode('unicode_escape')
+            except:
+                response_text = response_text.replace('\\n', '\n').replace('\\t', '\t').replace('\\"', '"').replace("\\'", "'")
+        
+        try:
+            result = json.loads(response_text)
+        except json.JSONDecodeError as e:
+            print(f"JSON decode error: {e}")
+            print(f"Response text (first 500 chars): {response_text[:500]}")
+            # Try to handle Python-style dicts
+            try:
+                import ast
+                text_for_eval = response_text.replace('null', 'None').replace('true', 'True').replace('false', 'False')
+                result = ast.literal_eval(text_for_eval)
+                if not isinstance(result, dict):
+                    raise ValueError("Parsed result is not a dictionary")
+                result = {k: (None if v is None else (True if v is True else (False if v is False else v))) for k, v in result.items()}
+            except Exception as e2:
+                print(f"Failed to parse JSON: {repr(response_text[:200])}")
+                return {"error": f"Failed to parse LLM response: {str(e2)}"}
+        
+        return result
     
     def create_pdf(self, resume_data: Dict, output_path: str) -> bool:
         """Create a PDF from resume data"""
@@ -0,0 +1,183 @@
+"""
+Learned sender -> company mapping (the sender_companies table).
+Recruiting mail keeps arriving from the same domains and display names, so
+every extraction that produced an application (and every company name fixed
+by hand in the dashboard) is remembered for the sender's domain and display
+name. Later mail from a sender with a confident entry gets its company from
+here; when the common phrasing also yields the position, no LLM call is made.
+
+Domains of mail, calendar and ATS services (gmail.com, greenhouse.io, ...)
+are never mapped, since they send for many employers; for those only the
+display name ("Acme Talent Team") is used.
+
+What is learned in a session is only served once that session commits; a
+rollback discards it.
+"""
+import re
+import threading
+from email.utils import parseaddr
+from typing import Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from ats_extractors import PROVIDER_NAMES, extractor_registry
+from company_matcher import normalize_company
+from config import settings
+from database import SessionLocal
+from models import SenderCompany
+
+# Extractors whose results are not evidence for the cache (they came from it)
+UNLEARNED_SOURCES = {"sender_cache"}
+
+# Session.info key of the mappings learned in a session and not committed yet
+_STAGED = "sender_companies"
+
+_FIELDS = ("company_name", "confirmations", "conflicts", "manual")
+
+
+def sender_keys(sender: Optional[str]) -> List[str]:
+    """Cache keys of a From header, most specific first: "domain:<domain>", then "name:<display name>" """
+    name, address = parseaddr(sender or "")
+    keys = []
+    domain = address.rpartition("@")[2].strip("<> ").lower()
+    if domain and "." in domain and not extractor_registry.is_service_domain(domain):
+        keys.append(f"domain:{domain}")
+    name = re.sub(r"\s+", " ", name).strip().strip('"').lower()
+    if name and "@" not in name and name not in PROVIDER_NAMES:
+        keys.append(f"name:{name}")
+    return keys
+
+
+def confidence(entry: SenderCompany) -> float:
+    """1.0 for entries set by hand; otherwise agreement, discounted until the mapping was seen twice"""
+    if entry.manual:
+        return 1.0
+    seen = entry.confirmations + entry.conflicts
+    if not seen:
+        return 0.0
+    return entry.confirmations / seen * min(1.0, entry.confirmations / 2)
+
+
+class SenderCompanyCache:
+    """The sender_companies table, loaded once per process and written through on every change"""
+
+    def __init__(self):
+        self._entries: Optional[Dict[str, SenderCompany]] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.llm_calls_avoided = 0
+        self.learned = 0
+
+    def _load(self) -> Dict[str, SenderCompany]:
+        if self._entries is None:
+            db = SessionLocal()
+            try:
+                entries = db.query(SenderCompany).all()
+                db.expunge_all()
+            finally:
+                db.close()
+            self._entries = {entry.sender_key: entry for entry in entries}
+        return self._entries
+
+    def lookup(self, sender: Optional[str]) -> Optional[Dict]:
+        """{"company_name", "confidence", "sender_key"} for a confidently known sender, else None"""
+        keys = sender_keys(sender)
+        if not keys:
+            return None
+        with self._lock:
+            entries = self._load()
+            for key in keys:
+                entry = entries.get(key)
+                if entry is not None and confidence(entry) >= settings.sender_cache_min_confidence:
+                    self.hits += 1
+                    return {"company_name": entry.company_name, "confidence": confidence(entry), "sender_key": key}
+            self.misses += 1
+        return None
+
+    def learn(self, db: Session, sender: Optional[str], company_name: Optional[str], manual: bool = False) -> None:
+        """Record that `sender` sent mail about `company_name`; served once the caller commits `db`"""
+        if not company_name or company_name == "Unknown":
+            return
+        keys = sender_keys(sender)
+        if not keys:
+            return
+        staged = db.info.setdefault(_STAGED, {"entries": {}, "learned": 0})
+        with self._lock:
+            entries = self._load()
+            for key in keys:
+                # Builds on what this session learned already, then on what is committed
+                row, values = staged["entries"].get(key, (None, None))
+                if values is None and key in entries:
+                    values = {field: getattr(entries[key], field) for field in _FIELDS}
+                if values is None:
+                    values = {"company_name": company_name, "confirmations": 1, "conflicts": 0, "manual": manual}
+                elif manual:
+                    values.update(company_name=company_name, manual=True, conflicts=0,
+                                  confirmations=values["confirmations"] + 1)
+                elif normalize_company(values["company_name"]) == normalize_company(company_name):
+                    values["confirmations"] += 1
+                else:
+                    values["conflicts"] += 1
+                    if not values["manual"] and values["conflicts"] > values["confirmations"]:
+                        # The sender now mails for someone else
+                        values.update(company_name=company_name, confirmations=1, conflicts=0)
+                if row is None:
+                    # Merged once per session; a second merge of a pending row would insert it twice
+                    row = db.merge(SenderCompany(sender_key=key, **values))
+                else:
+                    for field, value in values.items():
+                        setattr(row, field, value)
+                staged["entries"][key] = (row, values)
+        staged["learned"] += 1
+    
+    def _committed(self, staged: Dict) -> None:
+        with self._lock:
+            entries = self._load()
+            for key, (_, values) in staged["entries"].items():
+                entries[key] = SenderCompany(sender_key=key, **values)
+            self.learned += staged["learned"]
+    
+    def avoided_llm_call(self) -> None:
+        with self._lock:
+            self.llm_calls_avoided += 1
+
+    def entries(self) -> List[Dict]:
+        with self._lock:
+            entries = list(self._load().values())
+        return sorted(
+            ({"sender_key": e.sender_key, "company_name": e.company_name, "confidence": round(confidence(e), 2),
+              "confirmations": e.confirmations, "conflicts": e.conflicts, "manual": e.manual}
+             for e in entries),
+            key=lambda row: (row["confidence"], row["confirmations"]), reverse=True,
+        )
+
+    def stats(self) -> Dict:
+        with self._lock:
+            entries = list(self._load().values())
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(entries),
+                "confident_entries": sum(1 for e in entries if confidence(e) >= settings.sender_cache_min_confidence),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "llm_calls_avoided": self.llm_calls_avoided,
+                "learned": self.learned,
+            }
+
+
+sender_company_cache = SenderCompanyCache()
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_learned(session):
+    staged = session.info.pop(_STAGED, None)
+    if staged:
+        sender_company_cache._committed(staged)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_learned(session):
+    session.info.pop(_STAGED, None)
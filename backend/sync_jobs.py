@@ -0,0 +1,142 @@
+"""
+Email sync as a single background job.
+
+POST /api/sync-emails starts a sync on a background thread and returns its job
+id right away; while it runs, further calls (a double click, a second tab)
+attach to the same job instead of starting another sync over the same mail.
+Clients follow the job with GET /api/sync-emails/{job_id}. Pipeline runs of
+the background mail listener take the same run lock, so at most one sync
+writes applications at a time and the email_id checks cannot race.
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from database import SessionLocal
+from email_processor import EmailProcessor
+from llm_scheduler import BULK
+from mail_sources import configured_sources
+from sync_pipeline import SyncPipeline
+
+# Finished jobs kept for status requests
+_KEEP_JOBS = 20
+
+
+class SyncJob:
+    """One sync run and the callers attached to it"""
+
+    def __init__(self, days_back: int = 0):
+        self.id = uuid.uuid4().hex
+        self.days_back = days_back
+        self.status = "queued"  # queued -> running -> completed / failed
+        self.callers = 1
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.applications: List[Dict] = []
+        self.error: Optional[str] = None
+        self.pipeline: Optional[SyncPipeline] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def to_dict(self) -> Dict:
+        pipeline = self.pipeline
+        applications = list(pipeline.created) if pipeline is not None and not self.done else self.applications
+        if self.status == "completed":
+            message = f"Email sync completed. Found {len(applications)} new applications."
+            if pipeline is not None and pipeline.failed:
+                message += f" {pipeline.failed} emails could not be extracted and will be retried on the next sync."
+        elif self.status == "failed":
+            message = f"Error syncing emails: {self.error}"
+        else:
+            message = "Email sync in progress."
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "message": message,
+            "callers": self.callers,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "progress": {
+                "emails_found": pipeline.found if pipeline is not None else 0,
+                "emails_processed": pipeline.processed if pipeline is not None else 0,
+                "emails_failed": pipeline.failed if pipeline is not None else 0,
+                "applications_created": len(applications),
+            },
+            "applications": applications,
+            "error": self.error,
+        }
+
+
+class SyncJobs:
+    """The in-flight sync job (at most one) and recently finished ones"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Held for every pipeline run, by API jobs and the mail listener alike
+        self.run_lock = threading.Lock()
+        self._current: Optional[SyncJob] = None
+        self._jobs: "OrderedDict[str, SyncJob]" = OrderedDict()
+
+    def start(self, days_back: int = 0) -> Tuple[SyncJob, bool]:
+        """The in-flight job, or a newly started one; the flag tells whether this call started it"""
+        with self._lock:
+            if self._current is not None and not self._current.done:
+                self._current.callers += 1
+                return self._current, False
+            job = SyncJob(days_back)
+            self._current = job
+            self._jobs[job.id] = job
+            while len(self._jobs) > _KEEP_JOBS:
+                self._jobs.popitem(last=False)
+        threading.Thread(target=self._run, args=(job,), name=f"sync-job-{job.id[:8]}", daemon=True).start()
+        return job, True
+
+    def get(self, job_id: str) -> Optional[SyncJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def current(self) -> Optional[SyncJob]:
+        with self._lock:
+            return self._current
+
+    def _run(self, job: SyncJob) -> None:
+        db = SessionLocal()
+        try:
+            # Waits here while the mail listener is syncing
+            with self.run_lock:
+                job.status = "running"
+                job.started_at = time.time()
+                job.pipeline = SyncPipeline(EmailProcessor(llm_priority=BULK), db, configured_sources())
+                job.applications = job.pipeline.run(job.days_back)
+            job.status = "completed"
+        except Exception as e:
+            job.error = str(e)
+            job.applications = list(job.pipeline.created) if job.pipeline is not None else []
+            job.status = "failed"
+            print(f"Email sync {job.id} failed: {e}")
+        finally:
+            db.close()
+            job.finished_at = time.time()
+            with self._lock:
+                if self._current is job:
+                    self._current = None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            current = self._current
+            finished = [job for job in self._jobs.values() if job.done]
+        return {
+            "current_job": current.id if current else None,
+            "recent_jobs": len(finished),
+            "failed_jobs": sum(1 for job in finished if job.status == "failed"),
+            "attached_callers": sum(job.callers - 1 for job in self._jobs.values()),
+        }
+
+
+sync_jobs = SyncJobs()
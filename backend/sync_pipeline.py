@@ -0,0 +1,362 @@
+"""
+Concurrent email sync pipeline.
+
+    fetcher per source -> parser pool -> LLM workers -> DB writer
+
+Stages are connected by bounded queues, so IMAP downloads, MIME parsing and
+Ollama inference overlap instead of running strictly one after another, and a
+slow stage applies backpressure to the ones before it. Each mail source
+(account + folder, see mail_sources) has its own fetcher, checkpoint and
+connection from its account's sync pool (not the one API requests use), so
+sources are read in parallel and a sync takes as long as the slowest one. Replies in the thread of a known application skip extraction and
+only update that application. The DB writer runs on the calling thread (it owns
+the SQLAlchemy session) and commits in batches. A source's checkpoint only moves
+past emails whose outcome was committed; emails that failed on the way (e.g.
+Ollama unreachable) are read again by the next sync.
+"""
+import queue
+import threading
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import SessionLocal
+from imap_fetch import chunked
+from mail_sources import MailSource
+from message_cache import message_cache
+from models import Application
+import message_ledger
+import mime_parser
+import thread_index
+from sender_companies import UNLEARNED_SOURCES, sender_company_cache
+
+# Marks the end of a queue's input
+_DONE = object()
+
+
+class SyncPipeline:
+    def __init__(self, processor, db: Session, sources: List[MailSource],
+                 llm_workers: Optional[int] = None, parser_workers: Optional[int] = None,
+                 commit_batch: Optional[int] = None):
+        self.processor = processor
+        self.db = db
+        self.sources = sources
+        self.llm_workers = max(1, llm_workers or settings.email_llm_workers)
+        self.parser_workers = max(1, parser_workers or settings.email_parser_workers)
+        self.commit_batch = max(1, commit_batch or settings.email_commit_batch_size)
+
+        chunk_size = settings.imap_fetch_chunk_size
+        self._raw_queue = queue.Queue(maxsize=chunk_size * 2)
+        # Deep enough for every LLM worker to find a full batch waiting
+        self._llm_queue = queue.Queue(maxsize=self.llm_workers * max(1, settings.email_llm_batch_size) * 2)
+        self._result_queue = queue.Queue(maxsize=chunk_size * 2)
+
+        self._lock = threading.Lock()
+        self._fetchers_left = len(sources)
+        self._parsers_left = self.parser_workers
+        self._llm_left = self.llm_workers
+        # source key -> (uidvalidity, uids) for sources that were read completely
+        self._checkpoints: Dict[str, tuple] = {}
+        # source key -> UIDs handed to the parsers whose outcome is not committed yet
+        self._unsettled: Dict[str, Set[bytes]] = {}
+        self._fetch_errors: Dict[str, Exception] = {}
+        self._claimed = set()  # Message-IDs already taken by a parser in this run
+
+        # Progress, read by sync jobs while the run is going
+        self.found = 0  # Emails downloaded (or read from the cache) for this run
+        self.processed = 0
+        self.failed = 0  # Emails left for the next sync (e.g. Ollama was unreachable)
+        self.created: List[Dict] = []
+
+    def run(self, days_back: int = 0) -> List[Dict]:
+        """Sync new mail from every source and return the applications created"""
+        if not self.sources:
+            return []
+
+        threads = [
+            threading.Thread(target=self._fetcher, args=(source, days_back), name=f"sync-fetcher-{source.key}")
+            for source in self.sources
+        ]
+        threads += [threading.Thread(target=self._parser, name=f"sync-parser-{i}") for i in range(self.parser_workers)]
+        threads += [threading.Thread(target=self._llm_worker, name=f"sync-llm-{i}") for i in range(self.llm_workers)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        new_applications = self._writer()
+
+        for thread in threads:
+            thread.join()
+
+        # Sources that failed keep their checkpoint so the missed mail is retried next time;
+        # the others stop before their first email without a committed outcome
+        for source in self.sources:
+            if source.key in self._checkpoints:
+                uidvalidity, email_ids = self._checkpoints[source.key]
+                self.processor.save_checkpoint(self.db, source.key, uidvalidity, email_ids,
+                                               self._unsettled.get(source.key, ()))
+
+        if len(self._fetch_errors) == len(self.sources):
+            raise next(iter(self._fetch_errors.values()))
+        return new_applications
+
+    # --- stages ---
+
+    def _fetcher(self, source: MailSource, days_back: int) -> None:
+        """Find new mail in one source, download candidates chunk by chunk and hand them to the parsers"""
+        db = SessionLocal()
+        try:
+            # Sessions are leased per IMAP step, never while waiting on the parsers' queue
+            with source.sync_pool.session(source.mailbox) as mail:
+                # Only mail newer than the last checkpoint (or today's / last N days' on first run)
+                email_ids, uidvalidity = self.processor.search_new_uids(
+                    mail, db, source.mailbox, days_back, state_key=source.key
+                )
+
+            # Emails that already produced an application are never fetched again
+            known = {
+                row[0] for row in db.query(Application.email_id).filter(
+                    Application.email_id.in_([source.email_id(uid) for uid in email_ids])
+                )
+            }
+            pending = [uid for uid in email_ids if source.email_id(uid) not in known]
+
+            if pending:
+                message_cache.observe_uidvalidity(source.key, uidvalidity)
+            for chunk in chunked(pending, settings.imap_fetch_chunk_size):
+                # Mail the ledger already has an outcome for is not parsed again
+                raw_messages = self.processor.drop_processed(
+                    message_cache.get_many(source.key, chunk), message_ledger.ALL_OUTCOMES
+                )
+                missing = [uid for uid in chunk if uid not in raw_messages]
+                if missing:
+                    with source.sync_pool.session(source.mailbox) as mail:
+                        fetched = self.processor.download_messages(
+                            mail, missing, filter_candidates=True, skip_outcomes=message_ledger.ALL_OUTCOMES
+                        )
+                    message_cache.put_many(source.key, fetched)
+                    raw_messages.update(fetched)
+                with self._lock:
+                    self.found += len(raw_messages)
+                    self._unsettled.setdefault(source.key, set()).update(raw_messages)
+                for uid in chunk:
+                    if uid in raw_messages:
+                        self._raw_queue.put((source.key, uid, source.email_id(uid), raw_messages[uid]))
+
+            self._checkpoints[source.key] = (uidvalidity, email_ids)
+        except Exception as e:
+            print(f"Error fetching emails from {source.key}: {e}")
+            self._fetch_errors[source.key] = e
+        finally:
+            db.close()
+            with self._lock:
+                self._fetchers_left -= 1
+                last = self._fetchers_left == 0
+            if last:
+                for _ in range(self.parser_workers):
+                    self._raw_queue.put(_DONE)
+
+    def _settle(self, source_key: str, uid: bytes) -> None:
+        """The email needs no retry: its outcome is committed, or retrying would not change it"""
+        with self._lock:
+            self._unsettled.get(source_key, set()).discard(uid)
+
+    def _parser(self) -> None:
+        """Parse MIME, filter out non-job mail and try the rule-based ATS extractors"""
+        while True:
+            item = self._raw_queue.get()
+            if item is _DONE:
+                break
+            source_key, uid, email_id, email_body = item
+            try:
+                msg = mime_parser.parse_message(email_body)
+                email_content = self.processor.parse_email_content(msg)
+                work = {
+                    "source_key": source_key,
+                    "uid": uid,
+                    "email_id": email_id,
+                    "message_key": message_ledger.message_key(msg),
+                    "content_hash": message_ledger.content_hash(email_content),
+                }
+                if work["message_key"]:
+                    # The same email can arrive from several folders (e.g. INBOX and a label)
+                    with self._lock:
+                        claimed = work["message_key"] in self._claimed
+                        self._claimed.add(work["message_key"])
+                    if claimed:
+                        self._settle(source_key, uid)
+                        continue
+                if not self.processor.is_job_related(email_content, msg.get("From", "")):
+                    # Only the ledger entry is written for unrelated mail
+                    work["outcome"] = self.processor.unrelated_outcome(email_content, msg.get("From", ""))
+                    self._result_queue.put(work)
+                    continue
+
+                work.update({
+                    "msg": msg,
+                    "content": email_content,
+                    "email_date": self.processor.get_email_date(msg),
+                })
+
+                # Replies in the thread of a known application go straight to the writer
+                thread_application_id = thread_index.find_application_id(thread_index.references(msg))
+                if thread_application_id:
+                    work["thread_application_id"] = thread_application_id
+                    work["extractor"] = "thread"
+                    self._result_queue.put(work)
+                    continue
+
+                # Mail from known ATS senders needs no LLM call and skips straight to the writer
+                extracted_data = self.processor.extract_with_rules(email_content, msg)
+                if extracted_data:
+                    work["extracted"] = extracted_data
+                    work["extractor"] = extracted_data.get("source")
+                    self._result_queue.put(work)
+                else:
+                    self._llm_queue.put(work)
+            except Exception as e:
+                print(f"Error parsing email {email_id}: {e}")
+                self._settle(source_key, uid)
+
+        with self._lock:
+            self._parsers_left -= 1
+            last = self._parsers_left == 0
+        if last:
+            for _ in range(self.llm_workers):
+                self._llm_queue.put(_DONE)
+
+    def _llm_worker(self) -> None:
+        done = False
+        while not done:
+            work = self._llm_queue.get()
+            if work is _DONE:
+                break
+            # Emails already waiting are extracted together (see EmailProcessor.llm_batches)
+            batch = [work]
+            while len(batch) < settings.email_llm_batch_size:
+                try:
+                    work = self._llm_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if work is _DONE:
+                    done = True
+                    break
+                batch.append(work)
+
+            # Keyed by position: UIDs of different sources can be equal
+            for group in self.processor.llm_batches([(i, work["content"]) for i, work in enumerate(batch)]):
+                try:
+                    extracted = self.processor.extract_many_with_llm(group)
+                except Exception as e:
+                    # No ledger entry: the emails stay unsettled and the next sync reads them again
+                    print(f"Error extracting emails {', '.join(batch[i]['email_id'] for i, _ in group)}, "
+                          f"retrying them on the next sync: {e}")
+                    with self._lock:
+                        self.failed += len(group)
+                    continue
+                for i, _ in group:
+                    batch[i]["extracted"] = extracted.get(i)
+                    batch[i]["extractor"] = "llm"
+                    self._result_queue.put(batch[i])
+
+        with self._lock:
+            self._llm_left -= 1
+            last = self._llm_left == 0
+        if last:
+            self._result_queue.put(_DONE)
+
+    def _update_existing(self, work: Dict, extracted_data: Dict) -> bool:
+        """Apply a rejection or interview email to the application it is about, if one matches"""
+        application = self.processor.status_update_target(self.db, extracted_data, work["email_date"])
+        if application is None:
+            return False
+        self.processor.apply_followup(application, extracted_data, work["email_date"])
+        thread_index.link(self.db, work["message_key"], application.id)
+        return True
+
+    def _writer(self) -> List[Dict]:
+        """Insert extracted applications, committing every `commit_batch` rows"""
+        new_applications = self.created
+        batch: List[tuple] = []  # (application, Message-ID of the email that created it)
+        recorded: List[tuple] = []  # (source key, UID) of the ledger entries in this commit
+
+        def flush():
+            if not batch and not recorded:
+                return
+            try:
+                self.db.flush()
+                for application, message_key in batch:
+                    thread_index.link(self.db, message_key, application.id)
+                self.db.commit()
+            except Exception as e:
+                # Left unsettled, so the checkpoint stops before these emails
+                self.db.rollback()
+                print(f"Error saving applications: {e}")
+                batch.clear()
+                recorded.clear()
+                return
+            for source_key, uid in recorded:
+                self._settle(source_key, uid)
+            recorded.clear()
+            for application, _ in batch:
+                new_applications.append({
+                    "id": application.id,
+                    "company_name": application.company_name,
+                    "position": application.position,
+                    "status": application.status
+                })
+            batch.clear()
+
+        while True:
+            try:
+                work = self._result_queue.get(timeout=1)
+            except queue.Empty:
+                # Nothing arriving right now - don't hold finished rows back
+                flush()
+                continue
+            if work is _DONE:
+                break
+
+            if work.get("thread_application_id"):
+                application = self.db.get(Application, work["thread_application_id"])
+                if application is not None:
+                    work["extracted"] = self.processor.followup_data(work["content"], application)
+                    self.processor.apply_followup(application, work["extracted"], work["email_date"])
+                    thread_index.link(self.db, work["message_key"], application.id)
+
+            extracted_data = work.get("extracted")
+
+            if work.get("outcome") in message_ledger.UNRELATED_OUTCOMES:
+                outcome = work["outcome"]
+            elif work.get("thread_application_id"):
+                outcome = message_ledger.EXTRACTED if extracted_data else message_ledger.NO_DATA
+            elif not extracted_data or not extracted_data.get('company_name'):
+                outcome = message_ledger.NO_DATA
+            elif self._update_existing(work, extracted_data):
+                outcome = message_ledger.EXTRACTED
+            else:
+                outcome = message_ledger.EXTRACTED
+                try:
+                    sender = work["msg"].get("From")
+                    application = self.processor.build_application(work["email_id"], extracted_data,
+                                                                   work["email_date"], sender)
+                    self.db.add(application)
+                    if work.get("extractor") not in UNLEARNED_SOURCES:
+                        sender_company_cache.learn(self.db, sender, application.company_name)
+                    batch.append((application, work["message_key"]))
+                except Exception as e:
+                    # Keep draining the queue so upstream stages never block
+                    print(f"Error building application for email {work['email_id']}: {e}")
+                    self._settle(work["source_key"], work["uid"])
+                    continue
+
+            message_ledger.record(self.db, work["message_key"], work["email_id"], outcome,
+                                  work.get("extractor"), work["content_hash"])
+            recorded.append((work["source_key"], work["uid"]))
+            self.processed += 1
+            if len(batch) >= self.commit_batch or len(recorded) >= self.commit_batch * 5:
+                flush()
+
+        flush()
+        return new_applications
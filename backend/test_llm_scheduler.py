@@ -0,0 +1,75 @@
+"""
+Regression tests for llm_scheduler (run with `python -m unittest test_llm_scheduler` from backend/).
+"""
+import asyncio
+import unittest
+
+from llm_scheduler import LLMScheduler
+
+
+class _Client:
+    def __init__(self, release: asyncio.Event):
+        self.release = release
+
+    async def generate(self, **kwargs):
+        await self.release.wait()
+        return {"response": "ok"}
+
+
+class CancelAfterGrantTest(unittest.TestCase):
+    def test_slot_is_released_when_cancelled_after_grant(self):
+        async def scenario():
+            scheduler = LLMScheduler(1)
+            release = asyncio.Event()
+            client = _Client(release)
+            first = asyncio.create_task(scheduler.agenerate(client, model="m"))
+            await asyncio.sleep(0)
+            second = asyncio.create_task(scheduler.agenerate(client, model="m"))
+            await asyncio.sleep(0)
+            self.assertEqual(scheduler.stats()["models"]["m"]["queued"]["interactive"], 1)
+
+            # The first call finishes and hands its slot to the second; the second is
+            # cancelled after deliver() set the slot's result, before it gets to run
+            hand_over = scheduler._release
+
+            def release_then_cancel(model):
+                scheduler._release = hand_over
+                hand_over(model)
+                asyncio.get_running_loop().call_soon(second.cancel)
+
+            scheduler._release = release_then_cancel
+            release.set()
+            await first
+            with self.assertRaises(asyncio.CancelledError):
+                await second
+
+            self.assertEqual(scheduler.stats()["models"]["m"]["running"], 0)
+            # The slot is free again: the next call runs instead of waiting forever
+            self.assertEqual(await asyncio.wait_for(scheduler.agenerate(client, model="m"), 1),
+                             {"response": "ok"})
+
+        asyncio.run(scenario())
+
+    def test_slot_is_not_released_twice_when_cancelled_while_queued(self):
+        async def scenario():
+            scheduler = LLMScheduler(1)
+            release = asyncio.Event()
+            client = _Client(release)
+            first = asyncio.create_task(scheduler.agenerate(client, model="m"))
+            await asyncio.sleep(0)
+            second = asyncio.create_task(scheduler.agenerate(client, model="m"))
+            await asyncio.sleep(0)
+            second.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await second
+
+            self.assertEqual(scheduler.stats()["models"]["m"]["running"], 1)
+            release.set()
+            await first
+            self.assertEqual(scheduler.stats()["models"]["m"]["running"], 0)
+
+        asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+"""
+Index of the email threads behind each application (the thread_messages table).
+The Message-ID of the email that created an application, and of every follow-up
+linked to it, is stored with the application's id. A later email whose
+In-Reply-To or References headers name one of them belongs to the same
+application, which is then found with one indexed lookup - before any LLM call
+and without guessing from company names.
+"""
+import re
+from typing import Iterable, List, Optional
+
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import Application, ThreadMessage
+
+_MESSAGE_ID_RE = re.compile(r"<([^<>\s]+)>")
+
+
+def references(msg) -> List[str]:
+    """Normalised Message-IDs a message replies to, closest ancestor (In-Reply-To) first"""
+    found = []
+    for name in ("In-Reply-To", "References"):
+        value = str(msg.get(name) or "")
+        ids = _MESSAGE_ID_RE.findall(value) or value.split()
+        if name == "References":
+            # References lists the thread oldest first
+            ids = reversed(ids)
+        for message_id in ids:
+            message_id = message_id.strip("<>").strip().lower()
+            if message_id and message_id not in found:
+                found.append(message_id)
+    return found
+
+
+def find_application(db: Session, message_ids: Iterable[str]) -> Optional[Application]:
+    """The application linked to the nearest of `message_ids` that is known, if any"""
+    message_ids = [message_id for message_id in message_ids if message_id]
+    if not message_ids:
+        return None
+    rows = (
+        db.query(ThreadMessage.message_id, Application)
+        .join(Application, Application.id == ThreadMessage.application_id)
+        .filter(ThreadMessage.message_id.in_(message_ids))
+        .all()
+    )
+    if not rows:
+        return None
+    by_message = dict(rows)
+    return next(by_message[message_id] for message_id in message_ids if message_id in by_message)
+
+
+def find_application_id(message_ids: Iterable[str]) -> Optional[int]:
+    """find_application with its own session, safe to call from worker threads"""
+    db = SessionLocal()
+    try:
+        application = find_application(db, message_ids)
+        return application.id if application else None
+    finally:
+        db.close()
+
+
+def link(db: Session, message_id: Optional[str], application_id: Optional[int]) -> None:
+    """Record that an email belongs to an application's thread; the caller commits"""
+    if not message_id or not application_id:
+        return
+    db.merge(ThreadMessage(message_id=message_id, application_id=application_id))
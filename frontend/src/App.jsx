@@ -37,6 +37,7 @@ function App() {
   const [expandedEmailId, setExpandedEmailId] = useState(null)
   const [showEmailList, setShowEmailList] = useState(false)
   const [emails, setEmails] = useState([])
+  const [emailBodies, setEmailBodies] = useState({})
   const [loadingEmails, setLoadingEmails] = useState(false)
   const [processingEmail, setProcessingEmail] = useState(null)
   const [autoSyncing, setAutoSyncing] = useState(false)
@@ -191,8 +192,13 @@ function App() {
   const syncEmails = async () => {
     setSyncing(true)
     try {
-      const response = await axios.post(`${API_BASE}/sync-emails`)
-      alert(response.data.message)
+      // The sync runs as a background job; poll it until it finishes
+      let job = (await axios.post(`${API_BASE}/sync-emails`)).data
+      while (job.status === 'queued' || job.status === 'running') {
+        await new Promise(resolve => setTimeout(resolve, 1500))
+        job = (await axios.get(`${API_BASE}/sync-emails/${job.job_id}`)).data
+      }
+      alert(job.message)
       fetchApplications()
       fetchStats()
     } catch (error) {
@@ -236,17 +242,73 @@ function App() {
 
   const fetchEmails = async () => {
     setLoadingEmails(true)
+    setEmails([])
+    setEmailBodies({})
     try {
-      // Only fetch emails from today (days_back=0)
-      const response = await axios.get(`${API_BASE}/emails?days_back=0&limit=50`)
-      setEmails(response.data)
+      // Only fetch emails from today (days_back=0). Rows are streamed as NDJSON
+      // without bodies, so the list fills in while later emails are still loading
+      const response = await fetch(`${API_BASE}/emails?days_back=0&limit=50&stream=true`, {
+        headers: { 'Authorization': `Bearer ${authToken}` }
+      })
+
+      if (!response.ok) {
+        const data = await response.json().catch(() => ({}))
+        throw new Error(data.detail || response.statusText)
+      }
+
+      const reader = response.body.getReader()
+      const decoder = new TextDecoder()
+      const rows = []
+      let buffer = ''
+
+      while (true) {
+        const { value, done } = await reader.read()
+        if (done) break
+
+        buffer += decoder.decode(value, { stream: true })
+        const lines = buffer.split('\n')
+        buffer = lines.pop()
+
+        let added = false
+        for (const line of lines) {
+          if (!line.trim()) continue
+          const row = JSON.parse(line)
+          if (row.error) throw new Error(row.error)
+          rows.push(row)
+          added = true
+        }
+
+        if (added) {
+          rows.sort((a, b) => (b.date || '').localeCompare(a.date || ''))
+          setEmails([...rows])
+          setLoadingEmails(false)
+        }
+      }
     } catch (error) {
-      alert('Error fetching emails: ' + (error.response?.data?.detail || error.message))
+      alert('Error fetching emails: ' + error.message)
     } finally {
       setLoadingEmails(false)
     }
   }
 
+  const toggleEmailBody = async (emailId) => {
+    if (expandedEmailId === emailId) {
+      setExpandedEmailId(null)
+      return
+    }
+    setExpandedEmailId(emailId)
+    if (emailBodies[emailId] !== undefined) return
+
+    // Bodies are not part of the list; load this one on demand
+    try {
+      const response = await axios.get(`${API_BASE}/emails/${emailId}/body`)
+      setEmailBodies(prev => ({ ...prev, [emailId]: response.data.body }))
+    } catch (error) {
+      alert('Error loading email: ' + (error.response?.data?.detail || error.message))
+      setExpandedEmailId(null)
+    }
+  }
+
   const captureScreenshot = async () => {
     try {
       // Use browser's screenshot API if available (requires permission)
@@ -317,53 +379,66 @@ function App() {
     setAutoSyncProgress({ current: 0, total: emailCount, results: [] })
 
     try {
-      // Fetch recent emails (all emails, not just unread)
-      const emailsResponse = await axios.get(`${API_BASE}/emails?days_back=0&limit=${emailCount}`)
-      const recentEmails = emailsResponse.data
+      // One request processes all recent job emails server-side and streams
+      // back a line of NDJSON per email as soon as it is done
+      const response = await fetch(`${API_BASE}/process-emails`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          'Authorization': `Bearer ${authToken}`
+        },
+        body: JSON.stringify({ days_back: 0, limit: emailCount })
+      })
 
-      if (recentEmails.length === 0) {
-        alert('No emails found to process')
-        setAutoSyncing(false)
-        return
+      if (!response.ok) {
+        const data = await response.json().catch(() => ({}))
+        throw new Error(data.detail || response.statusText)
       }
 
-      // Process each email
+      const reader = response.body.getReader()
+      const decoder = new TextDecoder()
       const results = []
-      for (let i = 0; i < Math.min(recentEmails.length, emailCount); i++) {
-        const email = recentEmails[i]
-        setAutoSyncProgress({
-          current: i + 1,
-          total: Math.min(recentEmails.length, emailCount),
-          results: [...results]
-        })
-
-        try {
-          const response = await axios.post(`${API_BASE}/process-email/${email.id}`)
-          
-          let resultMessage = ''
-          if (response.data.application_updated) {
-            resultMessage = `✓ Updated: ${response.data.application.company_name} - ${response.data.application.position}`
-          } else if (response.data.application_created) {
-            resultMessage = `✓ Created: ${response.data.application.company_name} - ${response.data.application.position}`
-          } else {
-            resultMessage = `✓ Processed: ${email.subject.substring(0, 50)}...`
+      let total = 0
+      let buffer = ''
+
+      while (true) {
+        const { value, done } = await reader.read()
+        if (done) break
+
+        buffer += decoder.decode(value, { stream: true })
+        const lines = buffer.split('\n')
+        buffer = lines.pop()
+
+        for (const line of lines) {
+          if (!line.trim()) continue
+          const event = JSON.parse(line)
+
+          if (event.type === 'start') {
+            total = event.total
+          } else if (event.type === 'result') {
+            let resultMessage = ''
+            if (!event.success) {
+              resultMessage = `✗ Error: ${event.message}`
+            } else if (event.application_updated) {
+              resultMessage = `✓ Updated: ${event.application.company_name} - ${event.application.position}`
+            } else if (event.application_created) {
+              resultMessage = `✓ Created: ${event.application.company_name} - ${event.application.position}`
+            } else {
+              resultMessage = `✓ Processed: ${(event.subject || '').substring(0, 50)}...`
+            }
+            results.push({ success: event.success, message: resultMessage, email: event.subject || event.email_id })
           }
 
-          results.push({ success: true, message: resultMessage, email: email.subject })
-        } catch (error) {
-          results.push({
-            success: false,
-            message: `✗ Error: ${error.response?.data?.detail || error.message}`,
-            email: email.subject
-          })
+          setAutoSyncProgress({ current: results.length, total, results: [...results] })
         }
       }
 
-      setAutoSyncProgress({
-        current: Math.min(recentEmails.length, emailCount),
-        total: Math.min(recentEmails.length, emailCount),
-        results: results
-      })
+      if (total === 0) {
+        alert('No emails found to process')
+        setAutoSyncing(false)
+        setAutoSyncProgress({ current: 0, total: 0, results: [] })
+        return
+      }
 
       // Refresh data
       fetchApplications()
@@ -1294,20 +1369,22 @@ function App() {
 
                         <p style={{ margin: '8px 0', color: '#4b5563', fontSize: '0.875rem', whiteSpace: 'pre-wrap' }}>
                           {expandedEmailId === email.id ? (
-                            <div dangerouslySetInnerHTML={{ __html: email.body }} />
+                            emailBodies[email.id] === undefined ? (
+                              'Loading...'
+                            ) : (
+                              <div dangerouslySetInnerHTML={{ __html: emailBodies[email.id] }} />
+                            )
                           ) : (
                             email.preview
                           )}
                         </p>
 
-                        {email.body && email.body.length > (email.preview ? email.preview.length : 0) && (
+                        {email.has_more && (
                           <button
                             type="button"
                             className="btn btn-small"
                             style={{ marginTop: '4px' }}
-                            onClick={() =>
-                              setExpandedEmailId(expandedEmailId === email.id ? null : email.id)
-                            }
+                            onClick={() => toggleEmailBody(email.id)}
                           >
                             {expandedEmailId === email.id ? 'Hide full email' : 'Show full email'}
                           </button>